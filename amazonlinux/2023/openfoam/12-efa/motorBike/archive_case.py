@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+
+#### parallel zstd archival of finished cases from the shared mount
+# archive a case:  ./archive_case.py archive --case /app/shared/motorBike --archive /app/shared/archive/run1
+# list chunks:     ./archive_case.py list --archive /app/shared/archive/run1
+# restore one field of one time (all processors):
+#   ./archive_case.py restore --archive /app/shared/archive/run1 --dest /tmp/case --time 500 --field p
+#
+# A finished case is hundreds of thousands of small files, and cp -R or a
+# single tar off FSx is bound by metadata round trips. archive streams the case
+# through tar into zstd as many chunks in parallel. Each processorN/<time> and
+# each top level directory is its own chunk, split further at --chunk-size
+# bytes of input. index.json maps every file to its chunk. restore reads the
+# index and decompresses only the chunks that hold the selected files, so one
+# field of one time comes back without extracting the rest of the case. The
+# archive is built next to its final place and renamed in, so a reader never
+# sees a partial archive.
+
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import logging
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from clean_levels import is_time_dir
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("archive_case")
+
+# Written last into every archive directory
+INDEX = "index.json"
+
+# Default bytes of input per chunk
+CHUNK_SIZE = 512 * 2**20
+
+# CPU quota of the pod (cgroup v2: "<quota> <period>" or "max <period>")
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def available_cpus():
+    """
+    Return the CPUs this process may use: its affinity mask, capped by the cgroup CPU quota.
+
+    os.cpu_count() is the node's core count, which in a pod with a CPU limit
+    would start far more zstd threads than the quota lets run.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def group_of(rel):
+    """
+    Return the chunk group of a path relative to the case.
+
+    processorN/<dir> is one group per processor and directory, anything else
+    is grouped by its top level directory ("." for top level files).
+    """
+    parts = rel.split(os.sep)
+    if len(parts) == 1:
+        return "."
+    if parts[0].startswith("processor") and len(parts) > 2:
+        return f"{parts[0]}/{parts[1]}"
+    return parts[0]
+
+
+def scan(case_dir, paths=None):
+    """
+    List the files, symlinks and empty directories to archive.
+
+    Args:
+        case_dir: The case directory
+        paths: Paths relative to the case to archive (default: the whole case)
+
+    Returns:
+        ([(relative path, size)] of files and symlinks, [relative empty directories])
+    """
+    files = []
+    empty_dirs = []
+    for top in paths or ["."]:
+        top_path = os.path.join(case_dir, top)
+        if not os.path.isdir(top_path) or os.path.islink(top_path):
+            files.append((os.path.normpath(top), os.lstat(top_path).st_size))
+            continue
+        for root, dirs, names in os.walk(top_path):
+            rel_root = os.path.relpath(root, case_dir)
+            # os.walk lists symlinks to directories as directories but does not follow them
+            links = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+            if not dirs and not names and rel_root != ".":
+                empty_dirs.append(rel_root)
+            for name in sorted(names + links):
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                files.append((rel, os.lstat(os.path.join(case_dir, rel)).st_size))
+    return sorted(files), sorted(empty_dirs)
+
+
+def plan_chunks(files, chunk_size):
+    """
+    Split the files into chunks by group and size.
+
+    Returns:
+        A list of {"name", "group", "members": [[path, size]], "bytes"}
+    """
+    groups = {}
+    for rel, size in files:
+        groups.setdefault(group_of(rel), []).append([rel, size])
+    chunks = []
+    for group in sorted(groups):
+        current = []
+        current_bytes = 0
+        for member in groups[group]:
+            if current and current_bytes + member[1] > chunk_size:
+                chunks.append((group, current, current_bytes))
+                current, current_bytes = [], 0
+            current.append(member)
+            current_bytes += member[1]
+        chunks.append((group, current, current_bytes))
+    names = {}
+    planned = []
+    for group, members, size in chunks:
+        index = names[group] = names.get(group, -1) + 1
+        stem = "case" if group == "." else group.replace("/", "_")
+        planned.append({"name": f"{stem}.{index:03d}.tar.zst", "group": group, "members": members, "bytes": size})
+    return planned
+
+
+def write_chunk(case_dir, chunk_path, members, level, threads):
+    """
+    Stream files of the case through tar into one zstd file.
+
+    Returns:
+        Size of the compressed chunk in bytes
+    """
+    tar = subprocess.Popen(["tar", "-C", case_dir, "--null", "--no-recursion", "-T", "-", "-cf", "-"],
+                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    zstd = subprocess.Popen(["zstd", "-q", f"-{level}", f"-T{threads}", "-f", "-o", chunk_path],
+                            stdin=tar.stdout)
+    # zstd holds the read end now, so tar gets SIGPIPE if zstd dies
+    tar.stdout.close()
+    tar.stdin.write(b"\0".join(rel.encode() for rel, _ in members) + b"\0")
+    tar.stdin.close()
+    if tar.wait() != 0 or zstd.wait() != 0:
+        raise OSError(f"Could not write {os.path.basename(chunk_path)} (tar {tar.returncode}, zstd {zstd.returncode})")
+    return os.path.getsize(chunk_path)
+
+
+def create(case_dir, archive_dir, paths=None, workers=8, threads=None, level=3, chunk_size=CHUNK_SIZE):
+    """
+    Archive a case (or some of its paths) into parallel zstd chunks with an index.
+
+    Args:
+        case_dir: The case directory
+        archive_dir: The archive directory to create; must not exist
+        paths: Paths relative to the case to archive (default: the whole case)
+        workers: Number of chunks written at the same time
+        threads: zstd threads per chunk (default: available CPUs / workers)
+        level: zstd compression level
+        chunk_size: Bytes of input per chunk, before compression
+
+    Returns:
+        The index
+    """
+    if os.path.exists(archive_dir):
+        raise ValueError(f"{archive_dir} already exists")
+    threads = threads or max(1, available_cpus() // workers)
+    start = time.time()
+    files, empty_dirs = scan(case_dir, paths)
+    chunks = plan_chunks(files, chunk_size)
+    staging_dir = f"{archive_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    os.makedirs(staging_dir)
+
+    def build(chunk):
+        chunk_start = time.time()
+        chunk["compressed_bytes"] = write_chunk(case_dir, os.path.join(staging_dir, chunk["name"]),
+                                                chunk["members"], level, threads)
+        chunk["seconds"] = round(time.time() - chunk_start, 3)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(build, chunks))
+        index = {"case": os.path.abspath(case_dir), "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 "level": level, "chunk_size": chunk_size, "files": len(files), "empty_dirs": empty_dirs,
+                 "bytes": sum(c["bytes"] for c in chunks),
+                 "compressed_bytes": sum(c["compressed_bytes"] for c in chunks),
+                 "seconds": round(time.time() - start, 3), "chunks": chunks}
+        with open(os.path.join(staging_dir, INDEX), "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.rename(staging_dir, archive_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return index
+
+
+def load_index(archive_dir):
+    """Read the index of an archive."""
+    with open(os.path.join(archive_dir, INDEX)) as f:
+        return json.load(f)
+
+
+def matches(rel, times, fields, processors, patterns):
+    """
+    Return True if an archived path is selected.
+
+    Args:
+        rel: Path relative to the case
+        times: Time directory names, compared as numbers (empty: any)
+        fields: Field names, with or without .gz (empty: any)
+        processors: Processor numbers (empty: any, including the reconstructed case)
+        patterns: fnmatch patterns on the whole path (empty: any)
+    """
+    parts = rel.split(os.sep)
+    if parts[0].startswith("processor"):
+        if processors and parts[0] not in {f"processor{n}" for n in processors}:
+            return False
+        parts = parts[1:]
+    elif processors:
+        return False
+    if times or fields:
+        if len(parts) < 2 or not is_time_dir(parts[0]):
+            return False
+        if times and not any(float(parts[0]) == float(t) for t in times):
+            return False
+        if fields and (len(parts) != 2 or parts[1].replace(".gz", "") not in fields):
+            return False
+    return not patterns or any(fnmatch.fnmatch(rel, p) for p in patterns)
+
+
+def select(index, times=(), fields=(), processors=(), patterns=()):
+    """
+    Select archived files by time, field, processor and pattern.
+
+    Returns:
+        {chunk name: [relative paths]} of the chunks holding selected files
+    """
+    selected = {}
+    for chunk in index["chunks"]:
+        members = [rel for rel, _ in chunk["members"] if matches(rel, times, fields, processors, patterns)]
+        if members:
+            selected[chunk["name"]] = members
+    return selected
+
+
+def extract_chunk(chunk_path, dest_dir, members=None):
+    """Decompress one chunk into dest_dir, only the given members if any."""
+    command = ["tar", "-C", dest_dir, "-xf", "-"]
+    list_file = None
+    if members is not None:
+        # tar reads the archive from stdin, so the member list goes through a file
+        list_file = tempfile.NamedTemporaryFile(prefix="archive_case-", delete=False)
+        list_file.write(b"\0".join(rel.encode() for rel in members) + b"\0")
+        list_file.close()
+        command += ["--null", "-T", list_file.name]
+    try:
+        zstd = subprocess.Popen(["zstd", "-q", "-d", "-c", chunk_path], stdout=subprocess.PIPE)
+        tar = subprocess.Popen(command, stdin=zstd.stdout)
+        zstd.stdout.close()
+        if tar.wait() != 0 or zstd.wait() != 0:
+            raise OSError(f"Could not extract {os.path.basename(chunk_path)} "
+                          f"(zstd {zstd.returncode}, tar {tar.returncode})")
+    finally:
+        if list_file:
+            os.remove(list_file.name)
+
+
+def restore(archive_dir, dest_dir, selection=None, workers=8):
+    """
+    Restore an archive, or only the selected files, into dest_dir.
+
+    Args:
+        archive_dir: The archive directory
+        dest_dir: Where to restore to (created if needed)
+        selection: {chunk name: [relative paths]} from select(), or None for everything
+        workers: Number of chunks extracted at the same time
+
+    Returns:
+        Number of files restored
+    """
+    index = load_index(archive_dir)
+    os.makedirs(dest_dir, exist_ok=True)
+    if selection is None:
+        selection = {chunk["name"]: None for chunk in index["chunks"]}
+        for rel in index["empty_dirs"]:
+            os.makedirs(os.path.join(dest_dir, rel), exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda name: extract_chunk(os.path.join(archive_dir, name), dest_dir, selection[name]),
+                      selection))
+    if all(members is None for members in selection.values()):
+        return index["files"]
+    return sum(len(members) for members in selection.values())
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Parallel zstd archival of finished cases')
+    mountpoint = os.environ.get("MOUNTPOINT", "/app/shared")
+    default_archive = os.path.join(mountpoint, "archive",
+                                   os.environ.get("RUN_ID", os.environ.get("JOB_SET_ID", "adhoc")))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(subparser, workers=True):
+        subparser.add_argument('--archive', dest='archive_dir', default=os.environ.get("ARCHIVE_DIR", default_archive),
+                               help='Archive directory (default: $MOUNTPOINT/archive/$RUN_ID)')
+        if workers:
+            subparser.add_argument('--workers', type=int, default=int(os.environ.get("ARCHIVE_WORKERS", "8")),
+                                   help='Chunks processed at the same time (default: 8)')
+
+    archive_parser = subparsers.add_parser('archive', help='Archive a case into parallel zstd chunks')
+    add_common(archive_parser)
+    archive_parser.add_argument('--case', dest='case_dir', default=os.getcwd(),
+                                help='Case directory (default: current directory)')
+    archive_parser.add_argument('--threads', type=int, default=int(os.environ.get("ARCHIVE_THREADS", "0")),
+                                help='zstd threads per chunk (default: available CPUs / workers)')
+    archive_parser.add_argument('--level', type=int, default=int(os.environ.get("ARCHIVE_LEVEL", "3")),
+                                help='zstd compression level (default: 3)')
+    archive_parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                                default=int(os.environ.get("ARCHIVE_CHUNK_SIZE", str(CHUNK_SIZE))),
+                                help=f'Bytes of input per chunk (default: {CHUNK_SIZE})')
+    archive_parser.add_argument('--remove', action='store_true',
+                                default=os.environ.get("ARCHIVE_REMOVE", "false") == "true",
+                                help='Remove the case once it is archived')
+
+    for name, help_text in (('list', 'List the chunks, or the files matching a selection'),
+                            ('restore', 'Restore the whole case or the selected files')):
+        subparser = subparsers.add_parser(name, help=help_text)
+        add_common(subparser, workers=name == 'restore')
+        if name == 'restore':
+            subparser.add_argument('--dest', dest='dest_dir', required=True,
+                                   help='Directory to restore into')
+        subparser.add_argument('--time', dest='times', nargs='*', default=[],
+                               help='Time directories to select')
+        subparser.add_argument('--field', dest='fields', nargs='*', default=[],
+                               help='Fields to select (in the selected times)')
+        subparser.add_argument('--processor', dest='processors', nargs='*', type=int, default=[],
+                               help='Processor numbers to select')
+        subparser.add_argument('--pattern', dest='patterns', nargs='*', default=[],
+                               help='fnmatch patterns on the path relative to the case')
+    return parser.parse_args()
+
+
+def main():
+    """Archive, list or restore a case."""
+    args = parse_arguments()
+    try:
+        if args.command == 'archive':
+            index = create(args.case_dir, args.archive_dir, workers=args.workers, threads=args.threads or None,
+                           level=args.level, chunk_size=args.chunk_size)
+            ratio = index["bytes"] / max(1, index["compressed_bytes"])
+            logger.info(f"Archived {index['files']} files ({index['bytes'] / 2**20:.0f}Mi) into "
+                        f"{len(index['chunks'])} chunks ({index['compressed_bytes'] / 2**20:.0f}Mi, "
+                        f"ratio {ratio:.1f}) in {index['seconds']:.1f} s: {args.archive_dir}")
+            if args.remove:
+                shutil.rmtree(args.case_dir)
+                logger.info(f"Removed {args.case_dir}")
+            return 0
+        index = load_index(args.archive_dir)
+        filtered = args.times or args.fields or args.processors or args.patterns
+        selection = select(index, args.times, args.fields, args.processors, args.patterns) if filtered else None
+        if args.command == 'list':
+            if selection is None:
+                for chunk in index["chunks"]:
+                    print(f"{chunk['name']:<40} {len(chunk['members']):>8} files {chunk['bytes']:>14} B "
+                          f"-> {chunk['compressed_bytes']:>12} B")
+                print(f"{index['files']} files in {len(index['chunks'])} chunks, archived {index['created']} "
+                      f"from {index['case']}")
+            else:
+                for name in selection:
+                    for rel in selection[name]:
+                        print(f"{rel}  ({name})")
+            return 0
+        if selection == {}:
+            logger.error("No archived file matches the selection")
+            return 1
+        start = time.time()
+        count = restore(args.archive_dir, args.dest_dir, selection, args.workers)
+        chunks = len(selection) if selection is not None else len(index["chunks"])
+        logger.info(f"Restored {count} files from {chunks}/{len(index['chunks'])} chunks "
+                    f"in {time.time() - start:.1f} s: {args.dest_dir}")
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not {args.command} {args.archive_dir}: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
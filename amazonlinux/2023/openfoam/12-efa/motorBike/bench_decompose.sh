@@ -0,0 +1,38 @@
+#!/bin/bash
+
+# Compare serial decomposePar with parallel redistributePar -decompose
+# Usage: ./bench_decompose.sh [rank counts...] (default: 8 16 32)
+# Each run starts from a fresh blockMesh with the stage cache disabled
+RANKS=${@:-8 16 32}
+NAMESPACE=${NAMESPACE:-default}
+RESULTS=${RESULTS:-decompose_bench_$(date +%Y%m%d%H%M%S).txt}
+IMAGE_PREFIX=blik6126287/amazonlinux2023_openfoam12
+
+# Run a job and print its master pod log
+submit_and_log() {
+    LOG=$(mktemp)
+    ./submit2.py --disable-ssl --env STAGE_CACHE=false "$@" 2>&1 | tee "$LOG" >&2
+    MASTER_JOB_ID=$(grep -o "Master job ID: [a-z0-9]*" "$LOG" | awk '{print $4}')
+    rm -f "$LOG"
+    [ -n "$MASTER_JOB_ID" ] && kubectl -n "$NAMESPACE" logs "armada-${MASTER_JOB_ID}-0" 2>/dev/null
+}
+
+printf "%-10s %-6s %-14s\n" "method" "ranks" "decompose_ms" | tee "$RESULTS"
+for np in $RANKS; do
+    # Serial: prep up to and including decomposePar at np subdomains
+    submit_and_log --job-set-prefix decompose-serial-$np \
+        --env PREP_STEPS="stage blockMesh" --mpi-image "$IMAGE_PREFIX:motorBike_prep" > /dev/null
+    POD_LOG=$(submit_and_log --job-set-prefix decompose-serial-$np \
+        --env PREP_STEPS="decomposePar" --env DECOMPOSE_RANKS="$np" --mpi-image "$IMAGE_PREFIX:motorBike_prep")
+    SERIAL_MS=$(echo "$POD_LOG" | grep -o "Prep step decomposePar took [0-9]* ms" | awk '{print $5}')
+    printf "%-10s %-6s %-14s\n" "serial" "$np" "${SERIAL_MS:-n/a}" | tee -a "$RESULTS"
+
+    # Parallel: same mesh, decomposed by redistributePar on np ranks
+    submit_and_log --job-set-prefix decompose-parallel-$np \
+        --env PREP_STEPS="stage blockMesh" --mpi-image "$IMAGE_PREFIX:motorBike_prep" > /dev/null
+    POD_LOG=$(submit_and_log --job-set-prefix decompose-parallel-$np --mpi-processes "$np" \
+        --mpi-image "$IMAGE_PREFIX:motorBike_04_parallel_redistributePar")
+    PARALLEL_MS=$(echo "$POD_LOG" | grep -o "on [0-9]* processes took [0-9]* ms" | awk '{print $5}')
+    printf "%-10s %-6s %-14s\n" "parallel" "$np" "${PARALLEL_MS:-n/a}" | tee -a "$RESULTS"
+done
+echo "Results written to $RESULTS"
@@ -0,0 +1,40 @@
+#!/bin/bash
+
+# Compare solver write policies (io_policy.py) on the fused 07-09 solve stage
+# Usage: ./bench_io_policy.sh [policies...] (default: tutorial binary lean sparse final compressed)
+#   NP: world size (default: 8)
+# Each policy runs on a fresh case (prep and snappyHexMesh come from the stage cache);
+# the master pod reports the bytes written and the write time of foamRun
+POLICIES=${@:-tutorial binary lean sparse final compressed}
+NP=${NP:-8}
+NAMESPACE=${NAMESPACE:-default}
+RESULTS=${RESULTS:-io_policy_bench_$(date +%Y%m%d%H%M%S).txt}
+IMAGE_PREFIX=blik6126287/amazonlinux2023_openfoam12
+
+# Run a job and print its master pod log
+submit_and_log() {
+    LOG=$(mktemp)
+    ./submit2.py --disable-ssl "$@" 2>&1 | tee "$LOG" >&2
+    MASTER_JOB_ID=$(grep -o "Master job ID: [a-z0-9]*" "$LOG" | awk '{print $4}')
+    rm -f "$LOG"
+    [ -n "$MASTER_JOB_ID" ] && kubectl -n "$NAMESPACE" logs "armada-${MASTER_JOB_ID}-0" 2>/dev/null
+}
+
+printf "%-12s %-6s %-14s %-8s %-10s %-10s\n" "policy" "ranks" "bytes_written" "writes" "write_s" "clock_s" | tee "$RESULTS"
+for policy in $POLICIES; do
+    submit_and_log --job-set-prefix io-policy-$policy --env DECOMPOSE_RANKS="$NP" \
+        --mpi-image "$IMAGE_PREFIX:motorBike_prep" > /dev/null
+    submit_and_log --job-set-prefix io-policy-$policy --mpi-processes "$NP" \
+        --mpi-image "$IMAGE_PREFIX:motorBike_05_parallel_snappyHexMesh" > /dev/null
+    POD_LOG=$(submit_and_log --job-set-prefix io-policy-$policy --mpi-processes "$NP" --io-policy "$policy" \
+        --mpi-image "$IMAGE_PREFIX:motorBike_07_09_parallel_solve")
+    # I/O policy report (<policy>): B bytes in W writes, write time T s of ClockTime C s
+    REPORT=$(echo "$POD_LOG" | grep "I/O policy report" | tail -1)
+    BYTES=$(echo "$REPORT" | grep -o "[0-9]* bytes" | awk '{print $1}')
+    WRITES=$(echo "$REPORT" | grep -o "[0-9]* writes" | awk '{print $1}')
+    WRITE_S=$(echo "$REPORT" | grep -o "write time [0-9.]* s" | awk '{print $3}')
+    CLOCK_S=$(echo "$REPORT" | grep -o "ClockTime [0-9.]* s" | awk '{print $2}')
+    printf "%-12s %-6s %-14s %-8s %-10s %-10s\n" "$policy" "$NP" \
+        "${BYTES:-n/a}" "${WRITES:-n/a}" "${WRITE_S:-n/a}" "${CLOCK_S:-n/a}" | tee -a "$RESULTS"
+done
+echo "Results written to $RESULTS"
@@ -0,0 +1,30 @@
+#!/bin/bash
+
+# Compare MPI startup time between fqdn and ip host modes
+# Usage: ./bench_startup.sh [rank counts...] (default: 32 128)
+# The 32 and 128 rank fqdn/ip results are not in the README yet; add the
+# $RESULTS table there once it has been run on a cluster of that size
+RANKS=${@:-32 128}
+IMAGE=${IMAGE:-blik6126287/amazonlinux2023_openfoam12:motorBike_00_startup_bench}
+NAMESPACE=${NAMESPACE:-default}
+RESULTS=${RESULTS:-startup_bench_$(date +%Y%m%d%H%M%S).txt}
+
+printf "%-6s %-6s %-14s %-14s\n" "mode" "ranks" "bootstrap_ms" "mpiexec_ms" | tee "$RESULTS"
+for np in $RANKS; do
+    for mode in fqdn ip; do
+        LOG=$(mktemp)
+        ./submit2.py --disable-ssl --mpi-processes "$np" --host-mode "$mode" \
+            --job-set-prefix "startup-$mode-$np" --mpi-image "$IMAGE" 2>&1 | tee "$LOG"
+        MASTER_JOB_ID=$(grep -o "Master job ID: [a-z0-9]*" "$LOG" | awk '{print $4}')
+        rm -f "$LOG"
+        if [ -z "$MASTER_JOB_ID" ]; then
+            echo "Submission failed for mode=$mode ranks=$np"
+            continue
+        fi
+        POD_LOG=$(kubectl -n "$NAMESPACE" logs "armada-${MASTER_JOB_ID}-0" 2>/dev/null)
+        BOOTSTRAP_MS=$(echo "$POD_LOG" | grep -o "Bootstrap completed in [0-9]* ms" | awk '{print $4}')
+        MPIEXEC_MS=$(echo "$POD_LOG" | grep -o "MPI application took [0-9]* ms" | awk '{print $4}')
+        printf "%-6s %-6s %-14s %-14s\n" "$mode" "$np" "${BOOTSTRAP_MS:-n/a}" "${MPIEXEC_MS:-n/a}" | tee -a "$RESULTS"
+    done
+done
+echo "Results written to $RESULTS"
@@ -12,8 +12,17 @@ for dockerfile in Dockerfile.*; do
         # Tag the image for Docker Hub
         sudo docker tag amazonlinux2023_openfoam12:$tag blik6126287/amazonlinux2023_openfoam12:$tag
         # Push to Docker Hub
-        sudo docker push blik6126287/amazonlinux2023_openfoam12:$tag
+        push_output=$(sudo docker push blik6126287/amazonlinux2023_openfoam12:$tag)
+        echo "$push_output"
         echo "Successfully pushed blik6126287/amazonlinux2023_openfoam12:$tag"
+        # Record the digest of this push ("<tag>: digest: sha256:... size: N"), replacing the
+        # tag's previous entry; submit2.py passes it to the pods as the stage cache image key
+        digest=$(echo "$push_output" | grep -o 'digest: sha256:[0-9a-f]*' | tail -1 | awk '{print $2}')
+        if [ -n "$digest" ]; then
+            { grep -v "^blik6126287/amazonlinux2023_openfoam12:$tag " image_digests.txt 2>/dev/null
+              echo "blik6126287/amazonlinux2023_openfoam12:$tag blik6126287/amazonlinux2023_openfoam12@$digest"
+            } > image_digests.txt.tmp && mv image_digests.txt.tmp image_digests.txt
+        fi
     else
         echo "Failed to build amazonlinux2023_openfoam12:$tag"
     fi
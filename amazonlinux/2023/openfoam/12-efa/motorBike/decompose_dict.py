@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+#### generate system/decomposeParDict from the requested world size
+# ./decompose_dict.py --ranks 32 --ranks-per-node 16
+# ./decompose_dict.py --ranks 32 --dry-run
+#
+# Every hierarchical split (a b c) with a*b*c = ranks is scored by the number of
+# interprocessor faces it cuts in the blockMesh background mesh, and the best one
+# is compared with an estimate for scotch. The method with fewer faces is written
+# out, and the predicted communication volume (total and inter-node, given how
+# many consecutive ranks share a node) is logged.
+
+import os
+import re
+import sys
+import logging
+import argparse
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("decompose_dict")
+
+# Scotch partitions are not perfect boxes; its face count is estimated against
+# ideal cubic subdomains with this irregularity factor
+SCOTCH_IRREGULARITY = 1.15
+
+# Bytes exchanged per interprocessor face for one scalar field (double precision)
+BYTES_PER_FACE = 8
+
+DICT_HEADER = """/*--------------------------------*- C++ -*----------------------------------*\\
+  =========                 |
+  \\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox
+   \\\\    /   O peration     | Website:  https://openfoam.org
+    \\\\  /    A nd           | Version:  12
+     \\\\/     M anipulation  |
+\\*---------------------------------------------------------------------------*/
+FoamFile
+{
+    format      ascii;
+    class       dictionary;
+    object      decomposeParDict;
+}
+// * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * //
+// Generated by decompose_dict.py
+"""
+
+
+def read_block_cells(block_mesh_dict):
+    """
+    Read the background mesh cell counts from a blockMeshDict.
+
+    Args:
+        block_mesh_dict: Path of system/blockMeshDict
+
+    Returns:
+        (nx, ny, nz) cells per direction; for several blocks, the first block's
+        aspect ratio scaled to the total cell count
+    """
+    with open(block_mesh_dict) as f:
+        text = f.read()
+    blocks = [tuple(int(n) for n in m.groups())
+              for m in re.finditer(r"hex\s*\([\d\s]+\)\s*(?:\w+\s*)?\(\s*(\d+)\s+(\d+)\s+(\d+)\s*\)", text)]
+    if not blocks:
+        raise ValueError(f"No hex blocks found in {block_mesh_dict}")
+    if len(blocks) == 1:
+        return blocks[0]
+    total = sum(nx * ny * nz for nx, ny, nz in blocks)
+    nx, ny, nz = blocks[0]
+    scale = (total / (nx * ny * nz)) ** (1 / 3)
+    return (max(1, round(nx * scale)), max(1, round(ny * scale)), max(1, round(nz * scale)))
+
+
+def splits(ranks):
+    """Yield every (a, b, c) with a * b * c == ranks."""
+    for a in range(1, ranks + 1):
+        if ranks % a:
+            continue
+        for b in range(1, ranks // a + 1):
+            if (ranks // a) % b:
+                continue
+            yield (a, b, ranks // a // b)
+
+
+def hierarchical_faces(cells, split, ranks_per_node):
+    """
+    Count interprocessor faces for a hierarchical split of a structured mesh.
+
+    Subdomains are numbered x fastest, then y, then z (order xyz), and each
+    node holds ranks_per_node consecutive ranks, as in the hostfile.
+
+    Args:
+        cells: (nx, ny, nz) cells per direction
+        split: (a, b, c) subdomains per direction
+        ranks_per_node: Ranks packed on each node
+
+    Returns:
+        (total faces, inter-node faces)
+    """
+    nx, ny, nz = cells
+    a, b, c = split
+    if a > nx or b > ny or c > nz:
+        return None
+
+    def rank(i, j, k):
+        return i + a * (j + b * k)
+
+    total = 0
+    inter_node = 0
+    # Each cut plane between neighbouring subdomains is shared face by face
+    for axis, (count, face_area) in enumerate([(a, ny * nz / (b * c)), (b, nx * nz / (a * c)), (c, nx * ny / (a * b))]):
+        for i in range(a):
+            for j in range(b):
+                for k in range(c):
+                    index = [i, j, k]
+                    if index[axis] + 1 >= count:
+                        continue
+                    neighbour = list(index)
+                    neighbour[axis] += 1
+                    total += face_area
+                    if rank(*index) // ranks_per_node != rank(*neighbour) // ranks_per_node:
+                        inter_node += face_area
+    return int(total), int(inter_node)
+
+
+def scotch_faces(cells, ranks, ranks_per_node):
+    """
+    Estimate interprocessor faces for a scotch decomposition.
+
+    Args:
+        cells: (nx, ny, nz) cells per direction
+        ranks: Number of subdomains
+        ranks_per_node: Ranks packed on each node
+
+    Returns:
+        (total faces, inter-node faces)
+    """
+    nx, ny, nz = cells
+    if ranks == 1:
+        return 0, 0
+    # Ideal cubic subdomains, minus the faces that lie on the domain boundary
+    surface = ranks * 6 * (nx * ny * nz / ranks) ** (2 / 3)
+    boundary = 2 * (nx * ny + ny * nz + nx * nz)
+    total = max(0.0, (surface - boundary) / 2) * SCOTCH_IRREGULARITY
+    # Scotch does not follow rank order, so neighbours are on another node in proportion
+    nodes = max(1, -(-ranks // ranks_per_node))
+    inter_node = total * (ranks - min(ranks, ranks_per_node)) / (ranks - 1) if nodes > 1 else 0
+    return int(total), int(inter_node)
+
+
+def choose(cells, ranks, ranks_per_node):
+    """
+    Pick the decomposition with the fewest interprocessor faces.
+
+    Args:
+        cells: (nx, ny, nz) cells per direction
+        ranks: Number of subdomains
+        ranks_per_node: Ranks packed on each node
+
+    Returns:
+        (method, split or None, total faces, inter-node faces)
+    """
+    best = None
+    for split in splits(ranks):
+        faces = hierarchical_faces(cells, split, ranks_per_node)
+        if faces is None:
+            continue
+        # Fewest faces first, then least inter-node traffic
+        if best is None or (faces[0], faces[1]) < (best[2], best[3]):
+            best = ("hierarchical", split, faces[0], faces[1])
+    scotch = scotch_faces(cells, ranks, ranks_per_node)
+    if best is None or scotch[0] < best[2]:
+        if best is not None:
+            logger.info(f"Best hierarchical split {best[1]} cuts {best[2]} faces, scotch estimate {scotch[0]}")
+        return ("scotch", None, scotch[0], scotch[1])
+    logger.info(f"Hierarchical split {best[1]} cuts {best[2]} faces, scotch estimate {scotch[0]}")
+    return best
+
+
+def render(ranks, method, split):
+    """Render decomposeParDict contents."""
+    text = DICT_HEADER + f"\nnumberOfSubdomains {ranks};\n\nmethod          {method};\n"
+    if method == "hierarchical":
+        text += ("\nhierarchicalCoeffs\n{\n"
+                 f"    n               ({split[0]} {split[1]} {split[2]});\n"
+                 "    order           xyz;\n}\n")
+    text += "\n// ************************************************************************* //\n"
+    return text
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Generate decomposeParDict from the requested world size')
+    parser.add_argument('--ranks', type=int, default=int(os.environ.get("DECOMPOSE_RANKS", "0") or 0),
+                        help='Number of subdomains (default: $DECOMPOSE_RANKS)')
+    parser.add_argument('--ranks-per-node', dest='ranks_per_node', type=int,
+                        default=int(os.environ.get("DECOMPOSE_RANKS_PER_NODE", "0") or 0),
+                        help='Consecutive ranks sharing a node (default: $DECOMPOSE_RANKS_PER_NODE, or all)')
+    parser.add_argument('--case-dir', dest='case_dir', default=os.getcwd(),
+                        help='Case directory (default: current directory)')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Only log the chosen decomposition')
+    return parser.parse_args()
+
+
+def main():
+    """Choose a decomposition for the requested world size and write it."""
+    args = parse_arguments()
+    if args.ranks < 1:
+        logger.error("No rank count given (--ranks or DECOMPOSE_RANKS)")
+        return 1
+    ranks_per_node = args.ranks_per_node if args.ranks_per_node > 0 else args.ranks
+    try:
+        cells = read_block_cells(os.path.join(args.case_dir, "system", "blockMeshDict"))
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read the background mesh: {e}")
+        return 1
+    method, split, faces, inter_node = choose(cells, args.ranks, ranks_per_node)
+    described = f"{method} {split[0]}x{split[1]}x{split[2]}" if split else method
+    logger.info(f"Decomposing {cells[0]}x{cells[1]}x{cells[2]} background cells into {args.ranks} subdomains "
+                f"({ranks_per_node} per node): {described}")
+    logger.info(f"Predicted communication: {faces} interprocessor faces, {inter_node} inter-node, "
+                f"~{faces * BYTES_PER_FACE / 1024:.1f} KiB per scalar field exchange "
+                f"({inter_node * BYTES_PER_FACE / 1024:.1f} KiB inter-node)")
+    if args.dry_run:
+        return 0
+    path = os.path.join(args.case_dir, "system", "decomposeParDict")
+    with open(path, "w") as f:
+        f.write(render(args.ranks, method, split))
+    logger.info(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
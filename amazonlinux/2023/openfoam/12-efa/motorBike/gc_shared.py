@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+#### garbage collection of per-job coordination directories on the shared mount
+# rank 0 after job end: ./gc_shared.py job --job-set-id mpi-jobset-1234abcd
+# standalone sweeper:   ./gc_shared.py sweep --retention-hours 24
+#
+# Every job set creates hostfiles/<id>, ssh/<id> and status/<id> under the mount.
+# The job cleanup drops hostfiles and ssh (including the private key) right away
+# and leaves status for post-mortems; the sweeper removes whatever is past its
+# retention window, in bulk and in parallel.
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("gc_shared")
+
+# Per-job coordination directories under the mount
+COORDINATION_DIRS = ["hostfiles", "ssh", "status"]
+
+# Status markers written by setup_mpi.sh when a job set ends
+TERMINAL_MARKERS = ["job_complete", "master_failed"]
+
+
+def remove_tree(path):
+    """
+    Remove a directory tree, tolerating concurrent removal.
+
+    Args:
+        path: The directory to remove
+
+    Returns:
+        True if the directory was removed, False otherwise
+    """
+    try:
+        shutil.rmtree(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Failed to remove {path}: {e}")
+        return False
+
+
+def remove_trees(paths, workers, dry_run=False):
+    """
+    Remove many directory trees in parallel.
+
+    Args:
+        paths: Directories to remove
+        workers: Number of parallel deletions
+        dry_run: Only log what would be removed
+
+    Returns:
+        The number of directories removed
+    """
+    if dry_run:
+        for path in paths:
+            logger.info(f"Would remove {path}")
+        return 0
+    if not paths:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(remove_tree, paths))
+
+
+def cleanup_job(mountpoint, job_set_id, keep_status, workers):
+    """
+    Remove the coordination directories of a finished job set.
+
+    Args:
+        mountpoint: The shared mount path
+        job_set_id: The job set to clean up
+        keep_status: Leave status/<id> for the sweeper
+        workers: Number of parallel deletions
+
+    Returns:
+        The number of directories removed
+    """
+    dirs = [d for d in COORDINATION_DIRS if not (keep_status and d == "status")]
+    paths = [os.path.join(mountpoint, d, job_set_id) for d in dirs]
+    removed = remove_trees(paths, workers)
+    logger.info(f"Removed {removed} coordination directories for job set {job_set_id}")
+    return removed
+
+
+def is_terminal(mountpoint, job_set_id, terminal_job_sets):
+    """
+    Check whether a job set has ended.
+
+    Args:
+        mountpoint: The shared mount path
+        job_set_id: The job set to check
+        terminal_job_sets: Job sets the submitter saw reach a terminal state
+
+    Returns:
+        True if the submitter or the master recorded an end state
+    """
+    if job_set_id in terminal_job_sets:
+        return True
+    status_dir = os.path.join(mountpoint, "status", job_set_id)
+    return any(os.path.exists(os.path.join(status_dir, m)) for m in TERMINAL_MARKERS)
+
+
+def sweep(mountpoint, retention_hours, orphan_retention_hours, terminal_job_sets, workers, dry_run):
+    """
+    Remove coordination directories that are past their retention window.
+
+    Job sets that ended are kept for retention_hours; job sets with no recorded
+    end state (e.g. pods that were killed) are kept for orphan_retention_hours.
+
+    Args:
+        mountpoint: The shared mount path
+        retention_hours: Retention for job sets that reached a terminal state
+        orphan_retention_hours: Retention for job sets with no terminal state
+        terminal_job_sets: Job sets the submitter saw reach a terminal state
+        workers: Number of parallel deletions
+        dry_run: Only log what would be removed
+
+    Returns:
+        The number of directories removed
+    """
+    now = time.time()
+    targets = []
+    job_sets = set()
+    terminal = {}
+    for parent in COORDINATION_DIRS:
+        parent_path = os.path.join(mountpoint, parent)
+        if not os.path.isdir(parent_path):
+            continue
+        # One directory listing per parent; no recursive walk
+        with os.scandir(parent_path) as entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                age_hours = (now - entry.stat(follow_symlinks=False).st_mtime) / 3600
+                if entry.name not in terminal:
+                    terminal[entry.name] = is_terminal(mountpoint, entry.name, terminal_job_sets)
+                if terminal[entry.name]:
+                    expired = age_hours > retention_hours
+                else:
+                    expired = age_hours > orphan_retention_hours
+                if expired:
+                    targets.append(entry.path)
+                    job_sets.add(entry.name)
+    logger.info(f"Found {len(targets)} expired directories from {len(job_sets)} job sets")
+    removed = remove_trees(targets, workers, dry_run)
+    if not dry_run:
+        logger.info(f"Removed {removed} directories")
+    return removed
+
+
+def parse_terminal_job_sets(value):
+    """Split a comma or whitespace separated list of job set IDs."""
+    return set(value.replace(",", " ").split())
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Clean up per-job coordination directories on the shared mount')
+    parser.add_argument('--mountpoint', default=os.environ.get("MOUNTPOINT", "/app/shared"),
+                        help='Shared mount path (default: /app/shared)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("GC_WORKERS", "16")),
+                        help='Number of parallel deletions (default: 16)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    job_parser = subparsers.add_parser('job', help='Clean up one finished job set')
+    job_parser.add_argument('--job-set-id', dest='job_set_id', default=os.environ.get("JOB_SET_ID"),
+                            help='Job set to clean up (default: $JOB_SET_ID)')
+    job_parser.add_argument('--keep-status', dest='keep_status', action='store_true',
+                            help='Leave status/<id> for the sweeper')
+    sweep_parser = subparsers.add_parser('sweep', help='Remove expired job set directories')
+    sweep_parser.add_argument('--retention-hours', dest='retention_hours', type=float,
+                              default=float(os.environ.get("GC_RETENTION_HOURS", "24")),
+                              help='Retention for finished job sets (default: 24)')
+    sweep_parser.add_argument('--orphan-retention-hours', dest='orphan_retention_hours', type=float,
+                              default=float(os.environ.get("GC_ORPHAN_RETENTION_HOURS", "168")),
+                              help='Retention for job sets with no recorded end state (default: 168)')
+    sweep_parser.add_argument('--terminal-job-sets', dest='terminal_job_sets',
+                              default=os.environ.get("GC_TERMINAL_JOB_SETS", ""),
+                              help='Comma separated job sets the submitter saw finish')
+    sweep_parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                              help='Only log what would be removed')
+    return parser.parse_args()
+
+
+def main():
+    """Run a job cleanup or a sweep."""
+    args = parse_arguments()
+    if args.command == 'job':
+        if not args.job_set_id:
+            logger.error("No job set ID given and JOB_SET_ID is not set")
+            return 1
+        cleanup_job(args.mountpoint, args.job_set_id, args.keep_status, args.workers)
+        return 0
+    sweep(args.mountpoint, args.retention_hours, args.orphan_retention_hours,
+          parse_terminal_job_sets(args.terminal_job_sets), args.workers, args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
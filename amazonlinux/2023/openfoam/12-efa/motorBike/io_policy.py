@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+#### write-interval and purge policies for the solver stage
+# before foamRun (runParallel does this when FOAM_IO_POLICY is set):
+#   ./io_policy.py apply --policy lean --case .
+# after foamRun:
+#   ./io_policy.py report --case . --log log.foamRun
+# ./io_policy.py list
+#
+# A policy sets the controlDict write settings of the run: writeInterval,
+# purgeWrite, writeFormat and writeCompression. It also chooses which function
+# objects stay in the functions block, and which fields they sample. The
+# function objects and their included files are always rebuilt from the
+# tutorial originals, kept as *.orig, so switching policies is repeatable.
+# Other controlDict entries, such as startFrom after a restart, are left as
+# they are. A policy is a preset name or a JSON file with the same keys.
+#
+# report estimates what the run wrote and how long the writes took. The bytes
+# per write come from the surviving time directories; purgeWrite removes the
+# older ones. The write time is the wall time of each write step over the
+# median step time, from the ClockTime lines of the log.
+
+import os
+import re
+import sys
+import json
+import fnmatch
+import logging
+import argparse
+import statistics
+
+from clean_levels import is_time_dir, processor_dirs
+from foam_log import read_records
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("io_policy")
+
+# Preset policies. "functions" lists the function objects kept (fnmatch
+# patterns, default all) and "fields" the fields sampled per function object.
+# converge.py's forces criterion needs the forceCoeffs output.
+POLICIES = {
+    # The tutorial controlDict as shipped
+    "tutorial": {},
+    # Binary fields, otherwise as shipped
+    "binary": {"writeFormat": "binary", "writeCompression": "off"},
+    # Binary fields and only the force coefficients from the function objects
+    "lean": {"writeFormat": "binary", "writeCompression": "off", "functions": ["forceCoeffs*"]},
+    # Two writes a run, and only the two newest times kept (a restart always has a complete one)
+    "sparse": {"writeInterval": 250, "purgeWrite": 2, "writeFormat": "binary", "writeCompression": "off",
+               "functions": ["forceCoeffs*"]},
+    # Only the final time
+    "final": {"writeInterval": "end", "purgeWrite": 1, "writeFormat": "binary", "writeCompression": "off",
+              "functions": ["forceCoeffs*"]},
+    # Compressed ASCII: fewer bytes on the shared mount for more CPU per write
+    "compressed": {"writeFormat": "ascii", "writeCompression": "on"},
+}
+
+# controlDict entries a policy may set
+CONTROL_ENTRIES = ["writeInterval", "purgeWrite", "writeFormat", "writePrecision", "writeCompression"]
+
+# Written into the case with the applied policy
+POLICY_RECORD = "system/ioPolicy.json"
+# Written into the case by report
+IO_REPORT = "io_report.json"
+
+FUNCTIONS_RE = re.compile(r"^functions\s*\{", re.MULTILINE)
+DICT_FIELDS_RE = re.compile(r"(\bfields\s*)\([^)]*\)(\s*;)")
+FUNC_FIELDS_RE = re.compile(r"(\bfields\s*=\s*)\([^)]*\)")
+FUNC_NAME_RE = re.compile(r"\bname\s*=\s*(\w+)")
+# Whitespace and comments between function object entries
+SKIP_RE = re.compile(r"\s*(?://[^\n]*\n\s*|/\*.*?\*/\s*)*", re.DOTALL)
+
+
+def original(path):
+    """Return the tutorial contents of a dictionary, saving them on first use."""
+    if not os.path.exists(f"{path}.orig"):
+        with open(path) as f:
+            text = f.read()
+        with open(f"{path}.orig", "w") as f:
+            f.write(text)
+    with open(f"{path}.orig") as f:
+        return f.read()
+
+
+def load_policy(name):
+    """Return a preset policy, or one read from a JSON file."""
+    if name in POLICIES:
+        return POLICIES[name]
+    if os.path.exists(name):
+        with open(name) as f:
+            return json.load(f)
+    raise ValueError(f"Unknown I/O policy {name} (presets: {', '.join(POLICIES)})")
+
+
+def matching(text, start, open_char, close_char):
+    """Return the index just past the bracket that closes the one at start."""
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == open_char:
+            depth += 1
+        elif text[index] == close_char:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    raise ValueError(f"Unbalanced {open_char}{close_char} in controlDict")
+
+
+def function_entries(body):
+    """
+    Split the body of the functions block into its entries.
+
+    Returns:
+        A list of (name, kind, text) with kind "include", "includeFunc" or "dict",
+        and text including the leading whitespace and comments
+    """
+    entries = []
+    position = 0
+    while True:
+        match = SKIP_RE.match(body, position)
+        start, position = position, match.end()
+        if position >= len(body):
+            break
+        rest = body[position:]
+        include = re.match(r'#include\s+"([^"]+)"', rest)
+        func = re.match(r"#includeFunc\s+(\w+)", rest)
+        block = re.match(r"(\w+)\s*\{", rest)
+        if include:
+            end = position + include.end()
+            entries.append((os.path.basename(include.group(1)), "include", body[start:end]))
+        elif func:
+            end = position + func.end()
+            args = re.match(r"\s*\(", body[end:])
+            if args:
+                end = matching(body, end + args.end() - 1, "(", ")")
+            text = body[start:end]
+            name = FUNC_NAME_RE.search(text[text.index(func.group(1)):])
+            entries.append((name.group(1) if name else func.group(1), "includeFunc", text))
+        elif block:
+            end = matching(body, position + block.end() - 1, "{", "}")
+            entries.append((block.group(1), "dict", body[start:end]))
+        else:
+            # Anything else (other directives, stray entries) is kept as one line
+            end = body.find("\n", position)
+            end = len(body) if end < 0 else end
+            entries.append((body[position:end].split()[0], "other", body[start:end]))
+        position = end
+    return entries
+
+
+def with_fields(kind, text, fields):
+    """Replace the fields sampled by one function object entry."""
+    if kind == "includeFunc":
+        return FUNC_FIELDS_RE.sub(lambda m: f"{m.group(1)}({' '.join(fields)})", text)
+    return DICT_FIELDS_RE.sub(lambda m: f"{m.group(1)}({' '.join(fields)}){m.group(2)}", text)
+
+
+def set_entry(text, entry, value):
+    """Set a top-level controlDict entry, adding it before functions if missing."""
+    pattern = re.compile(rf"^({entry}\s+)[^;\n]+(;)", re.MULTILINE)
+    if pattern.search(text):
+        return pattern.sub(rf"\g<1>{value}\g<2>", text, count=1)
+    match = FUNCTIONS_RE.search(text)
+    line = f"{entry:<16}{value};\n\n"
+    return text[:match.start()] + line + text[match.start():] if match else text + "\n" + line
+
+
+def read_control(text, entry):
+    """Read a top-level controlDict entry, or None."""
+    match = re.search(rf"^{entry}\s+([^;\s]+)\s*;", text, re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def apply(case_dir, name):
+    """
+    Apply an I/O policy to the case.
+
+    Returns:
+        The policy record written to system/ioPolicy.json
+    """
+    policy = load_policy(name)
+    control_path = os.path.join(case_dir, "system", "controlDict")
+    tutorial = original(control_path)
+    with open(control_path) as f:
+        text = f.read()
+
+    # The functions block always comes from the tutorial
+    kept, removed = [], []
+    match = FUNCTIONS_RE.search(tutorial)
+    if match:
+        end = matching(tutorial, match.end() - 1, "{", "}")
+        entries = function_entries(tutorial[match.end():end - 1])
+        body = ""
+        for entry_name, kind, entry_text in entries:
+            if "functions" in policy and kind != "other" \
+                    and not any(fnmatch.fnmatch(entry_name, p) for p in policy["functions"]):
+                removed.append(entry_name)
+                continue
+            fields = policy.get("fields", {}).get(entry_name)
+            if fields and kind == "include":
+                included = os.path.join(case_dir, "system", entry_text.split('"')[1])
+                with open(included, "w") as f:
+                    f.write(with_fields("dict", original(included), fields))
+            elif fields:
+                entry_text = with_fields(kind, entry_text, fields)
+            elif kind == "include":
+                # Back to the tutorial fields when a previous policy changed them
+                included = os.path.join(case_dir, "system", entry_text.split('"')[1])
+                if os.path.exists(f"{included}.orig"):
+                    with open(included, "w") as f:
+                        f.write(original(included))
+            kept.append(entry_name)
+            body += entry_text
+        block = "functions\n{" + body + "\n}"
+        current = FUNCTIONS_RE.search(text)
+        if current:
+            text = text[:current.start()] + block + text[matching(text, current.end() - 1, "{", "}"):]
+        else:
+            text = text.rstrip("\n") + "\n\n" + block + "\n"
+
+    settings = {}
+    for entry in CONTROL_ENTRIES:
+        value = policy.get(entry, read_control(tutorial, entry))
+        if value is None:
+            continue
+        if entry == "writeInterval" and value == "end":
+            # One write at endTime, in the unit of writeControl
+            end_time = float(read_control(text, "endTime"))
+            value = end_time / float(read_control(text, "deltaT")) if read_control(text, "writeControl") == "timeStep" \
+                else end_time
+            value = f"{value:g}"
+        settings[entry] = str(value)
+        text = set_entry(text, entry, value)
+
+    staging = f"{control_path}.io_policy-{os.getpid()}"
+    with open(staging, "w") as f:
+        f.write(text)
+    os.replace(staging, control_path)
+    record = {"policy": name, "settings": settings, "functions": kept, "removed_functions": removed,
+              "fields": policy.get("fields", {})}
+    with open(os.path.join(case_dir, POLICY_RECORD), "w") as f:
+        json.dump(record, f, indent=2)
+    return record
+
+
+def tree_size(path):
+    """Return (bytes, files) under path."""
+    size = files = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+                files += 1
+            except OSError:
+                continue
+    return size, files
+
+
+def report(case_dir, log):
+    """
+    Estimate the bytes written and the write time of a run.
+
+    Returns:
+        The report written to io_report.json
+    """
+    with open(os.path.join(case_dir, "system", "controlDict")) as f:
+        control = f.read()
+    policy = "tutorial"
+    if os.path.exists(os.path.join(case_dir, POLICY_RECORD)):
+        with open(os.path.join(case_dir, POLICY_RECORD)) as f:
+            policy = json.load(f)["policy"]
+    start_time = float(read_control(control, "startTime") or 0)
+    delta_t = float(read_control(control, "deltaT") or 1)
+    write_control = read_control(control, "writeControl")
+    write_interval = float(read_control(control, "writeInterval") or 1)
+    period = write_interval * delta_t if write_control == "timeStep" else write_interval
+
+    steps = [r for r in read_records(log) if "clock_time" in r]
+    # Wall time of each step; a negative step is the start of an appended restart
+    durations = [(b["time"], b["clock_time"] - a["clock_time"]) for a, b in zip(steps, steps[1:])
+                 if b["clock_time"] >= a["clock_time"]]
+
+    def is_write(time):
+        return write_control in ("timeStep", "runTime", "adjustableRunTime") \
+            and abs(time / period - round(time / period)) < 1e-6
+
+    write_steps = [d for t, d in durations if is_write(t)]
+    other_steps = [d for t, d in durations if not is_write(t)]
+    baseline = statistics.median(other_steps) if other_steps else 0
+    io_time = sum(max(0.0, d - baseline) for d in write_steps)
+    writes = len(write_steps) + (1 if steps and is_write(steps[0]["time"]) else 0)
+
+    time_bytes = time_files = 0
+    for root in processor_dirs(case_dir):
+        for name in os.listdir(os.path.join(case_dir, root)):
+            if is_time_dir(name) and float(name) > start_time:
+                size, files = tree_size(os.path.join(case_dir, root, name))
+                time_bytes += size
+                time_files += files
+    times = {n for root in processor_dirs(case_dir) for n in os.listdir(os.path.join(case_dir, root))
+             if is_time_dir(n) and float(n) > start_time}
+    surviving = len(times)
+    writes = writes or surviving
+    post_bytes, post_files = tree_size(os.path.join(case_dir, "postProcessing"))
+    per_write = time_bytes / surviving if surviving else 0
+    result = {
+        "policy": policy,
+        "writes": writes,
+        "surviving_times": surviving,
+        "bytes_per_write": int(per_write),
+        "files_per_write": int(time_files / surviving) if surviving else 0,
+        "field_bytes_written": int(per_write * writes),
+        "post_processing_bytes": post_bytes,
+        "post_processing_files": post_files,
+        "bytes_written": int(per_write * writes) + post_bytes,
+        "io_seconds": round(io_time, 2),
+        "clock_seconds": steps[-1]["clock_time"] if steps else 0,
+    }
+    with open(os.path.join(case_dir, IO_REPORT), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Write-interval and purge policies for the solver stage')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    apply_parser = subparsers.add_parser('apply', help='Apply a policy to the case')
+    apply_parser.add_argument('--policy', default=os.environ.get("FOAM_IO_POLICY", "tutorial"),
+                              help=f'Preset ({", ".join(POLICIES)}) or JSON file (default: $FOAM_IO_POLICY or tutorial)')
+    apply_parser.add_argument('--case', dest='case_dir', default=os.getcwd(),
+                              help='Case directory (default: current directory)')
+
+    report_parser = subparsers.add_parser('report', help='Report the bytes written and write time of a run')
+    report_parser.add_argument('--case', dest='case_dir', default=os.getcwd(),
+                               help='Case directory (default: current directory)')
+    report_parser.add_argument('--log', default="log.foamRun", help='Solver log (default: log.foamRun)')
+
+    subparsers.add_parser('list', help='Print the preset policies')
+    return parser.parse_args()
+
+
+def main():
+    """Apply, report or list I/O policies."""
+    args = parse_arguments()
+    if args.command == 'list':
+        for name, policy in POLICIES.items():
+            print(f"{name:<12} {json.dumps(policy)}")
+        return 0
+    try:
+        if args.command == 'apply':
+            record = apply(args.case_dir, args.policy)
+            logger.info(f"I/O policy {args.policy}: {' '.join(f'{k} {v}' for k, v in record['settings'].items())}"
+                        + (f", removed function objects {' '.join(record['removed_functions'])}"
+                           if record['removed_functions'] else ""))
+            return 0
+        result = report(args.case_dir, os.path.join(args.case_dir, args.log))
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"I/O policy {args.command} failed: {e}")
+        return 1
+    # Read by bench_io_policy.sh
+    print(f"I/O policy report ({result['policy']}): {result['bytes_written']} bytes in {result['writes']} writes, "
+          f"write time {result['io_seconds']} s of ClockTime {result['clock_seconds']} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
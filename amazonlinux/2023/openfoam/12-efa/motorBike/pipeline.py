@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+#### motorBike pipeline runner with resource requests learned from previous runs
+# ./pipeline.py --np 8
+# ./pipeline.py --np 16 --mesh-scale 8 --percentile 90 --dry-run
+#
+# Runs the prep job, the snappyHexMesh job and the fused 07-09 solve job with
+# submit2.py, like rip_and_tear.sh with FUSED_SOLVE=true. Before each stage it
+# sets the cpu, memory and ephemeral-storage requests from the resource
+# profile history of that stage (resource_profile.py recommend). It prefers
+# runs with the same world size and mesh scale. A stage with fewer than
+# --min-samples profiles keeps the submit2.py defaults. After each stage the
+# "Resource profile:" line of every pod is read from the pod log and appended
+# to the history, so the next run is sized from this one.
+#
+# A stage that fails restartably (preemption, node loss, OOM; submit2.py exit
+# code 4) is resubmitted up to --restart-retries times with FOAM_RESTART=true.
+# foamRun then carries on from its latest complete time (restart.py), with
+# requests re-sized from a history that now includes the failed attempt.
+#
+# --post-shards N ends the pipeline with the post-processing job array
+# (postprocess.py run): reconstructPar and --post-utilities over N shards of
+# the time directories.
+#
+# --archive ends it with the archive job (archive_case.py archive), which packs
+# the finished case into parallel zstd chunks under $MOUNTPOINT/archive/<run id>.
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+import postprocess
+from resource_profile import load_history, recommend, records_from_log
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("pipeline")
+
+IMAGE_PREFIX = "blik6126287/amazonlinux2023_openfoam12"
+
+# submit2.py logs every job ID of the job set
+MASTER_RE = re.compile(r"Master job ID: ([a-z0-9]+)")
+WORKERS_RE = re.compile(r"Worker job IDs: \[([^\]]*)\]")
+
+# submit2.py exit code for a failure worth restarting from the latest complete time
+EXIT_RESTARTABLE = 4
+
+
+def stages(np, io_policy):
+    """
+    Return the pipeline stages in order.
+
+    Returns:
+        A list of (image tag, world size, extra submit2.py arguments)
+    """
+    return [
+        ("motorBike_prep", 1, ["--env", f"DECOMPOSE_RANKS={np}"]),
+        ("motorBike_05_parallel_snappyHexMesh", np, []),
+        ("motorBike_07_09_parallel_solve", np, ["--io-policy", io_policy] if io_policy else []),
+    ]
+
+
+def pod_logs(namespace, job_ids):
+    """Return the logs of the pods of a job set, concatenated."""
+    logs = []
+    for job_id in job_ids:
+        logs.append(subprocess.run(["kubectl", "-n", namespace, "logs", f"armada-{job_id}-0"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   universal_newlines=True).stdout)
+    return "\n".join(logs)
+
+
+def append_history(path, records):
+    """Append profile records to the history file."""
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def run_stage(args, image, world_size, extra):
+    """
+    Size, submit and profile one stage.
+
+    Returns:
+        The submit2.py exit code
+    """
+    requests = recommend(load_history(args.history), image, args.percentile, args.headroom,
+                         args.min_samples, world_size, args.mesh_scale)
+    sizing = []
+    if requests:
+        sizing = ["--cpu-request", requests["cpu"], "--memory-request", requests["memory"],
+                  "--ephemeral-request", requests["ephemeral"]]
+        logger.info(f"{image}: {requests['cpu']} CPU, {requests['memory']} memory, {requests['ephemeral']} "
+                    f"ephemeral storage from {requests['samples']} profiles")
+    else:
+        logger.info(f"{image}: fewer than {args.min_samples} profiles, using the default requests")
+
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "submit2.py"),
+               "--disable-ssl", "--mpi-processes", str(world_size),
+               # Restarts are made here, so they are re-sized from the failed attempt's profiles
+               "--restart-retries", "0",
+               "--mpi-image", f"{args.image_prefix}:{image}",
+               "--env", f"RUN_ID={args.run_id}", "--env", f"MESH_SCALE={args.mesh_scale}"] + extra + sizing
+    if args.dry_run:
+        logger.info(f"Would run: {' '.join(command)}")
+        return 0
+
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    master = MASTER_RE.search(result.stdout)
+    if not master:
+        logger.error(f"No master job ID in the submit2.py output for {image}")
+        sys.stdout.write(result.stdout)
+        return result.returncode or 1
+    workers = WORKERS_RE.search(result.stdout)
+    job_ids = [master.group(1)] + (re.findall(r"[a-z0-9]+", workers.group(1)) if workers else [])
+    records = records_from_log(pod_logs(args.namespace, job_ids))
+    append_history(args.history, records)
+    if records:
+        peak = max(max(r["peak_rss_bytes"], r["peak_working_set_bytes"]) for r in records)
+        scratch = max(r["scratch_peak_bytes"] for r in records)
+        logger.info(f"{image}: {len(records)}/{len(job_ids)} profiles recorded, peak memory {peak / 2**20:.0f}Mi, "
+                    f"peak scratch {scratch / 2**20:.0f}Mi")
+    else:
+        logger.warning(f"{image}: no resource profiles in the pod logs")
+    return result.returncode
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='motorBike pipeline runner with learned resource requests')
+    parser.add_argument('--np', type=int, default=int(os.environ.get("NP", "8")),
+                        help='World size of the parallel stages (default: 8)')
+    parser.add_argument('--mesh-scale', dest='mesh_scale', default=os.environ.get("MESH_SCALE", "1"),
+                        help='Mesh size multiplier for mesh_scale.py (default: 1)')
+    parser.add_argument('--io-policy', dest='io_policy', default=os.environ.get("FOAM_IO_POLICY", ""),
+                        help='Write policy of the solve stage, see io_policy.py list (default: tutorial)')
+    parser.add_argument('--post-shards', dest='post_shards', type=int, default=int(os.environ.get("POST_SHARDS", "0")),
+                        help='Shard jobs of the post-processing stage (default: 0, no post-processing)')
+    parser.add_argument('--post-utilities', dest='post_utilities', nargs='*',
+                        default=os.environ.get("POST_UTILITIES", "vtk").split(),
+                        help='Utilities of the post-processing stage: vtk, functions, func:NAME (default: vtk)')
+    parser.add_argument('--archive', action='store_true', default=os.environ.get("ARCHIVE", "false") == "true",
+                        help='Archive the finished case with the motorBike_11_archive job')
+    parser.add_argument('--history', default=os.environ.get("RESOURCE_HISTORY", "resource_history.jsonl"),
+                        help='Resource profile history (default: resource_history.jsonl)')
+    parser.add_argument('--percentile', type=float, default=float(os.environ.get("RESOURCE_PERCENTILE", "95")),
+                        help='Percentile of the observed peaks (default: 95)')
+    parser.add_argument('--headroom', type=float, default=float(os.environ.get("RESOURCE_HEADROOM", "1.2")),
+                        help='Multiplier on the percentile (default: 1.2)')
+    parser.add_argument('--min-samples', dest='min_samples', type=int, default=3,
+                        help='Profiles of a stage needed before its requests are changed (default: 3)')
+    parser.add_argument('--restart-retries', dest='restart_retries', type=int,
+                        default=int(os.environ.get("RESTART_RETRIES", "2")),
+                        help='Resubmissions of a stage after a restartable failure (default: 2)')
+    parser.add_argument('--image-prefix', dest='image_prefix', default=os.environ.get("IMAGE_PREFIX", IMAGE_PREFIX),
+                        help=f'Image repository (default: {IMAGE_PREFIX})')
+    parser.add_argument('--namespace', default=os.environ.get("NAMESPACE", "default"),
+                        help='Kubernetes namespace of the pods (default: default)')
+    parser.add_argument('--run-id', dest='run_id', default=os.environ.get("RUN_ID", time.strftime('%Y%m%d%H%M%S')),
+                        help='Run ID for the stage cache stats (default: timestamp)')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Only log the requests and submit2.py commands')
+    return parser.parse_args()
+
+
+def main():
+    """Run the pipeline stages in order, stopping at the first failure."""
+    args = parse_arguments()
+    if os.environ.get("SCRATCH_STAGING", "false").lower() == "true" and args.restart_retries:
+        logger.warning("Restarts are not supported with scratch staging (SCRATCH_STAGING), not resubmitting stages")
+        args.restart_retries = 0
+    for image, world_size, extra in stages(args.np, args.io_policy):
+        restarts = 0
+        while True:
+            try:
+                status = run_stage(args, image, world_size,
+                                   extra + (["--env", "FOAM_RESTART=true"] if restarts else []))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"{image} failed: {e}")
+                return 1
+            if status != EXIT_RESTARTABLE or restarts >= args.restart_retries:
+                break
+            restarts += 1
+            logger.warning(f"{image} failed restartably, resubmitting from the latest complete time "
+                           f"(restart {restarts}/{args.restart_retries})")
+        if status != 0:
+            logger.error(f"{image} failed (exit code {status}), stopping the pipeline")
+            return status
+    if args.post_shards > 0:
+        if args.dry_run:
+            logger.info(f"Would post-process with {args.post_shards} shards: {' '.join(args.post_utilities)}")
+        else:
+            status = postprocess.run(args.post_shards, args.post_utilities,
+                                     f"{args.image_prefix}:motorBike_10_postprocess", args.run_id, [])
+            if status != 0:
+                logger.error(f"Post-processing failed (exit code {status})")
+                return status
+    if args.archive:
+        if args.dry_run:
+            logger.info(f"Would archive the case to archive/{args.run_id}")
+        else:
+            status, _ = postprocess.submit(f"{args.image_prefix}:motorBike_11_archive", f"archive-{args.run_id}",
+                                           {"RUN_ID": args.run_id}, [])
+            if status != 0:
+                logger.error(f"Archiving failed (exit code {status})")
+                return status
+    logger.info(f"Pipeline {args.run_id} completed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
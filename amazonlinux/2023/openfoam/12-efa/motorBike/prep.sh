@@ -0,0 +1,107 @@
+#!/bin/bash
+
+# Serial motorBike prep steps (stages 01-04 and 06) in a single container
+# Usage: prep.sh [step...]
+#   steps: stage allclean data_setup blockMesh decomposePar rmexec
+#   default: $PREP_STEPS or "stage blockMesh decomposePar"
+# stage does the work of allclean and data_setup from the case packed into the image
+# Each step can still be run on its own for debugging, e.g. prep.sh blockMesh
+# blockMesh and decomposePar are restored from the stage cache when their inputs
+# are unchanged (STAGE_CACHE=false always recomputes)
+
+# Source the environment
+source ${WM_PROJECT_DIR}/etc/bashrc
+source ${WM_PROJECT_DIR}/bin/tools/RunFunctions
+source /app/runParallel.sh
+
+CASE_DIR="${WORK_DIR}/${TUTORIAL}"
+PREP_STEPS="${PREP_STEPS:-stage blockMesh decomposePar}"
+if [ "$#" -gt 0 ]; then
+    STEPS=("$@")
+else
+    read -r -a STEPS <<< "$PREP_STEPS"
+fi
+
+elapsed_ms() {
+  echo $(( ($(date +%s%N) - $1) / 1000000 ))
+}
+
+# 01+02: cleaned tutorial and geometry from the image's packed case (stage_case.py)
+# Paths the pack does not have are removed, and files already staged from the same pack are skipped
+step_stage() {
+    python3 /app/stage_case.py stage --case "${CASE_DIR}"
+}
+
+# 01: fresh copy of the tutorial, then Allclean
+step_allclean() {
+    mkdir -p "${CASE_DIR}" &&
+    cp -R ${WM_PROJECT_DIR}/tutorials/incompressibleFluid/${TUTORIAL}/${TUTORIAL}/* "${CASE_DIR}/" &&
+    cd "${CASE_DIR}" && ./Allclean
+}
+
+# 02: surface geometry
+step_data_setup() {
+    cp ${FOAM_TUTORIALS}/resources/geometry/motorBike.obj.gz "${CASE_DIR}/constant/geometry/"
+}
+
+# 03: background mesh
+# MESH_SCALE or MESH_CELLS (and MESH_LEVEL_SHIFT) scale the mesh size first (mesh_scale.py)
+step_blockMesh() {
+    cd "${CASE_DIR}" || return 1
+    if [ -n "${MESH_SCALE}${MESH_CELLS}" ]; then
+        python3 /app/mesh_scale.py || return 1
+    fi
+    runCached blockMesh runApplication blockMesh
+}
+
+# 04: decomposition for the parallel stages
+# DECOMPOSE_RANKS (and DECOMPOSE_RANKS_PER_NODE) regenerate decomposeParDict for that world size
+# FOAM_FILEHANDLER is written into controlDict so every later stage, serial or parallel,
+# uses the same layout (collated: processors<N>, grouped by IO_RANKS I/O ranks)
+step_decomposePar() {
+    cd "${CASE_DIR}" || return 1
+    if [ -n "${DECOMPOSE_RANKS}" ]; then
+        python3 /app/decompose_dict.py --ranks "${DECOMPOSE_RANKS}" || return 1
+    fi
+    foamDictionary -entry OptimisationSwitches/fileHandler -add "${FOAM_FILEHANDLER:-uncollated}" \
+        system/controlDict > /dev/null || return 1
+    if [ "${FOAM_FILEHANDLER:-uncollated}" = "collated" ]; then
+        export FOAM_IORANKS=$(foamIoRanks $(foamDictionary -entry numberOfSubdomains -value system/decomposeParDict))
+    fi
+    runCached decomposePar runApplication decomposePar -copyZero
+}
+
+# 06: drop snappyHexMesh refinement level fields (runs after 05)
+step_rmexec() {
+    python3 /app/clean_levels.py --case "${CASE_DIR}"
+}
+
+# Validate every step before running any of them
+for step in "${STEPS[@]}"; do
+    if ! declare -F "step_${step}" > /dev/null; then
+        echo "Error: unknown prep step '${step}'"
+        echo "Valid steps: stage allclean data_setup blockMesh decomposePar rmexec"
+        exit 1
+    fi
+done
+
+echo "Prep steps: ${STEPS[*]}"
+# Profile the prep job's resource usage for request right-sizing (resource_profile.py)
+profileStart
+trap 'profileStop $?' EXIT
+PREP_START_NS=$(date +%s%N)
+for step in "${STEPS[@]}"; do
+    echo "Prep step ${step} starting"
+    STEP_START_NS=$(date +%s%N)
+    ( "step_${step}" )
+    STEP_STATUS=$?
+    STEP_MS=$(elapsed_ms $STEP_START_NS)
+    echo "Prep step ${step} took ${STEP_MS} ms (status ${STEP_STATUS})"
+    # Step durations are kept with the case for later comparison
+    [ -d "${CASE_DIR}" ] && echo "$(date +%Y-%m-%dT%H:%M:%S) ${step} ${STEP_MS} ${STEP_STATUS}" >> "${CASE_DIR}/prep_timings"
+    if [ $STEP_STATUS -ne 0 ]; then
+        echo "Prep step ${step} failed, stopping"
+        exit $STEP_STATUS
+    fi
+done
+echo "Prep completed in $(elapsed_ms $PREP_START_NS) ms"
@@ -0,0 +1,74 @@
+#!/bin/bash
+
+# Parallel decomposition / redistribution of the motorBike case (replaces serial 04)
+# Usage: redistribute.sh [ranks]   (run as a setup_mpi.sh task; default: $REDISTRIBUTE_RANKS or $MPI_WORLD_SIZE)
+#   no processor dirs:       redistributePar -decompose (undecomposed mesh -> <ranks>)
+#   existing decomposition:  redistributePar (<current> -> <ranks>, no serial recomposition)
+# redistributePar runs on max(current, ranks) processes, so the job set needs at least
+# that many slots; processor dirs beyond <ranks> are removed after shrinking
+# decomposeParDict is regenerated for <ranks> by decompose_dict.py
+
+# Source the environment (runParallel and runCached are shell functions)
+source ${WM_PROJECT_DIR}/etc/bashrc
+source ${WM_PROJECT_DIR}/bin/tools/RunFunctions
+source /app/runParallel.sh
+
+TARGET_RANKS="${1:-${REDISTRIBUTE_RANKS:-${MPI_WORLD_SIZE}}}"
+CASE_DIR="${WORK_DIR}/${TUTORIAL}"
+cd "${CASE_DIR}" || exit 1
+
+elapsed_ms() {
+  echo $(( ($(date +%s%N) - $1) / 1000000 ))
+}
+
+# Current decomposition (processorN or collated processors<N>), if any
+CURRENT_RANKS=$(foamDecomposedRanks)
+NP=$(( CURRENT_RANKS > TARGET_RANKS ? CURRENT_RANKS : TARGET_RANKS ))
+AVAILABLE_SLOTS="${MPI_TOTAL_SLOTS:-${MPI_WORLD_SIZE}}"
+if [ "$NP" -gt "$AVAILABLE_SLOTS" ]; then
+    echo "Error: redistributing ${CURRENT_RANKS} -> ${TARGET_RANKS} ranks needs ${NP} processes," \
+         "but the job set has ${AVAILABLE_SLOTS} slots (submit with --mpi-processes ${NP})"
+    exit 1
+fi
+if [ "$CURRENT_RANKS" -eq "$TARGET_RANKS" ]; then
+    echo "Case is already decomposed for ${TARGET_RANKS} ranks, nothing to do"
+    exit 0
+fi
+
+# Generate decomposeParDict for the target ranks and how they are packed on nodes
+# (pods per node from the host records, times slots per pod)
+PODS_PER_NODE=$(awk '{print $1}' "${MOUNTPOINT}/hostfiles/${JOB_SET_ID}"/rank_* 2>/dev/null | sort | uniq -c | sort -rn | awk 'NR == 1 {print $1}')
+RANKS_PER_NODE=$(( ${PODS_PER_NODE:-1} * ${MPI_SLOTS:-1} ))
+python3 /app/decompose_dict.py --ranks "${TARGET_RANKS}" --ranks-per-node "${DECOMPOSE_RANKS_PER_NODE:-$RANKS_PER_NODE}" || exit 1
+
+START_NS=$(date +%s%N)
+if [ "$CURRENT_RANKS" -eq 0 ]; then
+    MODE=decompose
+    # A parallel decomposition is a valid decomposePar result for the stage cache
+    runCached decomposePar runParallel -o -s decompose -np "${NP}" redistributePar -decompose -overwrite
+else
+    MODE=redistribute
+    # The existing processor dirs may hold a later stage (e.g. snappyHexMesh), so the
+    # cached stage keys no longer describe them
+    rm -f .stage_keys/decomposePar .stage_keys/snappyHexMesh
+    runParallel -o -s "${CURRENT_RANKS}to${TARGET_RANKS}" -np "${NP}" redistributePar -overwrite
+fi
+STATUS=$?
+if [ $STATUS -ne 0 ]; then
+    echo "redistributePar failed with status ${STATUS}"
+    exit $STATUS
+fi
+
+# Drop processor dirs left over from a larger decomposition, or the collated
+# file sets of the previous one
+for dir in processor[0-9]*; do
+    if [ "${dir#processor}" -ge "$TARGET_RANKS" ]; then
+        rm -rf "$dir"
+    fi
+done
+for dir in processors[0-9]*; do
+    if [ "$(echo "${dir#processors}" | sed 's/_.*//')" != "$TARGET_RANKS" ]; then
+        rm -rf "$dir"
+    fi
+done
+echo "Redistribution (${MODE}) ${CURRENT_RANKS} -> ${TARGET_RANKS} ranks on ${NP} processes took $(elapsed_ms $START_NS) ms"
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+#### per-stage resource profiles and request recommendations
+# every pod (started by setup_mpi.sh / prep.sh): ./resource_profile.py sample --status-file /tmp/profile_status
+# submitter:  ./resource_profile.py recommend --history resource_history.jsonl --stage motorBike_05_parallel_snappyHexMesh
+#
+# sample polls the pod's cgroup and /proc until SIGTERM. It tracks the peak
+# summed RSS and cgroup working set, the CPU time used, and the peak size of
+# the scratch volume. It then prints one "Resource profile: {...}" line to the
+# pod log and appends the same record to $MOUNTPOINT/profiles/<stage>.jsonl.
+# The stage is the image tag. pipeline.py collects the lines from the pod logs
+# into a local history. recommend turns that history into cpu/memory/
+# ephemeral-storage requests: a percentile of the observed peaks plus
+# headroom, raised past the limit of any run that died at its memory limit.
+
+import os
+import sys
+import json
+import math
+import time
+import signal
+import logging
+import argparse
+import threading
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("resource_profile")
+
+# Pod log marker for profile records
+PROFILE_MARKER = "Resource profile: "
+
+# Floors and rounding for recommended requests
+MIN_CPU_MILLICORES = 250
+MEMORY_STEP = 256 * 2**20
+MIN_MEMORY = 512 * 2**20
+EPHEMERAL_BASE = 2 * 2**30
+# A failed run that reached this fraction of its memory limit is treated as an OOM
+OOM_FRACTION = 0.95
+OOM_GROWTH = 1.5
+
+CGROUP_V2 = "/sys/fs/cgroup"
+CGROUP_V1_MEMORY = "/sys/fs/cgroup/memory"
+CGROUP_V1_CPU = "/sys/fs/cgroup/cpuacct"
+
+
+def parse_quantity(quantity):
+    """
+    Convert a Kubernetes quantity to a number (bytes, or cores for CPU).
+
+    Args:
+        quantity: e.g. "2Gi", "512Mi", "1.5", "500m"
+
+    Returns:
+        The value as a float
+    """
+    suffixes = {"Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40, "k": 1e3, "M": 1e6, "G": 1e9, "T": 1e12, "m": 1e-3}
+    for suffix, scale in sorted(suffixes.items(), key=lambda s: -len(s[0])):
+        if quantity.endswith(suffix):
+            return float(quantity[:-len(suffix)]) * scale
+    return float(quantity)
+
+
+def read_int(path):
+    """Read an integer from a file, or None."""
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def cgroup_memory():
+    """
+    Return the cgroup working set (usage minus inactive file cache) in bytes, or None.
+    """
+    if os.path.exists(os.path.join(CGROUP_V2, "memory.current")):
+        usage, stat_path, key = read_int(os.path.join(CGROUP_V2, "memory.current")), \
+            os.path.join(CGROUP_V2, "memory.stat"), "inactive_file"
+    else:
+        usage, stat_path, key = read_int(os.path.join(CGROUP_V1_MEMORY, "memory.usage_in_bytes")), \
+            os.path.join(CGROUP_V1_MEMORY, "memory.stat"), "total_inactive_file"
+    if usage is None:
+        return None
+    try:
+        with open(stat_path) as f:
+            for line in f:
+                name, value = line.split()
+                if name == key:
+                    return max(0, usage - int(value))
+    except (OSError, ValueError):
+        pass
+    return usage
+
+
+def cgroup_cpu_seconds():
+    """Return the CPU time used by the pod's cgroup in seconds, or None."""
+    try:
+        with open(os.path.join(CGROUP_V2, "cpu.stat")) as f:
+            for line in f:
+                name, value = line.split()
+                if name == "usage_usec":
+                    return int(value) / 1e6
+    except (OSError, ValueError):
+        pass
+    usage = read_int(os.path.join(CGROUP_V1_CPU, "cpuacct.usage"))
+    return usage / 1e9 if usage is not None else None
+
+
+def total_rss():
+    """Return the summed VmRSS of every process visible in the pod, in bytes."""
+    total = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def tree_size(path):
+    """Return the bytes used under path (0 if it does not exist)."""
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def sample(args):
+    """
+    Sample until SIGTERM and return the profile record.
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    start = time.time()
+    cpu_start = cgroup_cpu_seconds()
+    peak_rss = peak_working_set = peak_scratch = 0
+    while True:
+        peak_rss = max(peak_rss, total_rss())
+        peak_working_set = max(peak_working_set, cgroup_memory() or 0)
+        if args.scratch_dir and os.path.isdir(args.scratch_dir):
+            peak_scratch = max(peak_scratch, tree_size(args.scratch_dir))
+        if stopping.is_set():
+            break
+        stopping.wait(args.interval)
+
+    wall = time.time() - start
+    cpu_end = cgroup_cpu_seconds()
+    cpu_seconds = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+    cpu_request = parse_quantity(os.environ.get("CPU_REQUEST", "1"))
+    status = None
+    if args.status_file and os.path.exists(args.status_file):
+        status = read_int(args.status_file)
+    image = os.environ.get("MPI_IMAGE", "")
+    return {
+        "stage": image.rsplit(":", 1)[-1] if ":" in image else (image or "unknown"),
+        "image": image,
+        "job_set": os.environ.get("JOB_SET_ID", ""),
+        "rank": int(os.environ.get("MPI_RANK", "0")),
+        "world_size": int(os.environ.get("MPI_WORLD_SIZE", "1")),
+        "mesh_scale": os.environ.get("MESH_SCALE", os.environ.get("MESH_CELLS", "")),
+        "cpu_request": os.environ.get("CPU_REQUEST", "1"),
+        "memory_request": os.environ.get("MEMORY_REQUEST", "2Gi"),
+        "ephemeral_request": os.environ.get("EPHEMERAL_REQUEST", "8Gi"),
+        "wall_seconds": round(wall, 1),
+        "cpu_seconds": round(cpu_seconds, 1) if cpu_seconds is not None else None,
+        "cpu_utilization": round(cpu_seconds / wall / cpu_request, 3) if cpu_seconds is not None and wall > 0 else None,
+        "peak_rss_bytes": peak_rss,
+        "peak_working_set_bytes": peak_working_set,
+        "scratch_peak_bytes": peak_scratch,
+        "status": status,
+        "finished": time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values (nearest rank)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def round_up(value, step):
+    """Round value up to a multiple of step."""
+    return int(math.ceil(value / step) * step)
+
+
+def recommend(records, stage, pct, headroom, min_samples, world_size=None, mesh_scale=None):
+    """
+    Recommend requests for a stage from its profile history.
+
+    Records of the same world size and mesh scale are preferred; if there are
+    fewer than min_samples of those, every record of the stage is used.
+
+    Args:
+        records: Profile records
+        stage: The stage (image tag)
+        pct: Percentile of the observed peaks
+        headroom: Multiplier on the percentile
+        min_samples: Records needed before recommending anything
+        world_size: World size of the next run
+        mesh_scale: Mesh scale of the next run
+
+    Returns:
+        {"cpu", "memory", "ephemeral", "samples"} as Kubernetes quantities, or None
+    """
+    matching = [r for r in records if r["stage"] == stage]
+    exact = [r for r in matching if (world_size is None or r["world_size"] == world_size)
+             and (mesh_scale is None or str(r.get("mesh_scale", "")) == str(mesh_scale))]
+    chosen = exact if len(exact) >= min_samples else matching
+    if len(chosen) < min_samples:
+        return None
+
+    memory = percentile([max(r["peak_rss_bytes"], r["peak_working_set_bytes"]) for r in chosen], pct) * headroom
+    # A run that failed at its memory limit says nothing about its real peak, except that it is higher
+    for r in chosen:
+        limit = parse_quantity(r["memory_request"])
+        if r.get("status") not in (None, 0) and r["peak_working_set_bytes"] >= limit * OOM_FRACTION:
+            memory = max(memory, limit * OOM_GROWTH)
+    memory = max(MIN_MEMORY, round_up(memory, MEMORY_STEP))
+
+    if any(r["world_size"] > 1 for r in chosen):
+        # MPI slots come from the whole cores of the request and busy-polling ranks use all of them,
+        # so parallel stages keep the cores they ran with
+        millicores = max(max(1, int(parse_quantity(r["cpu_request"]))) for r in chosen) * 1000
+    else:
+        cores = [r["cpu_seconds"] / r["wall_seconds"] for r in chosen if r.get("cpu_seconds") and r["wall_seconds"] > 0]
+        millicores = round_up(percentile(cores, pct) * headroom * 1000, 100) if cores else 1000
+        millicores = max(MIN_CPU_MILLICORES, millicores)
+
+    ephemeral = EPHEMERAL_BASE + percentile([r["scratch_peak_bytes"] for r in chosen], pct) * headroom
+    return {
+        "cpu": f"{millicores // 1000}" if millicores % 1000 == 0 else f"{millicores}m",
+        "memory": f"{memory // 2**20}Mi",
+        "ephemeral": f"{math.ceil(ephemeral / 2**30)}Gi",
+        "samples": len(chosen),
+    }
+
+
+def load_history(path):
+    """Load profile records from a JSON lines history file."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def records_from_log(log):
+    """Extract the profile records from a pod log."""
+    records = []
+    for line in log.splitlines():
+        if PROFILE_MARKER in line:
+            try:
+                records.append(json.loads(line.split(PROFILE_MARKER, 1)[1]))
+            except ValueError:
+                continue
+    return records
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Per-stage resource profiles and request recommendations')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sample_parser = subparsers.add_parser('sample', help='Profile this pod until SIGTERM')
+    sample_parser.add_argument('--interval', type=float, default=float(os.environ.get("PROFILE_INTERVAL", "5")),
+                               help='Seconds between samples (default: 5)')
+    sample_parser.add_argument('--scratch-dir', dest='scratch_dir', default=os.environ.get("SCRATCH_DIR", "/scratch"),
+                               help='Scratch volume to measure (default: /scratch)')
+    sample_parser.add_argument('--status-file', dest='status_file',
+                               help='File holding the exit status of the pod, written before SIGTERM')
+    sample_parser.add_argument('--mountpoint', default=os.environ.get("MOUNTPOINT", "/app/shared"),
+                               help='Shared mount path (default: /app/shared)')
+
+    recommend_parser = subparsers.add_parser('recommend', help='Recommend requests from a profile history')
+    recommend_parser.add_argument('--history', default=os.environ.get("RESOURCE_HISTORY", "resource_history.jsonl"),
+                                  help='Profile history (default: resource_history.jsonl)')
+    recommend_parser.add_argument('--stage', required=True, help='Stage (image tag), e.g. motorBike_prep')
+    recommend_parser.add_argument('--percentile', type=float, default=95, help='Percentile of the peaks (default: 95)')
+    recommend_parser.add_argument('--headroom', type=float, default=1.2, help='Multiplier on the percentile (default: 1.2)')
+    recommend_parser.add_argument('--min-samples', dest='min_samples', type=int, default=3,
+                                  help='Records needed before recommending (default: 3)')
+    recommend_parser.add_argument('--world-size', dest='world_size', type=int, help='World size of the next run')
+    recommend_parser.add_argument('--mesh-scale', dest='mesh_scale', help='MESH_SCALE (or MESH_CELLS) of the next run')
+    return parser.parse_args()
+
+
+def main():
+    """Sample this pod or recommend requests."""
+    args = parse_arguments()
+    if args.command == 'sample':
+        record = sample(args)
+        print(PROFILE_MARKER + json.dumps(record, separators=(",", ":")), flush=True)
+        try:
+            profiles = os.path.join(args.mountpoint, "profiles")
+            os.makedirs(profiles, exist_ok=True)
+            with open(os.path.join(profiles, f"{record['stage']}.jsonl"), "a") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not append the profile to the shared mount: {e}")
+        return 0
+    try:
+        result = recommend(load_history(args.history), args.stage, args.percentile, args.headroom,
+                           args.min_samples, args.world_size, args.mesh_scale)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Could not read {args.history}: {e}")
+        return 1
+    if result is None:
+        logger.info(f"Fewer than {args.min_samples} profiles of {args.stage}, keep the default requests")
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/bin/bash
+
+# Run the parallel motorBike stages on one warm MPI pod pool
+# The serial prep runs as one job; 05-09 share one bootstrap
+NP=${NP:-8}
+RUN_ID=${RUN_ID:-$(date +%Y%m%d%H%M%S)}
+NAMESPACE=${NAMESPACE:-default}
+CONTROL_PORT=${MPI_CONTROL_PORT:-29501}
+
+./submit2.py --disable-ssl --env RUN_ID=$RUN_ID --env DECOMPOSE_RANKS=$NP --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_prep || exit 1
+
+LOG=$(mktemp)
+./submit2.py --disable-ssl --mpi-processes "$NP" --warm-pool --job-set-prefix warm-pool --env RUN_ID=$RUN_ID \
+    --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_warm_pool 2>&1 | tee "$LOG"
+MASTER_JOB_ID=$(grep -o "Master job ID: [a-z0-9]*" "$LOG" | awk '{print $4}')
+rm -f "$LOG"
+if [ -z "$MASTER_JOB_ID" ]; then
+    echo "Warm pool submission failed"
+    exit 1
+fi
+
+kubectl -n "$NAMESPACE" port-forward "pod/armada-${MASTER_JOB_ID}-0" "${CONTROL_PORT}:${CONTROL_PORT}" > /dev/null &
+FORWARD_PID=$!
+trap 'kill $FORWARD_PID 2>/dev/null' EXIT
+
+STATUS=0
+for TASK in \
+    "runCached snappyHexMesh runParallel -np \${MPI_TOTAL_SLOTS} snappyHexMesh -overwrite" \
+    "python3 /app/clean_levels.py --case ." \
+    "runParallel -np \${MPI_TOTAL_SLOTS} renumberMesh -overwrite" \
+    "runParallel -np \${MPI_TOTAL_SLOTS} potentialFoam -initialiseUBCs" \
+    "runParallel -np \${MPI_TOTAL_SLOTS} \$(getApplication)"; do
+    ./warm_pool.py dispatch --port "$CONTROL_PORT" "$TASK" || { STATUS=$?; break; }
+done
+
+./warm_pool.py dispatch --port "$CONTROL_PORT" "python3 /app/stage_cache.py report --run-id $RUN_ID"
+./warm_pool.py shutdown --port "$CONTROL_PORT"
+exit $STATUS
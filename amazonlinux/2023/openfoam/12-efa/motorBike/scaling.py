@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+#### strong/weak scaling harness for the motorBike parallel stages
+# ./scaling.py sweep --ranks 4 8 16 32 --packing spread packed --label efa-ompi5
+# ./scaling.py sweep --ranks 4 8 16 32 --cells-per-rank 250000   (weak: mesh grows with ranks)
+# ./scaling.py analyze scaling/*.json --efficiency 0.7
+#
+# sweep submits, for every rank count and packing mode, the prep job (blockMesh
+# and decomposePar come from the stage cache after the first run), the
+# snappyHexMesh job and the fused 07-09 solve job. It then reads the
+# "<app> finished on N processes ... ExecutionTime" lines that runParallel
+# prints in the master pod log. Every run is appended to one JSON result file
+# with the image IDs, so sweeps of different images or MPI stacks can be
+# compared later.
+#
+# analyze turns one or more result files into speed-up and parallel efficiency
+# curves per label, stage and packing. It also recommends, per stage, the
+# largest rank count that keeps efficiency above the threshold. Weak scaling
+# sweeps size the mesh to ranks x cells per rank with mesh_scale.py, and their
+# efficiency is T(base) / T(n).
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("scaling")
+
+IMAGE_PREFIX = "blik6126287/amazonlinux2023_openfoam12"
+
+# submit2.py flags per packing mode
+PACKING_MODES = {
+    "spread": [],
+    "packed": ["--node-concentration"],
+}
+
+# runParallel: "<app> finished on <n> processes (status <s>): ExecutionTime = <x> s  ClockTime = <y> s"
+FINISHED_RE = re.compile(r"(\w+) finished on (\d+) processes \(status (\d+)\): "
+                         r"ExecutionTime = ([0-9.eE+-]+) s\s+ClockTime = ([0-9.eE+-]+) s")
+MASTER_RE = re.compile(r"Master job ID: ([a-z0-9]+)")
+
+
+def submit(args, job_set_prefix, image, extra):
+    """
+    Run submit2.py and fetch the master pod log.
+
+    Args:
+        args: Parsed arguments
+        job_set_prefix: Job set prefix for this run
+        image: Image tag suffix (motorBike_...)
+        extra: Additional submit2.py arguments
+
+    Returns:
+        (submit2 exit code, master pod log, image ID)
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "submit2.py"),
+               "--disable-ssl", "--job-set-prefix", job_set_prefix,
+               "--mpi-image", f"{args.image_prefix}:{image}", "--env", f"RUN_ID={args.run_id}"] + extra
+    logger.info(f"Submitting {image}: {' '.join(extra)}")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    match = MASTER_RE.search(result.stdout)
+    if not match:
+        logger.error(f"No master job ID in the submit2.py output for {image}")
+        return result.returncode, "", ""
+    pod = f"armada-{match.group(1)}-0"
+    log = subprocess.run(["kubectl", "-n", args.namespace, "logs", pod],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    image_id = subprocess.run(["kubectl", "-n", args.namespace, "get", "pod", pod, "-o",
+                               "jsonpath={.status.containerStatuses[0].imageID}"],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    return result.returncode, log, image_id
+
+
+def stage_times(log):
+    """
+    Collect the per-application timings runParallel reported in a pod log.
+
+    Returns:
+        A list of {"stage", "processes", "status", "execution_time", "clock_time"}
+    """
+    return [{"stage": m.group(1), "processes": int(m.group(2)), "status": int(m.group(3)),
+             "execution_time": float(m.group(4)), "clock_time": float(m.group(5))}
+            for m in FINISHED_RE.finditer(log)]
+
+
+def save(path, results):
+    """Write the result file (after every run, so a partial sweep is kept)."""
+    staging = f"{path}.tmp"
+    with open(staging, "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(staging, path)
+
+
+def sweep(args):
+    """
+    Run the stages at every rank count and packing mode.
+
+    Returns:
+        The path of the result file
+    """
+    os.makedirs(args.results, exist_ok=True)
+    path = os.path.join(args.results, f"scaling_{args.run_id}.json")
+    mode = "weak" if args.cells_per_rank else "strong"
+    results = {"label": args.label, "run_id": args.run_id, "image_prefix": args.image_prefix, "mode": mode,
+               "cells_per_rank": args.cells_per_rank, "started": time.strftime('%Y-%m-%dT%H:%M:%S'), "runs": []}
+    for ranks in args.ranks:
+        for packing in args.packing:
+            prefix = f"scaling-{ranks}-{packing}"
+            placement = ["--mpi-processes", str(ranks)] + PACKING_MODES[packing]
+            # Meshes are prepared per rank count; repeats come from the stage cache
+            prep = ["--env", f"DECOMPOSE_RANKS={ranks}"]
+            if mode == "weak":
+                prep += ["--env", f"MESH_CELLS={ranks * args.cells_per_rank}"]
+            status, _, _ = submit(args, prefix, "motorBike_prep", prep)
+            if status != 0:
+                logger.error(f"Prep failed for {ranks} ranks, skipping")
+                continue
+            jobs = [("motorBike_05_parallel_snappyHexMesh",
+                     # Measured meshing always recomputes; otherwise reuse the cached mesh
+                     ["--env", "STAGE_CACHE=false"] if "mesh" in args.stages else []),
+                    ("motorBike_07_09_parallel_solve", [])]
+            for image, extra in jobs:
+                status, log, image_id = submit(args, prefix, image, placement + extra)
+                measured = "mesh" in args.stages if image.startswith("motorBike_05") else "solve" in args.stages
+                for timing in stage_times(log) if measured else []:
+                    results["runs"].append(dict(timing, ranks=ranks, packing=packing, image=image,
+                                                image_id=image_id, job_set_prefix=prefix))
+                    logger.info(f"{timing['stage']} on {ranks} ranks ({packing}): "
+                                f"ExecutionTime {timing['execution_time']} s")
+                save(path, results)
+                if status != 0:
+                    logger.error(f"{image} failed on {ranks} ranks ({packing}), skipping the rest of this point")
+                    break
+    logger.info(f"Results written to {path}")
+    return path
+
+
+def curves(results_files, efficiency_threshold):
+    """
+    Compute speed-up and efficiency per label, stage and packing.
+
+    Args:
+        results_files: Loaded result files
+        efficiency_threshold: Minimum parallel efficiency for a recommendation
+
+    Returns:
+        {"curves": [...], "recommended": {label: {stage: {...}}}}
+    """
+    best = {}
+    for results in results_files:
+        for run in results["runs"]:
+            if run["status"] != 0:
+                continue
+            key = (results.get("label") or results["run_id"], results.get("mode", "strong"), run["stage"], run["packing"])
+            # Repeated points keep their fastest run
+            times = best.setdefault(key, {})
+            times[run["ranks"]] = min(times.get(run["ranks"], float("inf")), run["execution_time"])
+
+    output = {"efficiency_threshold": efficiency_threshold, "curves": [], "recommended": {}}
+    for (label, mode, stage, packing), times in sorted(best.items()):
+        base_ranks = min(times)
+        points = []
+        for ranks in sorted(times):
+            ratio = times[base_ranks] / times[ranks] if times[ranks] > 0 else 0.0
+            if mode == "weak":
+                # Constant work per rank: ideal time is flat, speed-up is the scaled speed-up
+                efficiency, speedup = ratio, ratio * ranks / base_ranks
+            else:
+                efficiency, speedup = ratio * base_ranks / ranks, ratio
+            points.append({"ranks": ranks, "execution_time": times[ranks], "speedup": round(speedup, 3),
+                           "efficiency": round(efficiency, 3)})
+        output["curves"].append({"label": label, "mode": mode, "stage": stage, "packing": packing,
+                                 "base_ranks": base_ranks, "points": points})
+        # The largest rank count that still uses its cores well; ties go to the faster packing
+        eligible = [p for p in points if p["efficiency"] >= efficiency_threshold]
+        if eligible:
+            choice = max(eligible, key=lambda p: (p["ranks"], -p["execution_time"]))
+            recommended = output["recommended"].setdefault(label if mode == "strong" else f"{label} (weak)", {})
+            current = recommended.get(stage)
+            if current is None or (choice["ranks"], -choice["execution_time"]) > (current["ranks"], -current["execution_time"]):
+                recommended[stage] = dict(choice, packing=packing)
+    return output
+
+
+def analyze(args):
+    """Print and save the scaling curves of the given result files."""
+    results_files = []
+    for path in args.files:
+        with open(path) as f:
+            results_files.append(json.load(f))
+    output = curves(results_files, args.efficiency)
+    for curve in output["curves"]:
+        print(f"\n{curve['label']} {curve['stage']} ({curve['mode']} scaling, {curve['packing']}, "
+              f"baseline {curve['base_ranks']} ranks)")
+        print(f"{'ranks':>6} {'time_s':>10} {'speedup':>8} {'efficiency':>10}")
+        for p in curve["points"]:
+            print(f"{p['ranks']:>6} {p['execution_time']:>10.2f} {p['speedup']:>8.2f} {p['efficiency']:>10.2f}")
+    for label, stages in output["recommended"].items():
+        print(f"\nRecommended rank counts for {label} (efficiency >= {args.efficiency}):")
+        for stage, choice in sorted(stages.items()):
+            print(f"  {stage}: {choice['ranks']} ranks, {choice['packing']} "
+                  f"(speed-up {choice['speedup']}, efficiency {choice['efficiency']})")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        logger.info(f"Curves written to {args.out}")
+    return 0
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Strong/weak scaling harness for the motorBike parallel stages')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sweep_parser = subparsers.add_parser('sweep', help='Run the stages at a sweep of rank counts')
+    sweep_parser.add_argument('--ranks', type=int, nargs='+', default=[4, 8, 16, 32],
+                              help='Rank counts (default: 4 8 16 32)')
+    sweep_parser.add_argument('--packing', nargs='+', choices=sorted(PACKING_MODES), default=["spread"],
+                              help='Packing modes: spread (default scheduling), packed (node concentration)')
+    sweep_parser.add_argument('--stages', nargs='+', choices=['mesh', 'solve'], default=['mesh', 'solve'],
+                              help='Stages to measure; unmeasured meshing reuses the cached mesh (default: both)')
+    sweep_parser.add_argument('--cells-per-rank', dest='cells_per_rank', type=int, default=0,
+                              help='Weak scaling: size the mesh to ranks x this many cells (default: strong scaling)')
+    sweep_parser.add_argument('--label', default=os.environ.get("SCALING_LABEL", ""),
+                              help='Name for this image / MPI stack in comparisons (default: the run ID)')
+    sweep_parser.add_argument('--image-prefix', dest='image_prefix', default=os.environ.get("IMAGE_PREFIX", IMAGE_PREFIX),
+                              help=f'Image repository (default: {IMAGE_PREFIX})')
+    sweep_parser.add_argument('--namespace', default=os.environ.get("NAMESPACE", "default"),
+                              help='Kubernetes namespace of the pods (default: default)')
+    sweep_parser.add_argument('--results', default=os.environ.get("SCALING_RESULTS", "scaling"),
+                              help='Directory for result files (default: scaling)')
+    sweep_parser.add_argument('--run-id', dest='run_id', default=time.strftime('%Y%m%d%H%M%S'),
+                              help='Run ID, also used for the stage cache stats (default: timestamp)')
+
+    analyze_parser = subparsers.add_parser('analyze', help='Compute speed-up and efficiency curves')
+    analyze_parser.add_argument('files', nargs='+', help='Result files from sweep')
+    analyze_parser.add_argument('--efficiency', type=float, default=0.7,
+                                help='Minimum parallel efficiency for a recommended rank count (default: 0.7)')
+    analyze_parser.add_argument('--out', help='Write the curves and recommendations as JSON')
+    return parser.parse_args()
+
+
+def main():
+    """Run a scaling sweep or analyze its results."""
+    args = parse_arguments()
+    try:
+        if args.command == 'sweep':
+            sweep(args)
+            return 0
+        return analyze(args)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Scaling {args.command} failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+#!/bin/bash
+
+# Compare uncollated and collated parallel I/O on the snappyHexMesh stage
+# Usage: ./bench_io.sh [rank counts...] (default: 8 32 128)
+#   IO_RANKS: I/O ranks for the collated runs (default: one per 16 ranks)
+# Each run starts from a fresh prep with the stage cache disabled; the master pod
+# reports wall time, mesh write time and the files/directories under the case
+RANKS=${@:-8 32 128}
+NAMESPACE=${NAMESPACE:-default}
+RESULTS=${RESULTS:-io_bench_$(date +%Y%m%d%H%M%S).txt}
+IMAGE_PREFIX=blik6126287/amazonlinux2023_openfoam12
+
+# Run a job and print its master pod log
+submit_and_log() {
+    LOG=$(mktemp)
+    ./submit2.py --disable-ssl --env STAGE_CACHE=false --env FOAM_IO_STATS=true "$@" 2>&1 | tee "$LOG" >&2
+    MASTER_JOB_ID=$(grep -o "Master job ID: [a-z0-9]*" "$LOG" | awk '{print $4}')
+    rm -f "$LOG"
+    [ -n "$MASTER_JOB_ID" ] && kubectl -n "$NAMESPACE" logs "armada-${MASTER_JOB_ID}-0" 2>/dev/null
+}
+
+printf "%-12s %-6s %-9s %-10s %-12s %-8s %-8s\n" "handler" "ranks" "io_ranks" "stage_ms" "mesh_write_s" "files" "dirs" | tee "$RESULTS"
+for np in $RANKS; do
+    io_ranks=${IO_RANKS:-$(( (np + 15) / 16 ))}
+    for handler in uncollated collated; do
+        submit_and_log --job-set-prefix io-$handler-$np --file-handler "$handler" --io-ranks "$io_ranks" \
+            --env DECOMPOSE_RANKS="$np" --mpi-image "$IMAGE_PREFIX:motorBike_prep" > /dev/null
+        POD_LOG=$(submit_and_log --job-set-prefix io-$handler-$np --file-handler "$handler" --io-ranks "$io_ranks" \
+            --mpi-processes "$np" --mpi-image "$IMAGE_PREFIX:motorBike_05_parallel_snappyHexMesh")
+        # I/O stats (snappyHexMesh, <handler>): took N ms, mesh write W s, F files in D directories
+        STATS=$(echo "$POD_LOG" | grep "I/O stats (snappyHexMesh" | tail -1)
+        STAGE_MS=$(echo "$STATS" | grep -o "took [0-9]* ms" | awk '{print $2}')
+        WRITE_S=$(echo "$STATS" | grep -o "mesh write [0-9.]* s" | awk '{print $3}')
+        FILES=$(echo "$STATS" | grep -o "[0-9]* files" | awk '{print $1}')
+        DIRS=$(echo "$STATS" | grep -o "[0-9]* directories" | awk '{print $1}')
+        printf "%-12s %-6s %-9s %-10s %-12s %-8s %-8s\n" "$handler" "$np" \
+            "$([ "$handler" = collated ] && echo "$io_ranks" || echo "$np")" \
+            "${STAGE_MS:-n/a}" "${WRITE_S:-n/a}" "${FILES:-n/a}" "${DIRS:-n/a}" | tee -a "$RESULTS"
+    done
+done
+echo "Results written to $RESULTS"
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+#### targeted removal of the snappyHexMesh refinement level fields (stage 06)
+# post-step of the snappyHexMesh job: ./clean_levels.py --case .
+# standalone:                          ./clean_levels.py --case /app/shared/motorBike
+#
+# Every processor directory holds the same set of files, so one of them
+# (the first populated processorN, or collated processors<N> set) is listed to build a
+# manifest of the *level* files snappyHexMesh wrote: time directories,
+# <time>/polyMesh and constant/polyMesh only, never a recursive walk. The
+# manifest is then unlinked in every processor directory (and the undecomposed
+# case) with parallel workers. It is kept in the case so scratch staging can
+# drop the same files from the processor directories it copies back.
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("clean_levels")
+
+# Written into the case with the paths removed under each processor directory
+LEVEL_MANIFEST = "level_fields.json"
+
+
+def is_time_dir(name):
+    """Return True if name is an OpenFOAM time directory."""
+    try:
+        float(name)
+        return True
+    except ValueError:
+        return False
+
+
+def processor_dirs(case_dir):
+    """
+    List the decomposed directories of a case.
+
+    Returns:
+        processorN directories (uncollated) or processors<N>[_a-b] sets (collated),
+        relative to the case, in numeric order
+    """
+    names = os.listdir(case_dir)
+    collated = sorted(n for n in names if n.startswith("processors") and n[len("processors"):][:1].isdigit())
+    if collated:
+        return collated
+    return sorted((n for n in names if n.startswith("processor") and n[len("processor"):].isdigit()),
+                  key=lambda n: int(n[len("processor"):]))
+
+
+def level_files(root):
+    """
+    List the level files in the places snappyHexMesh writes them.
+
+    Args:
+        root: A processor directory, or the case itself
+
+    Returns:
+        Paths relative to root
+    """
+    places = ["constant/polyMesh"]
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            if is_time_dir(name) and os.path.isdir(os.path.join(root, name)):
+                places += [name, os.path.join(name, "polyMesh")]
+    found = []
+    for place in places:
+        try:
+            names = os.listdir(os.path.join(root, place))
+        except OSError:
+            continue
+        found += [os.path.join(place, n) for n in names
+                  if "level" in n.lower() and os.path.isfile(os.path.join(root, place, n))]
+    return sorted(found)
+
+
+def build_manifest(case_dir):
+    """
+    Build the level file manifest from one processor directory and the case.
+
+    Returns:
+        {"processors": [...], "processor_files": [...], "case_files": [...]}
+    """
+    processors = processor_dirs(case_dir)
+    # On scratch only this pod's processor directories are populated
+    populated = [p for p in processors if os.listdir(os.path.join(case_dir, p))]
+    return {
+        "processors": processors,
+        "processor_files": level_files(os.path.join(case_dir, populated[0])) if populated else [],
+        "case_files": level_files(case_dir),
+    }
+
+
+def unlink_all(paths, workers):
+    """
+    Unlink paths in parallel, ignoring ones that are already gone.
+
+    Returns:
+        Number of files removed
+    """
+    def unlink(path):
+        try:
+            os.unlink(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(unlink, paths))
+
+
+def remove_listed(root, manifest, workers):
+    """
+    Remove the manifest's processor files from every processor directory under root.
+
+    Args:
+        root: The case holding the processor directories
+        manifest: A manifest from build_manifest
+        workers: Number of parallel unlinks
+
+    Returns:
+        Number of files removed
+    """
+    paths = [os.path.join(root, processor, rel)
+             for processor in processor_dirs(root) for rel in manifest["processor_files"]]
+    return unlink_all(paths, workers)
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Remove the snappyHexMesh refinement level fields')
+    parser.add_argument('--case', dest='case_dir',
+                        default=os.path.join(os.environ.get("WORK_DIR", "/app/shared"), os.environ.get("TUTORIAL", "motorBike")),
+                        help='Case directory (default: $WORK_DIR/$TUTORIAL)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("CLEAN_WORKERS", "32")),
+                        help='Number of parallel unlinks (default: 32)')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Only write and log the manifest')
+    return parser.parse_args()
+
+
+def main():
+    """Build the level file manifest and remove the listed files."""
+    args = parse_arguments()
+    start = time.time()
+    try:
+        manifest = build_manifest(args.case_dir)
+        with open(os.path.join(args.case_dir, LEVEL_MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+    except OSError as e:
+        logger.error(f"Could not build the level field manifest for {args.case_dir}: {e}")
+        return 1
+    logger.info(f"Level fields per processor directory: {', '.join(manifest['processor_files']) or 'none'} "
+                f"({len(manifest['processors'])} processor directories, {len(manifest['case_files'])} in the case)")
+    if args.dry_run:
+        return 0
+    removed = remove_listed(args.case_dir, manifest, args.workers)
+    removed += unlink_all([os.path.join(args.case_dir, rel) for rel in manifest["case_files"]], args.workers)
+    logger.info(f"Removed {removed} level files in {int((time.time() - start) * 1000)} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+#### convergence-based early termination for foamRun
+# next to the solver (runParallel does this when FOAM_CONVERGE=true):
+#   ./converge.py watch --log log.foamRun --case .
+#
+# Follows log.foamRun with foam_log.py and stops the run once it has converged,
+# by any of:
+#   residual  every field's initial residual is below --residual
+#   plateau   no field's residual fell by more than --plateau-tolerance decades
+#             between the two halves of the last --window steps
+#   forces    Cd and Cl varied by less than --force-tolerance (relative) over
+#             the last --window force coefficient samples
+# The stop is a clean one: stopAt is set to writeNow in system/controlDict,
+# which the solver re-reads (runTimeModifiable), so it writes the current time
+# and exits. controlDict is restored when the watch ends, and run_summary.json
+# in the case records why it stopped and the iterations and core-hours saved.
+
+import os
+import re
+import sys
+import glob
+import json
+import math
+import time
+import signal
+import logging
+import argparse
+import threading
+
+from foam_log import LogFollower, LogParser, summarise
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("converge")
+
+# Written into the case when the watch ends
+RUN_SUMMARY = "run_summary.json"
+
+# Force coefficient output of the motorBike forceCoeffs function object
+FORCE_COEFFS_GLOB = "postProcessing/forceCoeffs*/*/forceCoeffs.dat"
+
+# Coefficients that must settle for the forces criterion
+FORCE_COEFFS = ["Cd", "Cl"]
+
+STOP_AT_RE = re.compile(r"^(\s*stopAt\s+)(\w+)(\s*;)", re.MULTILINE)
+
+
+def read_control(case_dir, entry):
+    """Read a scalar entry from system/controlDict, or None."""
+    with open(os.path.join(case_dir, "system", "controlDict")) as f:
+        match = re.search(rf"^\s*{entry}\s+([^;\s]+)\s*;", f.read(), re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def set_stop_at(case_dir, value):
+    """
+    Set stopAt in system/controlDict.
+
+    Returns:
+        The previous value
+    """
+    path = os.path.join(case_dir, "system", "controlDict")
+    with open(path) as f:
+        text = f.read()
+    match = STOP_AT_RE.search(text)
+    if not match:
+        raise ValueError(f"No stopAt entry in {path}")
+    # Write a new file and rename it over, so the solver never reads a partial controlDict
+    staging = f"{path}.converge-{os.getpid()}"
+    try:
+        with open(staging, "w") as f:
+            f.write(STOP_AT_RE.sub(rf"\g<1>{value}\g<3>", text, count=1))
+        os.replace(staging, path)
+    except OSError:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    return match.group(2)
+
+
+def residuals_below(steps, threshold):
+    """Return True if every field's latest initial residual is below threshold."""
+    residuals = steps[-1].get("residuals", {})
+    return bool(residuals) and all(value < threshold for value in residuals.values())
+
+
+def residuals_plateaued(steps, window, tolerance):
+    """
+    Return True if no field's residual is still falling.
+
+    The mean log10 residual of the older half of the window is compared with
+    the newer half; a drop of less than tolerance decades counts as flat.
+    """
+    if len(steps) < window:
+        return False
+    recent = steps[-window:]
+    half = window // 2
+    for field in recent[-1].get("residuals", {}):
+        values = [math.log10(max(s["residuals"][field], 1e-300)) for s in recent if field in s.get("residuals", {})]
+        if len(values) < window:
+            return False
+        if sum(values[:half]) / half - sum(values[half:]) / (len(values) - half) >= tolerance:
+            return False
+    return bool(recent[-1].get("residuals"))
+
+
+def forces_stable(samples, window, tolerance):
+    """
+    Return True if every force coefficient varied by less than tolerance (relative)
+    over the last window samples.
+    """
+    if len(samples) < window:
+        return False
+    recent = samples[-window:]
+    for name in FORCE_COEFFS:
+        values = [s[name] for s in recent if name in s]
+        if len(values) < window:
+            return False
+        mean = sum(values) / len(values)
+        if mean == 0 or (max(values) - min(values)) / abs(mean) >= tolerance:
+            return False
+    return True
+
+
+class ForceCoeffs:
+    """Follows the forceCoeffs output, which may only appear after the first write."""
+
+    def __init__(self, case_dir, path):
+        self.case_dir = case_dir
+        self.path = path
+        self.follower = None
+        self.columns = None
+        self.samples = []
+
+    def poll(self):
+        """Read newly written coefficient rows."""
+        if self.follower is None:
+            paths = [self.path] if self.path else sorted(glob.glob(os.path.join(self.case_dir, FORCE_COEFFS_GLOB)))
+            if not paths or not os.path.exists(paths[-1]):
+                return
+            self.follower = LogFollower(paths[-1])
+        for line in self.follower.poll():
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "#":
+                # Column header: "# Time Cd Cs Cl ..."
+                if len(fields) > 1 and fields[1] == "Time":
+                    self.columns = fields[1:]
+                continue
+            if self.columns:
+                try:
+                    self.samples.append(dict(zip(self.columns, (float(v) for v in fields))))
+                except ValueError:
+                    continue
+
+
+def write_summary(case_dir, summary):
+    """Write run_summary.json into the case."""
+    with open(os.path.join(case_dir, RUN_SUMMARY), "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Wrote {os.path.join(case_dir, RUN_SUMMARY)}")
+
+
+def watch(args):
+    """
+    Follow the solver log until it stops (SIGTERM) and stop the run on convergence.
+
+    Returns:
+        The run summary
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    criteria = [c.strip() for c in args.criteria.split(",") if c.strip()]
+    end_time = float(read_control(args.case_dir, "endTime") or 0)
+    delta_t = float(read_control(args.case_dir, "deltaT") or 1)
+    follower = LogFollower(args.log, from_end=True)
+    parser = LogParser("foamRun")
+    forces = ForceCoeffs(args.case_dir, args.force_coeffs)
+    steps = []
+    triggered = None
+    original_stop_at = None
+    start = time.time()
+    logger.info(f"Watching {args.log} for convergence ({', '.join(criteria)}), endTime {end_time}")
+
+    while True:
+        final = stopping.is_set()
+        steps += [r for r in map(parser.feed, follower.poll()) if r and "execution_time" in r]
+        if "forces" in criteria:
+            forces.poll()
+        if not triggered and len(steps) >= args.min_steps:
+            reason = None
+            if "residual" in criteria and residuals_below(steps, args.residual):
+                reason = f"initial residuals below {args.residual}"
+            elif "plateau" in criteria and residuals_plateaued(steps, args.window, args.plateau_tolerance):
+                reason = f"residuals flat over {args.window} steps"
+            elif "forces" in criteria and forces_stable(forces.samples, args.window, args.force_tolerance):
+                reason = f"{'/'.join(FORCE_COEFFS)} within {args.force_tolerance:.1%} over {args.window} samples"
+            if reason:
+                logger.info(f"Converged at time {steps[-1].get('time')} ({reason}), stopping with writeNow")
+                # Only a stop that reached the controlDict counts; otherwise the run goes on
+                # to endTime and the next poll tries again
+                try:
+                    original_stop_at = set_stop_at(args.case_dir, "writeNow")
+                    triggered = reason
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not stop the run: {e}")
+        if final:
+            break
+        stopping.wait(args.interval)
+
+    if original_stop_at:
+        set_stop_at(args.case_dir, original_stop_at)
+        logger.info(f"Restored stopAt {original_stop_at}")
+
+    summary = summarise(steps)
+    stopped_at = steps[-1].get("time", 0) if steps else 0
+    ranks = int(os.environ.get("MPI_TOTAL_SLOTS", os.environ.get("MPI_WORLD_SIZE", "1")))
+    steps_saved = max(0, int(round((end_time - stopped_at) / delta_t))) if triggered else 0
+    seconds_per_iteration = summary.get("seconds_per_iteration", 0)
+    summary.update({
+        "app": "foamRun",
+        "criteria": criteria,
+        "converged": bool(triggered),
+        "reason": triggered or "ran to endTime",
+        "stopped_at": stopped_at,
+        "end_time": end_time,
+        "ranks": ranks,
+        "iterations_saved": steps_saved,
+        "core_hours_used": round(summary.get("clock_time", time.time() - start) * ranks / 3600, 3),
+        "core_hours_saved": round(steps_saved * seconds_per_iteration * ranks / 3600, 3),
+    })
+    return summary
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Convergence-based early termination for foamRun')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    watch_parser = subparsers.add_parser('watch', help='Follow the solver log and stop it on convergence')
+    watch_parser.add_argument('--log', default="log.foamRun", help='Solver log (default: log.foamRun)')
+    watch_parser.add_argument('--case', dest='case_dir', default=os.getcwd(),
+                              help='Case directory (default: current directory)')
+    watch_parser.add_argument('--criteria', default=os.environ.get("CONVERGE_CRITERIA", "residual,plateau,forces"),
+                              help='Comma-separated: residual, plateau, forces (default: all)')
+    watch_parser.add_argument('--residual', type=float, default=float(os.environ.get("CONVERGE_RESIDUAL", "1e-5")),
+                              help='Initial residual threshold for every field (default: 1e-5)')
+    watch_parser.add_argument('--window', type=int, default=int(os.environ.get("CONVERGE_WINDOW", "50")),
+                              help='Steps (or force samples) in the plateau and forces windows (default: 50)')
+    watch_parser.add_argument('--plateau-tolerance', dest='plateau_tolerance', type=float,
+                              default=float(os.environ.get("CONVERGE_PLATEAU_TOLERANCE", "0.02")),
+                              help='Residual drop in decades below which the window counts as flat (default: 0.02)')
+    watch_parser.add_argument('--force-tolerance', dest='force_tolerance', type=float,
+                              default=float(os.environ.get("CONVERGE_FORCE_TOLERANCE", "0.005")),
+                              help='Relative Cd/Cl variation below which forces count as stable (default: 0.005)')
+    watch_parser.add_argument('--force-coeffs', dest='force_coeffs',
+                              help=f'forceCoeffs output file (default: {FORCE_COEFFS_GLOB})')
+    watch_parser.add_argument('--min-steps', dest='min_steps', type=int,
+                              default=int(os.environ.get("CONVERGE_MIN_STEPS", "100")),
+                              help='Steps before any criterion is checked (default: 100)')
+    watch_parser.add_argument('--interval', type=float, default=2.0,
+                              help='Seconds between polls (default: 2)')
+    return parser.parse_args()
+
+
+def main():
+    """Watch a foamRun log and stop the run once it has converged."""
+    args = parse_arguments()
+    try:
+        summary = watch(args)
+        write_summary(args.case_dir, summary)
+    except (OSError, ValueError) as e:
+        logger.error(f"Convergence watch failed: {e}")
+        return 1
+    logger.info(f"{summary['reason']}: stopped at {summary['stopped_at']} of {summary['end_time']}, "
+                f"{summary['iterations_saved']} iterations and {summary['core_hours_saved']} core-hours saved")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+#### streaming OpenFOAM log parser with live solver metrics
+# while the stage runs: ./foam_log.py follow --log log.foamRun --port 9102
+# after the run:        ./foam_log.py parse log.foamRun
+#
+# follow tails the logs by byte offset (each poll reads only what was appended
+# since the last one) and turns them into a compact time series, one JSON line
+# per time step in <log>.metrics.jsonl: time, ExecutionTime, ClockTime, Courant
+# numbers, and per-field initial residuals and iteration counts. The latest
+# values, seconds per iteration and a stall flag (log not growing) are served
+# as Prometheus text on http://<pod>:<port>/metrics.
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("foam_log")
+
+# Solver log lines
+TIME_RE = re.compile(r"^Time = ([0-9.eE+-]+)s?\s*$")
+COURANT_RE = re.compile(r"^Courant Number mean: ([0-9.eE+-]+) max: ([0-9.eE+-]+)")
+SOLVING_RE = re.compile(r"Solving for (\w+), Initial residual = ([0-9.eE+-]+), "
+                        r"Final residual = [0-9.eE+-]+, No Iterations (\d+)")
+EXECUTION_RE = re.compile(r"^ExecutionTime = ([0-9.eE+-]+) s\s+ClockTime = ([0-9.eE+-]+) s")
+# snappyHexMesh progress markers
+PHASE_RE = re.compile(r"^(\w[\w ]*? iteration \d+|Finished meshing in = [0-9.eE+-]+ s)")
+
+# Time steps averaged for the seconds-per-iteration gauge
+RATE_WINDOW = 10
+
+
+class LogParser:
+    """Turns solver log lines into one record per completed time step."""
+
+    def __init__(self, app):
+        self.app = app
+        self.current = {}
+        self.phase = None
+        self.steps = 0
+
+    def feed(self, line):
+        """
+        Consume one log line.
+
+        Args:
+            line: A complete line, without the newline
+
+        Returns:
+            A record when the line completes a time step, otherwise None
+        """
+        match = TIME_RE.match(line)
+        if match:
+            self.current = {"time": float(match.group(1)), "residuals": {}, "iterations": {}}
+            return None
+        match = COURANT_RE.match(line)
+        if match:
+            self.current["courant_mean"] = float(match.group(1))
+            self.current["courant_max"] = float(match.group(2))
+            return None
+        match = SOLVING_RE.search(line)
+        if match:
+            field = match.group(1)
+            # The first solve of a field in a step carries its initial residual;
+            # later correctors only add iterations
+            self.current.setdefault("residuals", {}).setdefault(field, float(match.group(2)))
+            iterations = self.current.setdefault("iterations", {})
+            iterations[field] = iterations.get(field, 0) + int(match.group(3))
+            return None
+        match = EXECUTION_RE.match(line)
+        if match:
+            record = dict(self.current, app=self.app, execution_time=float(match.group(1)),
+                          clock_time=float(match.group(2)))
+            self.current = {}
+            self.steps += 1
+            return record
+        match = PHASE_RE.match(line)
+        if match:
+            self.phase = match.group(1)
+            return {"app": self.app, "phase": self.phase, "wall": time.time()}
+        return None
+
+
+class LogFollower:
+    """Reads the lines appended to a log since the previous poll."""
+
+    def __init__(self, path, from_end=False):
+        self.path = path
+        # Lines already in an appended-to log belong to an earlier run
+        self.offset = os.path.getsize(path) if from_end and os.path.exists(path) else 0
+        self.start = self.offset
+        self.partial = b""
+        self.last_growth = time.time()
+
+    def poll(self):
+        """
+        Read newly appended complete lines.
+
+        Returns:
+            A list of decoded lines (empty if the log has not grown or does not exist yet)
+        """
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return []
+        if not data:
+            return []
+        self.offset += len(data)
+        self.last_growth = time.time()
+        data = self.partial + data
+        lines = data.split(b"\n")
+        # The last element is an unterminated line (or empty); keep it for the next poll
+        self.partial = lines.pop()
+        return [line.decode(errors="replace").rstrip("\r") for line in lines]
+
+
+class Metrics:
+    """Latest values per application, rendered as Prometheus text."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.apps = {}
+
+    def update(self, record):
+        """Fold a record into the latest values of its application."""
+        with self.lock:
+            state = self.apps.setdefault(record["app"], {"steps": 0, "history": [], "stalled": 0})
+            if "phase" in record:
+                state["phase"] = record["phase"]
+                return
+            state["steps"] += 1
+            state["last"] = record
+            state["last_step_at"] = time.time()
+            state["history"] = (state["history"] + [record["execution_time"]])[-(RATE_WINDOW + 1):]
+
+    def set_stalled(self, app, stalled):
+        """Set the stall flag of an application."""
+        with self.lock:
+            self.apps.setdefault(app, {"steps": 0, "history": [], "stalled": 0})["stalled"] = int(stalled)
+
+    def render(self):
+        """Return the metrics in Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for app, state in sorted(self.apps.items()):
+                label = f'app="{app}"'
+                lines.append(f"foam_steps_total{{{label}}} {state['steps']}")
+                lines.append(f"foam_stalled{{{label}}} {state['stalled']}")
+                if "phase" in state:
+                    lines.append(f'foam_phase_info{{{label},phase="{state["phase"]}"}} 1')
+                last = state.get("last")
+                if not last:
+                    continue
+                lines.append(f"foam_time{{{label}}} {last.get('time', 0)}")
+                lines.append(f"foam_execution_time_seconds{{{label}}} {last['execution_time']}")
+                lines.append(f"foam_clock_time_seconds{{{label}}} {last['clock_time']}")
+                lines.append(f"foam_last_step_age_seconds{{{label}}} {time.time() - state['last_step_at']:.1f}")
+                history = state["history"]
+                if len(history) > 1:
+                    rate = (history[-1] - history[0]) / (len(history) - 1)
+                    lines.append(f"foam_seconds_per_iteration{{{label}}} {rate:.6f}")
+                if "courant_max" in last:
+                    lines.append(f"foam_courant_mean{{{label}}} {last['courant_mean']}")
+                    lines.append(f"foam_courant_max{{{label}}} {last['courant_max']}")
+                for field, value in sorted(last.get("residuals", {}).items()):
+                    lines.append(f'foam_initial_residual{{{label},field="{field}"}} {value}')
+                for field, value in sorted(last.get("iterations", {}).items()):
+                    lines.append(f'foam_solver_iterations{{{label},field="{field}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics, port):
+    """
+    Serve /metrics in a background thread.
+
+    Returns:
+        The HTTP server
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
+
+
+def app_name(log_path):
+    """Return the application a log belongs to (log.foamRun -> foamRun)."""
+    name = os.path.basename(log_path)
+    return name[len("log."):] if name.startswith("log.") else name
+
+
+def read_records(path):
+    """
+    Parse a whole log.
+
+    Returns:
+        The list of records
+    """
+    parser = LogParser(app_name(path))
+    follower = LogFollower(path)
+    records = []
+    for line in follower.poll() + ([follower.partial.decode(errors="replace")] if follower.partial else []):
+        record = parser.feed(line)
+        if record:
+            records.append(record)
+    return records
+
+
+def summarise(records):
+    """
+    Summarise the time steps of a parsed log.
+
+    Returns:
+        {"steps", "execution_time", "clock_time", "seconds_per_iteration", "final_residuals"}
+    """
+    steps = [r for r in records if "execution_time" in r]
+    if not steps:
+        return {"steps": 0}
+    per_iteration = (steps[-1]["execution_time"] - steps[0]["execution_time"]) / (len(steps) - 1) if len(steps) > 1 \
+        else steps[0]["execution_time"]
+    return {
+        "steps": len(steps),
+        "execution_time": steps[-1]["execution_time"],
+        "clock_time": steps[-1]["clock_time"],
+        "seconds_per_iteration": round(per_iteration, 6),
+        "final_residuals": steps[-1].get("residuals", {}),
+    }
+
+
+def follow(logs, port, interval, stall_timeout, from_end):
+    """
+    Tail logs until SIGTERM/SIGINT, writing the time series and serving metrics.
+
+    Args:
+        logs: Log paths to follow
+        port: HTTP port for /metrics (0 disables)
+        interval: Seconds between polls
+        stall_timeout: Seconds without log growth before a log counts as stalled
+        from_end: Skip what the logs already contain
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    metrics = Metrics()
+    server = serve_metrics(metrics, port) if port else None
+    followed = [(LogFollower(path, from_end), LogParser(app_name(path)), f"{path}.metrics.jsonl") for path in logs]
+    stalled = {}
+    while True:
+        final = stopping.is_set()
+        for follower, parser, out_path in followed:
+            records = [r for r in map(parser.feed, follower.poll()) if r]
+            if records:
+                with open(out_path, "a") as out:
+                    for record in records:
+                        out.write(json.dumps(record, separators=(",", ":")) + "\n")
+                        metrics.update(record)
+            # Only a log that has started and then stops growing counts as stalled
+            is_stalled = follower.offset > follower.start and time.time() - follower.last_growth > stall_timeout
+            if is_stalled != stalled.get(parser.app, False):
+                if is_stalled:
+                    logger.warning(f"{follower.path} has not grown for {stall_timeout} s "
+                                   f"(last time step {parser.steps}, phase {parser.phase or '-'})")
+                else:
+                    logger.info(f"{follower.path} is growing again")
+                stalled[parser.app] = is_stalled
+                metrics.set_stalled(parser.app, is_stalled)
+        if final:
+            break
+        stopping.wait(interval)
+    if server:
+        server.shutdown()
+    for follower, parser, out_path in followed:
+        logger.info(f"{follower.path}: {parser.steps} time steps, {follower.offset - follower.start} bytes")
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Streaming OpenFOAM log parser with live solver metrics')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    follow_parser = subparsers.add_parser('follow', help='Tail logs and serve live metrics')
+    follow_parser.add_argument('--log', dest='logs', action='append', required=True,
+                               help='Log to follow (repeatable), e.g. log.foamRun')
+    follow_parser.add_argument('--port', type=int, default=int(os.environ.get("FOAM_LOG_METRICS_PORT", "0") or 0),
+                               help='HTTP port for /metrics (default: $FOAM_LOG_METRICS_PORT, 0 disables)')
+    follow_parser.add_argument('--interval', type=float, default=float(os.environ.get("FOAM_LOG_INTERVAL", "2")),
+                               help='Seconds between polls (default: 2)')
+    follow_parser.add_argument('--stall-timeout', dest='stall_timeout', type=float,
+                               default=float(os.environ.get("FOAM_LOG_STALL_TIMEOUT", "300")),
+                               help='Seconds without log growth before flagging a stall (default: 300)')
+    follow_parser.add_argument('--from-end', dest='from_end', action='store_true',
+                               help='Skip what the logs already contain (runParallel appends to them)')
+
+    parse_parser = subparsers.add_parser('parse', help='Parse finished logs and print a summary')
+    parse_parser.add_argument('logs', nargs='+', help='Logs to parse')
+    parse_parser.add_argument('--series', action='store_true',
+                              help='Print every record as JSON lines instead of the summary')
+    return parser.parse_args()
+
+
+def main():
+    """Follow or parse OpenFOAM logs."""
+    args = parse_arguments()
+    if args.command == 'follow':
+        try:
+            follow(args.logs, args.port, args.interval, args.stall_timeout, args.from_end)
+        except OSError as e:
+            logger.error(f"Could not follow {', '.join(args.logs)}: {e}")
+            return 1
+        return 0
+    for path in args.logs:
+        if not os.path.exists(path):
+            logger.error(f"{path} does not exist")
+            return 1
+        records = read_records(path)
+        if args.series:
+            for record in records:
+                print(json.dumps(record, separators=(",", ":")))
+        else:
+            print(json.dumps(dict(summarise(records), log=path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+#!/bin/bash
+
+# Sweep expired job set coordination directories from the shared mount
+# Job sets that submit2.py saw reach a terminal state (ledger) are passed to the
+# sweeper; anything else is only removed after the orphan retention window
+LEDGER=${JOBSET_LEDGER:-jobsets.log}
+GC_RETENTION_HOURS=${GC_RETENTION_HOURS:-24}
+GC_ORPHAN_RETENTION_HOURS=${GC_ORPHAN_RETENTION_HOURS:-168}
+# The list goes into one pod env var, which must stay under the kernel's 128 KiB
+# per-argument limit; older job sets beyond this fall back to the orphan retention
+GC_LEDGER_MAX=${GC_LEDGER_MAX:-3000}
+TERMINAL_JOB_SETS=$(awk '$4 != "timeout" && !seen[$2]++ {print $2}' "$LEDGER" 2>/dev/null | tail -n "$GC_LEDGER_MAX" | paste -sd, -)
+echo "Sweeping with $(echo "$TERMINAL_JOB_SETS" | tr ',' '\n' | grep -c .) terminal job sets from $LEDGER"
+
+# Ledger entries are pruned against the cutoffs taken before the sweep ran
+CUTOFF=$(date -d "-${GC_RETENTION_HOURS} hours" +%Y-%m-%dT%H:%M:%S)
+ORPHAN_CUTOFF=$(date -d "-${GC_ORPHAN_RETENTION_HOURS} hours" +%Y-%m-%dT%H:%M:%S)
+
+./submit2.py --disable-ssl --mpi-processes 1 --job-set-prefix gc-sweep \
+    --env GC_TERMINAL_JOB_SETS="$TERMINAL_JOB_SETS" \
+    --env GC_RETENTION_HOURS="$GC_RETENTION_HOURS" \
+    --env GC_ORPHAN_RETENTION_HOURS="$GC_ORPHAN_RETENTION_HOURS" \
+    --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_gc || exit $?
+
+# A job set that ended before the cutoff has just been swept, so its ledger entry
+# is no longer needed (timeout entries are only ever swept as orphans)
+if [ -f "$LEDGER" ]; then
+    awk -v cutoff="$CUTOFF" -v orphan_cutoff="$ORPHAN_CUTOFF" \
+        '($4 != "timeout" && $1 >= cutoff) || ($4 == "timeout" && $1 >= orphan_cutoff)' \
+        "$LEDGER" > "$LEDGER.tmp" && mv "$LEDGER.tmp" "$LEDGER"
+    echo "Ledger pruned to $(wc -l < "$LEDGER") entries"
+fi
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+#### mesh size scaling for benchmark workloads
+# ./mesh_scale.py --scale 8            (about 8x the tutorial cell count)
+# ./mesh_scale.py --cells 20000000     (about 20M cells)
+# ./mesh_scale.py --scale 27 --level-shift 1 --dry-run
+#
+# A cell count multiplier S becomes a linear refinement factor r = S^(1/3). By
+# default the blockMesh background resolution is multiplied by r in every
+# direction, and snappyHexMesh refines relative to that background. So every
+# region of the final mesh is r times finer and the cell count grows by about
+# S. --level-shift K instead moves K of those doublings into the
+# snappyHexMesh surface, feature and region levels: the background grows by
+# r / 2^K, and the extra cells go to the refined regions near the bike.
+# snappyHexMesh's maxLocalCells/maxGlobalCells limits are raised by S, so
+# refinement is not capped. The tutorial dictionaries are kept as *.orig and
+# every run scales from them, so the same factor always gives the same case.
+
+import os
+import re
+import sys
+import json
+import shutil
+import logging
+import argparse
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("mesh_scale")
+
+# Approximate cell count of the unscaled motorBike tutorial mesh
+BASE_CELLS = 350000
+
+# Supported range of the scaled cell count
+MIN_CELLS = 300000
+MAX_CELLS = 50000000
+
+# Written into the case with the applied scaling
+SCALE_RECORD = "system/meshScale.json"
+
+BLOCK_RE = re.compile(r"(hex\s*\([\d\s]+\)\s*(?:\w+\s*)?\(\s*)(\d+)(\s+)(\d+)(\s+)(\d+)(\s*\))")
+CELL_LIMIT_RE = re.compile(r"^(\s*(?:maxLocalCells|maxGlobalCells)\s+)(\d+)(\s*;)", re.MULTILINE)
+# level (min max);   level N;   levels ((distance N) ...);
+LEVEL_PAIR_RE = re.compile(r"(\blevel\s*\(\s*)(\d+)(\s+)(\d+)(\s*\))")
+LEVEL_RE = re.compile(r"(\blevel\s+)(\d+)(\s*;)")
+LEVELS_RE = re.compile(r"(\(\s*[0-9.eE+-]+\s+)(\d+)(\s*\))")
+
+
+def original(path):
+    """
+    Return the unscaled contents of a dictionary, saving them on first use.
+
+    Args:
+        path: Path of the dictionary
+
+    Returns:
+        The text of <path>.orig
+    """
+    if not os.path.exists(f"{path}.orig"):
+        shutil.copy2(path, f"{path}.orig")
+    with open(f"{path}.orig") as f:
+        return f.read()
+
+
+def scale_block_mesh(text, factor):
+    """
+    Multiply the cell counts of every blockMesh block.
+
+    Returns:
+        (scaled text, [(old cells, new cells) per block])
+    """
+    changes = []
+
+    def scale(match):
+        old = tuple(int(match.group(i)) for i in (2, 4, 6))
+        new = tuple(max(1, round(n * factor)) for n in old)
+        changes.append((old, new))
+        return (f"{match.group(1)}{new[0]}{match.group(3)}{new[1]}{match.group(5)}{new[2]}{match.group(7)}")
+
+    text = BLOCK_RE.sub(scale, text)
+    if not changes:
+        raise ValueError("No hex blocks found in blockMeshDict")
+    return text, changes
+
+
+def scale_snappy(text, cell_factor, level_shift):
+    """
+    Raise the cell limits and shift the refinement levels of snappyHexMeshDict.
+
+    Returns:
+        The scaled text
+    """
+    text = CELL_LIMIT_RE.sub(lambda m: f"{m.group(1)}{int(int(m.group(2)) * max(1.0, cell_factor))}{m.group(3)}", text)
+    if level_shift:
+        text = LEVEL_PAIR_RE.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + level_shift}{m.group(3)}"
+                                           f"{int(m.group(4)) + level_shift}{m.group(5)}", text)
+        text = LEVEL_RE.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + level_shift}{m.group(3)}", text)
+        # Only inside "levels (...)" entries, e.g. levels ((1E15 4));
+        text = re.sub(r"\blevels\s*\((?:[^()]*\([^()]*\))*[^()]*\)",
+                      lambda m: LEVELS_RE.sub(lambda n: f"{n.group(1)}{int(n.group(2)) + level_shift}{n.group(3)}",
+                                              m.group(0)), text)
+    return text
+
+
+def plan(scale, cells, level_shift):
+    """
+    Work out the scaling for a cell multiplier or a target cell count.
+
+    Returns:
+        (cell multiplier, background linear factor)
+    """
+    cell_factor = cells / BASE_CELLS if cells else scale
+    estimated = BASE_CELLS * cell_factor
+    if not MIN_CELLS * 0.9 <= estimated <= MAX_CELLS * 1.1:
+        raise ValueError(f"~{estimated / 1e6:.1f}M cells is outside the supported "
+                         f"{MIN_CELLS / 1e6:.1f}M-{MAX_CELLS / 1e6:.0f}M range")
+    linear = cell_factor ** (1 / 3)
+    background = linear / 2 ** level_shift
+    if background < 0.5:
+        raise ValueError(f"--level-shift {level_shift} is too large for a {linear:.2f}x linear refinement")
+    return cell_factor, background
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Scale the motorBike mesh size for benchmark workloads')
+    parser.add_argument('--scale', type=float, default=float(os.environ.get("MESH_SCALE", "1") or 1),
+                        help='Cell count multiplier over the tutorial mesh (default: $MESH_SCALE or 1)')
+    parser.add_argument('--cells', type=int, default=int(os.environ.get("MESH_CELLS", "0") or 0),
+                        help=f'Target cell count instead of --scale (default: $MESH_CELLS; base ~{BASE_CELLS})')
+    parser.add_argument('--level-shift', dest='level_shift', type=int,
+                        default=int(os.environ.get("MESH_LEVEL_SHIFT", "0") or 0),
+                        help='Refinement doublings moved from the background into snappyHexMesh levels (default: 0)')
+    parser.add_argument('--case-dir', dest='case_dir', default=os.getcwd(),
+                        help='Case directory (default: current directory)')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Only log the planned scaling')
+    return parser.parse_args()
+
+
+def main():
+    """Scale blockMeshDict and snappyHexMeshDict from the tutorial originals."""
+    args = parse_arguments()
+    block_mesh_dict = os.path.join(args.case_dir, "system", "blockMeshDict")
+    snappy_dict = os.path.join(args.case_dir, "system", "snappyHexMeshDict")
+    try:
+        cell_factor, background = plan(args.scale, args.cells, args.level_shift)
+        block_text, changes = scale_block_mesh(original(block_mesh_dict), background)
+        snappy_text = scale_snappy(original(snappy_dict), cell_factor, args.level_shift)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not scale the mesh: {e}")
+        return 1
+    for old, new in changes:
+        logger.info(f"Background block {old[0]}x{old[1]}x{old[2]} -> {new[0]}x{new[1]}x{new[2]}")
+    logger.info(f"Scale {cell_factor:.2f}x (~{BASE_CELLS * cell_factor / 1e6:.1f}M cells): background x{background:.3f}, "
+                f"refinement levels {'+' if args.level_shift >= 0 else ''}{args.level_shift}")
+    if args.dry_run:
+        return 0
+    with open(block_mesh_dict, "w") as f:
+        f.write(block_text)
+    with open(snappy_dict, "w") as f:
+        f.write(snappy_text)
+    with open(os.path.join(args.case_dir, SCALE_RECORD), "w") as f:
+        json.dump({"cell_factor": round(cell_factor, 4), "estimated_cells": int(BASE_CELLS * cell_factor),
+                   "background_factor": round(background, 4), "level_shift": args.level_shift,
+                   "blocks": [{"from": old, "to": new} for old, new in changes]}, f, indent=2)
+    logger.info(f"Scaled {block_mesh_dict} and {snappy_dict}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+#### parallel reconstruct and post-processing job array (stage 10)
+# submitter: ./postprocess.py run --shards 8 --utilities vtk functions
+# in the motorBike_10_postprocess pods (POST_STEP selects the step):
+#   ./postprocess.py mesh                          (reconstructPar -constant -noFields)
+#   ./postprocess.py shard --shard 3 --shards 8    (reconstructPar -time <shard 3> + utilities)
+#   ./postprocess.py merge --shards 8
+#
+# run first submits one mesh job, which reconstructs the mesh once. It then
+# submits --shards independent single-rank jobs at the same time. Each shard
+# takes a contiguous slice of the time directories in the first processor
+# directory. It reconstructs them with reconstructPar -time <list>, then runs
+# the chosen utilities in a view case postShards/shard<k>. The view case links
+# to constant, system and the shard's times, so every shard writes its own VTK
+# and postProcessing output. The merge job moves those outputs into the case:
+# VTK files get the case name. A function object writes its tables under
+# postProcessing/<func>/<start time>, and every shard starts at its own first
+# time, so those per-shard start time directories are folded into the earliest
+# one and their tables concatenated in time order. It then writes
+# postprocess.json with the times, timings and status of every shard. Latency
+# is the mesh job plus the slowest shard plus the merge.
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from clean_levels import is_time_dir, processor_dirs
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("postprocess")
+
+IMAGE = "blik6126287/amazonlinux2023_openfoam12:motorBike_10_postprocess"
+
+# Per-shard view cases and status files
+SHARDS_DIR = "postShards"
+# Written into the case by merge
+POST_RECORD = "postprocess.json"
+
+# Post-processing utilities, run in the shard's view case on its times
+#   vtk        foamToVTK
+#   functions  every function object of controlDict (foamPostProcess without -func)
+#   func:NAME  one function object, e.g. func:forceCoeffs
+UTILITIES = {
+    "vtk": ["foamToVTK", "-time", "{times}"],
+    "functions": ["foamPostProcess", "-solver", "{solver}", "-time", "{times}"],
+}
+
+# Text tables that are concatenated when several shards write the same file
+# (as are files without an extension, e.g. probes output)
+TABLE_SUFFIXES = (".dat", ".csv", ".xy", ".raw")
+
+MASTER_RE = re.compile(r"Master job ID: ([a-z0-9]+)")
+
+
+def case_times(case_dir, with_zero):
+    """Return the time directories of the decomposed case, oldest first."""
+    roots = processor_dirs(case_dir)
+    if not roots:
+        raise ValueError(f"{case_dir} is not decomposed")
+    root = os.path.join(case_dir, roots[0])
+    times = [n for n in os.listdir(root) if is_time_dir(n) and os.path.isdir(os.path.join(root, n))]
+    return sorted((t for t in times if with_zero or float(t) != 0), key=float)
+
+
+def shard_times(times, shard, shards):
+    """Return the contiguous slice of times that belongs to a shard."""
+    return times[shard * len(times) // shards:(shard + 1) * len(times) // shards]
+
+
+def read_solver(case_dir):
+    """Return the solver module named in system/controlDict."""
+    with open(os.path.join(case_dir, "system", "controlDict")) as f:
+        match = re.search(r"^solver\s+(\w+)\s*;", f.read(), re.MULTILINE)
+    return match.group(1) if match else "incompressibleFluid"
+
+
+def run_logged(command, cwd, log):
+    """
+    Run an OpenFOAM utility with its output in a log file.
+
+    Returns:
+        (exit status, seconds)
+    """
+    start = time.time()
+    with open(log, "w") as f:
+        status = subprocess.run(command, cwd=cwd, stdout=f, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL).returncode
+    return status, round(time.time() - start, 1)
+
+
+def utility_command(utility, times, solver):
+    """Return the command line of a utility for a list of times."""
+    if utility.startswith("func:"):
+        template = ["foamPostProcess", "-solver", "{solver}", "-func", utility[len("func:"):], "-time", "{times}"]
+    elif utility in UTILITIES:
+        template = UTILITIES[utility]
+    else:
+        raise ValueError(f"Unknown utility {utility} (vtk, functions, func:NAME)")
+    return [part.format(times=",".join(times), solver=solver) for part in template]
+
+
+def view_case(case_dir, name, times):
+    """
+    Build a view case that links to the case's constant, system and the given times.
+
+    Returns:
+        The path of the view case
+    """
+    view = os.path.join(case_dir, SHARDS_DIR, name)
+    if os.path.isdir(view):
+        shutil.rmtree(view)
+    os.makedirs(view)
+    for entry in ["constant", "system"] + times:
+        os.symlink(os.path.join("..", "..", entry), os.path.join(view, entry))
+    return view
+
+
+def shard(args):
+    """
+    Reconstruct one shard's times and post-process them.
+
+    Returns:
+        The shard status record
+    """
+    times = shard_times(case_times(args.case_dir, args.with_zero), args.shard, args.shards)
+    name = f"shard{args.shard}"
+    record = {"shard": args.shard, "times": times, "steps": [], "status": 0}
+    os.makedirs(os.path.join(args.case_dir, SHARDS_DIR), exist_ok=True)
+    if not times:
+        logger.info(f"Shard {args.shard}/{args.shards} has no times")
+    else:
+        logger.info(f"Shard {args.shard}/{args.shards}: {len(times)} times, {times[0]} to {times[-1]}")
+        status, seconds = run_logged(["reconstructPar", "-time", ",".join(times)], args.case_dir,
+                                     os.path.join(args.case_dir, SHARDS_DIR, f"log.reconstructPar.{name}"))
+        record["steps"].append({"step": "reconstructPar", "status": status, "seconds": seconds})
+        if status == 0:
+            view = view_case(args.case_dir, name, times)
+            solver = read_solver(args.case_dir)
+            for utility in args.utilities:
+                status, seconds = run_logged(utility_command(utility, times, solver), view,
+                                             os.path.join(view, f"log.{utility.replace(':', '.')}"))
+                record["steps"].append({"step": utility, "status": status, "seconds": seconds})
+                if status != 0:
+                    break
+        record["status"] = status
+        for step in record["steps"]:
+            logger.info(f"Shard {args.shard} {step['step']} took {step['seconds']} s (status {step['status']})")
+    with open(os.path.join(args.case_dir, SHARDS_DIR, f"{name}.json"), "w") as f:
+        json.dump(record, f, indent=2)
+    return record
+
+
+def merge_file(source, destination, case_name, shard_name):
+    """
+    Move one shard output file into the case.
+
+    Returns:
+        "moved", "appended" or "skipped"
+    """
+    directory, base = os.path.split(destination)
+    if base.startswith(f"{shard_name}_") or base.startswith(f"{shard_name}."):
+        base = case_name + base[len(shard_name):]
+    destination = os.path.join(directory, base)
+    os.makedirs(directory, exist_ok=True)
+    if not os.path.exists(destination):
+        shutil.move(source, destination)
+        return "moved"
+    if base.endswith(TABLE_SUFFIXES) or "." not in base:
+        with open(source) as f_in, open(destination, "a") as f_out:
+            f_out.writelines(line for line in f_in if not line.startswith("#"))
+        return "appended"
+    return "skipped"
+
+
+def start_time_dirs(shards_dir, statuses):
+    """
+    Find the postProcessing directories that hold one start time directory per shard.
+
+    A function object writing tables has a single <start time> subdirectory in
+    each shard, named after the shard's first time. Functions that write a
+    directory per write time (sets, surfaces) have several in some shard and are
+    left as they are; so is anything only seen in single-time shards.
+
+    Returns:
+        Each such directory (relative to the view case) mapped to its earliest start time
+    """
+    found = {}
+    per_write_time = set()
+    for status in statuses:
+        # A single time is both layouts, so such a shard says nothing either way
+        if len(status["times"]) < 2:
+            continue
+        view = os.path.join(shards_dir, f"shard{status['shard']}")
+        for root, dirs, _ in os.walk(os.path.join(view, "postProcessing")):
+            times = [d for d in dirs if is_time_dir(d)]
+            if not times:
+                continue
+            rel = os.path.relpath(root, view)
+            if len(times) > 1 or times[0] != status["times"][0]:
+                per_write_time.add(rel)
+            elif rel not in found or float(times[0]) < float(found[rel]):
+                found[rel] = times[0]
+            dirs[:] = [d for d in dirs if not is_time_dir(d)]
+    return {rel: start for rel, start in found.items() if rel not in per_write_time}
+
+
+def merge(args):
+    """
+    Merge the shard outputs into the case.
+
+    Returns:
+        The post-processing record
+    """
+    shards_dir = os.path.join(args.case_dir, SHARDS_DIR)
+    case_name = os.path.basename(os.path.abspath(args.case_dir))
+    record = {"merged": time.strftime('%Y-%m-%dT%H:%M:%S'), "shards": [], "files": {}}
+    for index in range(args.shards):
+        name = f"shard{index}"
+        try:
+            with open(os.path.join(shards_dir, f"{name}.json")) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            status = {"shard": index, "times": [], "steps": [], "status": None}
+        record["shards"].append(status)
+    starts = start_time_dirs(shards_dir, record["shards"])
+    record["start_time_dirs"] = starts
+    for status in record["shards"]:
+        name = f"shard{status['shard']}"
+        view = os.path.join(shards_dir, name)
+        if not os.path.isdir(view):
+            continue
+        # Shards are merged in time order, so appended tables stay sorted
+        for top in ("VTK", "postProcessing"):
+            for root, _, names in os.walk(os.path.join(view, top)):
+                rel_root = os.path.relpath(root, view)
+                function_dir, start = os.path.split(rel_root)
+                if function_dir in starts and is_time_dir(start):
+                    rel_root = os.path.join(function_dir, starts[function_dir])
+                for file_name in sorted(names):
+                    source = os.path.join(root, file_name)
+                    destination = os.path.join(args.case_dir, rel_root, file_name)
+                    result = merge_file(source, destination, case_name, name)
+                    record["files"][result] = record["files"].get(result, 0) + 1
+    failed = [s["shard"] for s in record["shards"] if s["status"] != 0]
+    record["failed_shards"] = failed
+    with open(os.path.join(args.case_dir, POST_RECORD), "w") as f:
+        json.dump(record, f, indent=2)
+    if not failed and not args.keep_shards:
+        shutil.rmtree(shards_dir)
+    return record
+
+
+def submit(image, job_set_prefix, env, extra):
+    """
+    Run submit2.py for one single-rank job.
+
+    Returns:
+        (submit2 exit code, master job ID or None)
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "submit2.py"),
+               "--disable-ssl", "--job-set-prefix", job_set_prefix, "--mpi-image", image]
+    for name, value in env.items():
+        command += ["--env", f"{name}={value}"]
+    result = subprocess.run(command + extra, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    match = MASTER_RE.search(result.stdout)
+    return result.returncode, match.group(1) if match else None
+
+
+def run(shards, utilities, image, run_id, extra):
+    """
+    Submit the mesh job, the shard jobs (concurrently) and the merge job.
+
+    Args:
+        shards: Number of shard jobs
+        utilities: Utilities each shard runs after reconstructPar
+        image: The post-processing image
+        run_id: Run ID, in the job set prefixes
+        extra: Additional submit2.py arguments (e.g. --queue-name)
+
+    Returns:
+        0 on success, otherwise the first failing submit2.py exit code
+    """
+    env = {"RUN_ID": run_id, "POST_SHARDS": shards, "POST_UTILITIES": " ".join(utilities)}
+    start = time.time()
+    status, _ = submit(image, f"post-mesh-{run_id}", dict(env, POST_STEP="mesh"), extra)
+    if status != 0:
+        logger.error(f"Mesh reconstruction failed (exit code {status})")
+        return status
+    logger.info(f"Mesh reconstructed after {time.time() - start:.0f} s, submitting {shards} shards")
+
+    def run_shard(index):
+        return submit(image, f"post-shard{index}-{run_id}", dict(env, POST_STEP="shard", POST_SHARD=index), extra)
+
+    with ThreadPoolExecutor(max_workers=shards) as pool:
+        results = list(pool.map(run_shard, range(shards)))
+    failed = [index for index, (code, _) in enumerate(results) if code != 0]
+    logger.info(f"Shards finished after {time.time() - start:.0f} s"
+                + (f", failed: {' '.join(map(str, failed))}" if failed else ""))
+    # The merge still runs, so the outputs of the good shards are kept
+    status, _ = submit(image, f"post-merge-{run_id}", dict(env, POST_STEP="merge"), extra)
+    logger.info(f"Post-processing took {time.time() - start:.0f} s with {shards} shards")
+    if failed:
+        return results[failed[0]][0]
+    return status
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Parallel reconstruct and post-processing job array')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(subparser):
+        subparser.add_argument('--shards', type=int, default=int(os.environ.get("POST_SHARDS", "4")),
+                               help='Number of shard jobs (default: 4)')
+        subparser.add_argument('--utilities', nargs='*', default=os.environ.get("POST_UTILITIES", "vtk").split(),
+                               help='Utilities after reconstructPar: vtk, functions, func:NAME (default: vtk)')
+
+    run_parser = subparsers.add_parser('run', help='Submit the mesh, shard and merge jobs')
+    add_common(run_parser)
+    run_parser.add_argument('--image', default=os.environ.get("POST_IMAGE", IMAGE),
+                            help=f'Post-processing image (default: {IMAGE})')
+    run_parser.add_argument('--run-id', dest='run_id', default=os.environ.get("RUN_ID", time.strftime('%Y%m%d%H%M%S')),
+                            help='Run ID (default: timestamp)')
+    run_parser.add_argument('--queue-name', dest='queue_name', default=os.environ.get("QUEUE_NAME", ""),
+                            help='Queue for every job (default: one per job, as submit2.py)')
+
+    for name, help_text in (('mesh', 'Reconstruct the mesh once'),
+                            ('shard', "Reconstruct and post-process one shard's times"),
+                            ('merge', 'Merge the shard outputs into the case')):
+        subparser = subparsers.add_parser(name, help=help_text)
+        add_common(subparser)
+        subparser.add_argument('--case', dest='case_dir', default=os.getcwd(),
+                               help='Case directory (default: current directory)')
+        if name == 'shard':
+            subparser.add_argument('--shard', type=int, default=int(os.environ.get("POST_SHARD", "0")),
+                                   help='Index of this shard (default: $POST_SHARD)')
+            subparser.add_argument('--with-zero', dest='with_zero', action='store_true',
+                                   help='Include time 0')
+        if name == 'merge':
+            subparser.add_argument('--keep-shards', dest='keep_shards', action='store_true',
+                                   help=f'Keep {SHARDS_DIR} after a successful merge')
+    return parser.parse_args()
+
+
+def main():
+    """Run a post-processing step, or submit them all."""
+    args = parse_arguments()
+    try:
+        if args.command == 'run':
+            return run(args.shards, args.utilities, args.image, args.run_id,
+                       ["--queue-name", args.queue_name] if args.queue_name else [])
+        if args.command == 'mesh':
+            status, seconds = run_logged(["reconstructPar", "-constant", "-noFields"], args.case_dir,
+                                         os.path.join(args.case_dir, "log.reconstructPar.mesh"))
+            logger.info(f"Mesh reconstruction took {seconds} s (status {status})")
+            return status
+        if args.command == 'shard':
+            return 1 if shard(args)["status"] else 0
+        record = merge(args)
+    except (OSError, ValueError) as e:
+        logger.error(f"Post-processing {args.command} failed: {e}")
+        return 1
+    logger.info(f"Merged {len(record['shards'])} shards: "
+                + ", ".join(f"{count} files {result}" for result, count in sorted(record['files'].items())))
+    if record["failed_shards"]:
+        logger.error(f"Shards failed or missing: {' '.join(map(str, record['failed_shards']))}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+#### liveness and completion channel between the MPI master (rank 0) and its workers
+# master: ./rendezvous.py serve --port 29500 --world-size 8
+# worker: ./rendezvous.py watch --host 10.0.1.2 --port 29500 --rank 3
+# master: ./rendezvous.py notify --port 29500 --status 0
+#
+# Workers hold one TCP connection to the coordinator on rank 0. The coordinator
+# sends a heartbeat line every HEARTBEAT_INTERVAL seconds on each connection from
+# its own thread, so a slow or blocked worker socket never delays the others; a
+# dropped connection or a missed heartbeat window means the other side is gone. When the task ends
+# the master pushes its exit status to every worker and reports how long each
+# worker took to acknowledge it. notify exits 0 only once every worker of the
+# world size has acknowledged, so rank 0 knows no worker can still be reading
+# the shared coordination files.
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("rendezvous")
+
+# Heartbeat settings - a worker declares the master lost after HEARTBEAT_TIMEOUT
+# The default spans several intervals and still detects a failure in under a
+# second; on CPU-throttled pods set HEARTBEAT_TIMEOUT to a few seconds instead
+HEARTBEAT_INTERVAL = 0.2
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", "0.9"))
+
+# How long the master waits for workers to acknowledge completion
+ACK_TIMEOUT = 2.0
+
+# Worker exit codes
+EXIT_OK = 0
+EXIT_MASTER_FAILED = 1
+EXIT_CONNECT_FAILED = 2
+EXIT_MASTER_LOST = 3
+EXIT_RELEASED = 4
+
+# notify exit codes
+EXIT_NOTIFY_FAILED = 1
+EXIT_PARTIAL_ACK = 2
+
+
+def enable_keepalive(sock):
+    """
+    Enable aggressive TCP keepalive so dead peers are noticed by the kernel too.
+
+    Args:
+        sock: The connected socket
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 2)
+
+
+def read_lines(conn, buffer):
+    """
+    Read from a socket until at least one complete line is buffered.
+
+    Args:
+        conn: The socket to read from
+        buffer: Bytes left over from the previous read
+
+    Returns:
+        (lines, buffer, closed) - complete lines, the remaining partial line and
+        whether the peer closed the connection
+    """
+    while b"\n" not in buffer:
+        data = conn.recv(4096)
+        if not data:
+            return [], buffer, True
+        buffer += data
+    *lines, buffer = buffer.split(b"\n")
+    return [line.decode(errors="replace").strip() for line in lines], buffer, False
+
+
+class Coordinator:
+    """Rank-0 side of the liveness channel."""
+
+    def __init__(self, port, world_size):
+        self.port = port
+        self.world_size = world_size
+        self.clients = {}
+        self.send_locks = {}
+        self.acks = {}
+        self.lock = threading.Lock()
+        self.acked = threading.Condition(self.lock)
+        self.stopping = threading.Event()
+        self.released = threading.Event()
+        self.released_at = None
+
+    def send(self, rank, message):
+        """
+        Send one line to a worker, dropping it if the connection is gone.
+
+        Args:
+            rank: The worker rank
+            message: The line to send (without newline)
+
+        Returns:
+            True if the line was sent, False otherwise
+        """
+        with self.lock:
+            conn = self.clients.get(rank)
+            send_lock = self.send_locks.get(rank)
+        if conn is None:
+            return False
+        try:
+            # One lock per connection, so a blocked send only holds up its own worker
+            with send_lock:
+                conn.sendall(f"{message}\n".encode())
+            return True
+        except OSError:
+            self.drop(rank, "send failed")
+            return False
+
+    def broadcast(self, message):
+        """Send one line to every connected worker."""
+        with self.lock:
+            ranks = list(self.clients)
+        for rank in ranks:
+            self.send(rank, message)
+
+    def drop(self, rank, reason):
+        """Forget a worker connection and report it if the job is still running."""
+        with self.lock:
+            conn = self.clients.pop(rank, None)
+            self.send_locks.pop(rank, None)
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except OSError:
+            pass
+        if not self.stopping.is_set() and not self.released.is_set():
+            logger.error(f"Lost connection to rank {rank} ({reason})")
+
+    def record_ack(self, rank):
+        """Record when a worker acknowledged the completion message."""
+        with self.acked:
+            if self.released_at is not None and rank not in self.acks:
+                self.acks[rank] = (time.monotonic() - self.released_at) * 1000
+                self.acked.notify_all()
+
+    def complete(self, status, notifier):
+        """
+        Push the master's exit status to every worker and report the skew.
+
+        Args:
+            status: The master's exit status
+            notifier: The local connection that requested the release
+        """
+        with self.acked:
+            expected = len(self.clients)
+            self.released_at = time.monotonic()
+        self.released.set()
+        self.broadcast(f"DONE {status}")
+        deadline = time.monotonic() + ACK_TIMEOUT
+        with self.acked:
+            while len(self.acks) < expected and time.monotonic() < deadline:
+                self.acked.wait(deadline - time.monotonic())
+            latencies = sorted(self.acks.values())
+        if latencies:
+            logger.info(f"Completion (status {status}) acknowledged by {len(latencies)}/{expected} workers; "
+                        f"skew min {latencies[0]:.1f} ms, median {latencies[len(latencies) // 2]:.1f} ms, "
+                        f"max {latencies[-1]:.1f} ms")
+            summary = f"ACKED {len(latencies)} {expected} {latencies[-1]:.1f} {self.world_size - 1}"
+        else:
+            logger.info(f"Completion (status {status}) sent, {expected} workers connected")
+            summary = f"ACKED 0 {expected} 0 {self.world_size - 1}"
+        if len(latencies) < expected:
+            logger.warning(f"{expected - len(latencies)} workers did not acknowledge within {ACK_TIMEOUT}s")
+        try:
+            notifier.sendall(f"{summary}\n".encode())
+        except OSError:
+            pass
+
+    def handle(self, conn, addr):
+        """
+        Register a worker (or serve a local completion request) and watch it.
+
+        Args:
+            conn: The accepted socket
+            addr: The peer address
+        """
+        enable_keepalive(conn)
+        conn.settimeout(HEARTBEAT_TIMEOUT)
+        try:
+            lines, buffer, closed = read_lines(conn, b"")
+        except OSError:
+            lines, buffer, closed = [], b"", True
+        first = lines[0].split() if lines else []
+        if len(first) == 2 and first[0] == "DONE":
+            conn.settimeout(None)
+            self.complete(first[1], conn)
+            conn.close()
+            return
+        if len(first) != 2 or first[0] != "HELLO":
+            logger.warning(f"Ignoring unexpected connection from {addr[0]}")
+            conn.close()
+            return
+        rank = first[1]
+        with self.lock:
+            self.clients[rank] = conn
+            self.send_locks[rank] = threading.Lock()
+            registered = len(self.clients)
+        logger.info(f"Rank {rank} connected from {addr[0]} ({registered}/{self.world_size - 1} workers)")
+        threading.Thread(target=self.heartbeat, args=(rank, conn), daemon=True).start()
+        # Workers only talk to acknowledge completion; an empty read means the connection dropped
+        while not self.stopping.is_set():
+            try:
+                lines, buffer, closed = read_lines(conn, buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                closed = True
+            for line in lines:
+                if line == "ACK":
+                    self.record_ack(rank)
+            if closed:
+                self.drop(rank, "connection closed")
+                return
+
+    def heartbeat(self, rank, conn):
+        """Send heartbeats to one worker until it is dropped or the coordinator stops."""
+        while not self.stopping.is_set():
+            with self.lock:
+                if self.clients.get(rank) is not conn:
+                    return
+            if not self.send(rank, "PING"):
+                return
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def serve(self):
+        """Accept worker connections until SIGTERM, then release the workers."""
+        listener = socket.create_server(("", self.port))
+        listener.settimeout(0.1)
+        logger.info(f"Coordinator listening on port {self.port} for {self.world_size - 1} workers")
+        while not self.stopping.is_set():
+            try:
+                conn, addr = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self.handle, args=(conn, addr), daemon=True).start()
+        listener.close()
+        logger.info("Coordinator stopping, releasing workers")
+        self.broadcast("BYE")
+        with self.lock:
+            conns = list(self.clients.values())
+            self.clients.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+def connect(host, port, timeout):
+    """
+    Connect to the coordinator, retrying until it is listening.
+
+    Args:
+        host: The coordinator address
+        port: The coordinator port
+        timeout: Seconds to keep retrying
+
+    Returns:
+        The connected socket, or None if the coordinator never came up
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            sock = socket.create_connection((host, port), timeout=5)
+            enable_keepalive(sock)
+            return sock
+        except OSError:
+            time.sleep(0.5)
+    return None
+
+
+def watch(host, port, rank, connect_timeout):
+    """
+    Hold a connection to the coordinator until it releases or loses us.
+
+    Args:
+        host: The coordinator address
+        port: The coordinator port
+        rank: This worker's rank
+        connect_timeout: Seconds to wait for the coordinator to come up
+
+    Returns:
+        The worker exit code
+    """
+    sock = connect(host, port, connect_timeout)
+    if sock is None:
+        logger.error(f"Could not reach coordinator at {host}:{port} within {connect_timeout}s")
+        return EXIT_CONNECT_FAILED
+    sock.sendall(f"HELLO {rank}\n".encode())
+    sock.settimeout(HEARTBEAT_TIMEOUT)
+    buffer = b""
+    logger.info(f"Rank {rank} connected to coordinator at {host}:{port}")
+    while True:
+        try:
+            lines, buffer, closed = read_lines(sock, buffer)
+        except socket.timeout:
+            logger.error(f"No heartbeat from master for {HEARTBEAT_TIMEOUT}s")
+            return EXIT_MASTER_LOST
+        except OSError as e:
+            logger.error(f"Connection to master failed: {e}")
+            return EXIT_MASTER_LOST
+        for line in lines:
+            fields = line.split()
+            if fields and fields[0] == "DONE":
+                try:
+                    sock.sendall(b"ACK\n")
+                except OSError:
+                    pass
+                status = fields[1] if len(fields) > 1 else "unknown"
+                logger.info(f"Master finished with status {status}")
+                return EXIT_OK if status == "0" else EXIT_MASTER_FAILED
+            if line == "BYE":
+                logger.info("Master released workers without a completion status")
+                return EXIT_RELEASED
+        if closed:
+            logger.error("Master closed the connection without releasing workers")
+            return EXIT_MASTER_LOST
+
+
+def notify(port, status):
+    """
+    Ask the local coordinator to push the master's exit status to all workers.
+
+    Args:
+        port: The coordinator port
+        status: The master's exit status
+
+    Returns:
+        0 if every worker of the world size acknowledged, 2 if some did not,
+        1 if the coordinator could not be reached
+    """
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=ACK_TIMEOUT + 5) as sock:
+            sock.sendall(f"DONE {status}\n".encode())
+            lines, _, _ = read_lines(sock, b"")
+    except OSError as e:
+        logger.error(f"Could not notify workers: {e}")
+        return EXIT_NOTIFY_FAILED
+    fields = lines[0].split() if lines else []
+    if len(fields) != 5 or fields[0] != "ACKED":
+        logger.warning("Coordinator did not report the acknowledgements")
+        return EXIT_PARTIAL_ACK
+    logger.info(f"Workers released: {fields[1]}/{fields[2]} acknowledged, max skew {fields[3]} ms")
+    if int(fields[1]) < int(fields[4]):
+        logger.warning(f"Only {fields[1]} of {fields[4]} workers acknowledged completion")
+        return EXIT_PARTIAL_ACK
+    return 0
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='MPI master/worker liveness channel')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the coordinator on rank 0')
+    serve_parser.add_argument('--port', type=int, default=29500,
+                              help='Port to listen on (default: 29500)')
+    serve_parser.add_argument('--world-size', dest='world_size', type=int, required=True,
+                              help='Number of MPI ranks including the master')
+    watch_parser = subparsers.add_parser('watch', help='Hold a worker connection to rank 0')
+    watch_parser.add_argument('--host', required=True,
+                              help='Coordinator address')
+    watch_parser.add_argument('--port', type=int, default=29500,
+                              help='Coordinator port (default: 29500)')
+    watch_parser.add_argument('--rank', required=True,
+                              help='This worker rank')
+    watch_parser.add_argument('--connect-timeout', dest='connect_timeout', type=int, default=300,
+                              help='Seconds to wait for the coordinator (default: 300)')
+    notify_parser = subparsers.add_parser('notify', help='Push the master exit status to all workers')
+    notify_parser.add_argument('--port', type=int, default=29500,
+                               help='Coordinator port (default: 29500)')
+    notify_parser.add_argument('--status', type=int, required=True,
+                               help='Master exit status')
+    return parser.parse_args()
+
+
+def main():
+    """Run the coordinator, a worker watch or a completion notification."""
+    args = parse_arguments()
+    if args.command == 'serve':
+        coordinator = Coordinator(args.port, args.world_size)
+        signal.signal(signal.SIGTERM, lambda signum, frame: coordinator.stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: coordinator.stopping.set())
+        coordinator.serve()
+        return EXIT_OK
+    if args.command == 'notify':
+        return notify(args.port, args.status)
+    return watch(args.host, args.port, args.rank, args.connect_timeout)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+#### restart of an interrupted foamRun from its latest complete time
+# before the solver (runParallel does this when FOAM_RESTART=true):
+#   ./restart.py prepare --case .
+# report only:
+#   ./restart.py latest --case /app/shared/motorBike
+#
+# A job set that dies mid-run can leave a half-written time directory behind,
+# and the ranks may stop at different writes. prepare finds the latest time
+# that is complete in every processor directory. Complete means the time holds
+# the same field files in every processor directory, none of them truncated,
+# including every field of the start time. Newer, partial time directories are
+# removed, and startFrom in system/controlDict is set to latestTime. So at
+# most one write interval of work is lost. restart.json in the case records
+# every restart.
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+
+from clean_levels import is_time_dir, processor_dirs
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("restart")
+
+# Appended to in the case on every restart
+RESTART_RECORD = "restart.json"
+
+# Every OpenFOAM field file (ASCII or binary) ends with this footer
+FOOTER = b"// ************************************************************************* //"
+
+START_FROM_RE = re.compile(r"^(\s*startFrom\s+)(\w+)(\s*;)", re.MULTILINE)
+
+
+def field_files(time_dir):
+    """
+    List the field files of a time directory, relative to it.
+
+    Returns:
+        A set of paths, including uniform/ entries
+    """
+    files = set()
+    for root, _, names in os.walk(time_dir):
+        for name in names:
+            files.add(os.path.relpath(os.path.join(root, name), time_dir))
+    return files
+
+
+def is_complete(path):
+    """Return True if a field file was written out in full."""
+    try:
+        size = os.path.getsize(path)
+        if path.endswith(".gz"):
+            # A gzip member ends with an 8 byte trailer after at least a 10 byte header
+            with open(path, "rb") as f:
+                return size > 18 and f.read(2) == b"\x1f\x8b"
+        with open(path, "rb") as f:
+            f.seek(max(0, size - 256))
+            return FOOTER in f.read()
+    except OSError:
+        return False
+
+
+def times(root):
+    """Return the time directories under root, newest first."""
+    return sorted((n for n in os.listdir(root) if is_time_dir(n) and os.path.isdir(os.path.join(root, n))),
+                  key=float, reverse=True)
+
+
+def latest_complete_time(case_dir):
+    """
+    Find the latest time complete in every processor directory.
+
+    Returns:
+        (latest complete time or None, [newer time directory names])
+    """
+    roots = [os.path.join(case_dir, d) for d in processor_dirs(case_dir)]
+    if not roots:
+        raise ValueError(f"{case_dir} is not decomposed")
+    per_root = [times(root) for root in roots]
+    all_times = sorted(set().union(*per_root), key=float, reverse=True)
+    start_fields = None
+    if per_root[0]:
+        start_fields = {f for f in field_files(os.path.join(roots[0], per_root[0][-1])) if "/" not in f}
+    for index, name in enumerate(all_times):
+        if not all(name in root_times for root_times in per_root):
+            continue
+        fields = [field_files(os.path.join(root, name)) for root in roots]
+        if any(f != fields[0] for f in fields[1:]):
+            continue
+        # A plain field of the start time missing here means the write stopped part way
+        if start_fields and not {f.replace(".gz", "") for f in start_fields} <= {f.replace(".gz", "") for f in fields[0]}:
+            continue
+        if all(is_complete(os.path.join(root, name, f)) for root in roots for f in fields[0]):
+            return name, all_times[:index]
+    return None, all_times
+
+
+def set_start_from(case_dir, value):
+    """
+    Set startFrom in system/controlDict.
+
+    Returns:
+        The previous value
+    """
+    path = os.path.join(case_dir, "system", "controlDict")
+    with open(path) as f:
+        text = f.read()
+    match = START_FROM_RE.search(text)
+    if not match:
+        raise ValueError(f"No startFrom entry in {path}")
+    # Write a new file and rename it over, so the solver never reads a partial controlDict
+    staging = f"{path}.restart-{os.getpid()}"
+    with open(staging, "w") as f:
+        f.write(START_FROM_RE.sub(rf"\g<1>{value}\g<3>", text, count=1))
+    os.replace(staging, path)
+    return match.group(2)
+
+
+def prepare(case_dir):
+    """
+    Remove partial times and restart the case from its latest complete time.
+
+    Returns:
+        The restart record
+    """
+    latest, newer = latest_complete_time(case_dir)
+    if latest is None:
+        raise ValueError(f"No time directory of {case_dir} is complete in every processor directory")
+    for root in processor_dirs(case_dir):
+        for name in newer:
+            path = os.path.join(case_dir, root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+    previous = set_start_from(case_dir, "latestTime")
+    record = {"restarted": time.strftime('%Y-%m-%dT%H:%M:%S'), "job_set": os.environ.get("JOB_SET_ID", ""),
+              "from_time": float(latest), "removed_partial_times": newer, "previous_start_from": previous}
+    path = os.path.join(case_dir, RESTART_RECORD)
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history.append(record)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2)
+    return record
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Restart an interrupted foamRun from its latest complete time')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('prepare', 'Remove partial times and set startFrom latestTime'),
+                            ('latest', 'Only report the latest complete time')):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--case', dest='case_dir', default=os.getcwd(),
+                               help='Case directory (default: current directory)')
+    return parser.parse_args()
+
+
+def main():
+    """Prepare a restart or report the latest complete time."""
+    args = parse_arguments()
+    try:
+        if args.command == 'latest':
+            latest, newer = latest_complete_time(args.case_dir)
+            logger.info(f"Latest complete time: {latest}" + (f", partial: {' '.join(newer)}" if newer else ""))
+            return 0 if latest is not None else 1
+        record = prepare(args.case_dir)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not prepare the restart: {e}")
+        return 1
+    removed = record["removed_partial_times"]
+    logger.info(f"Restarting from time {record['from_time']:g}"
+                + (f", removed partial times {' '.join(removed)}" if removed else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
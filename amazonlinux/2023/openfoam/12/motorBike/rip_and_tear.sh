@@ -1,11 +1,37 @@
 #!/bin/bash
 
+# Stage cache hits and misses are recorded under this run ID (cache/runs/<RUN_ID>.jsonl)
+RUN_ID=${RUN_ID:-$(date +%Y%m%d%H%M%S)}
+# World size of the parallel stages; the prep job generates decomposeParDict to match
+# (one slot per pod at the default --cpu-request 1; the stages run -np $MPI_TOTAL_SLOTS)
+NP=${NP:-8}
+# MESH_SCALE=8 runs an ~8x larger mesh (mesh_scale.py in the prep job)
+MESH_SCALE=${MESH_SCALE:-1}
+
+# FUSED_PREP=false runs the serial prep steps as separate jobs (01-04, 06) for debugging
+# Otherwise 01-04 run as one prep job and 06 runs as the last task of 05
+# PARALLEL_DECOMPOSE=true replaces serial decomposePar with redistributePar on $NP ranks
+if [ "${FUSED_PREP:-true}" = "true" ] && [ "${PARALLEL_DECOMPOSE:-false}" = "true" ]; then
+./submit2.py --disable-ssl --env RUN_ID=$RUN_ID --env MESH_SCALE=$MESH_SCALE --env PREP_STEPS="stage blockMesh" --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_prep
+./submit2.py --disable-ssl --mpi-processes $NP --env RUN_ID=$RUN_ID --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_04_parallel_redistributePar
+./submit2.py --disable-ssl --mpi-processes $NP --env RUN_ID=$RUN_ID --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_05_parallel_snappyHexMesh
+elif [ "${FUSED_PREP:-true}" = "true" ]; then
+./submit2.py --disable-ssl --env RUN_ID=$RUN_ID --env MESH_SCALE=$MESH_SCALE --env DECOMPOSE_RANKS=$NP --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_prep
+./submit2.py --disable-ssl --mpi-processes $NP --env RUN_ID=$RUN_ID --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_05_parallel_snappyHexMesh
+else
 ./submit2.py --disable-ssl --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_01_Allclean
 ./submit2.py --disable-ssl --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_02_data_setup
 ./submit2.py --disable-ssl --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_03_blockMesh
 ./submit2.py --disable-ssl --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_04_decomposePar
-./submit2.py --disable-ssl --mpi-processes 8 --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_05_parallel_snappyHexMesh
+./submit2.py --disable-ssl --mpi-processes $NP --env RUN_ID=$RUN_ID --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_05_parallel_snappyHexMesh
 ./submit2.py --disable-ssl --mpi-processes 1 --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_06_rmexec
-./submit2.py --disable-ssl --mpi-processes 8 --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_07_parallel_renumberMesh
-./submit2.py --disable-ssl --mpi-processes 8 --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_08_parallel_potentialFoam
-./submit2.py --disable-ssl --mpi-processes 8 --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_09_parallel_foamRun
+fi
+# FUSED_SOLVE=true runs 07-09 as one job set with a single bootstrap
+if [ "${FUSED_SOLVE:-false}" = "true" ]; then
+./submit2.py --disable-ssl --mpi-processes $NP --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_07_09_parallel_solve
+else
+./submit2.py --disable-ssl --mpi-processes $NP --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_07_parallel_renumberMesh
+./submit2.py --disable-ssl --mpi-processes $NP --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_08_parallel_potentialFoam
+./submit2.py --disable-ssl --mpi-processes $NP --mpi-image blik6126287/amazonlinux2023_openfoam12:motorBike_09_parallel_foamRun
+fi
+echo "Stage cache stats: ./stage_cache.py report --run-id $RUN_ID (from a pod with the shared mount)"
@@ -41,12 +41,69 @@ runParallel()
         return 1
     fi
 
+    # Resubmission after a restartable failure (FOAM_RESTART=true): applications whose
+    # log has no final "End" were interrupted and run again; foamRun carries on from
+    # its latest complete time (restart.py) and appends to its log. A completed
+    # application is left as already run
+    if [ "${FOAM_RESTART:-false}" = "true" ] && [ -f log.$LOG_SUFFIX ] && [ "$LOG_IGNORE" = "false" ] \
+        && ! tail -5 log.$LOG_SUFFIX | grep -q '^End'
+    then
+        echo "$APP_RUN was interrupted on $PWD, running it again"
+        if [ "$APP_NAME" = "foamRun" ]
+        then
+            python3 /app/restart.py prepare --case "$PWD" || return 1
+            LOG_IGNORE=true
+            LOG_APPEND=true
+        else
+            rm -f log.$LOG_SUFFIX
+        fi
+    fi
+
     if [ -f log.$LOG_SUFFIX ] && [ "$LOG_IGNORE" = "false" ]
     then
         echo "$APP_RUN already run on $PWD:" \
              "remove log file 'log.$LOG_SUFFIX' to re-run"
     else
-        echo "Running $APP_RUN in parallel on $PWD using $nProcs processes"
+        # A decomposition for a different world size fails late inside MPI; catch it here
+        # (redistributePar legitimately runs on a different count)
+        nDecomposed=$(foamDecomposedRanks)
+        if [ "$nDecomposed" -gt 0 ] && [ "$nDecomposed" -ne "$nProcs" ] && [ "$APP_NAME" != "redistributePar" ]
+        then
+            echo "Error: case is decomposed for $nDecomposed processors but $APP_RUN" \
+                 "was asked to run on $nProcs (regenerate with decompose_dict.py or redistribute.sh)"
+            return 1
+        fi
+        # Collated I/O: one processors<N> file set written by the I/O ranks instead
+        # of a processorN tree per rank; the I/O rank list must reach every rank
+        FILE_HANDLER_ARGS=
+        MPI_EXPORTS=
+        if [ "${FOAM_FILEHANDLER:-uncollated}" = "collated" ]
+        then
+            FILE_HANDLER_ARGS="-fileHandler collated"
+            export FOAM_IORANKS=$(foamIoRanks $nProcs)
+            [ -n "$FOAM_IORANKS" ] && MPI_EXPORTS="-x FOAM_IORANKS"
+        fi
+        # Per-run write interval, purge and function object policy of the solver (io_policy.py)
+        if [ -n "${FOAM_IO_POLICY}" ] && [ "$APP_NAME" = "foamRun" ]
+        then
+            python3 /app/io_policy.py apply --policy "$FOAM_IO_POLICY" --case "$PWD" || return 1
+        fi
+        echo "Running $APP_RUN in parallel on $PWD using $nProcs processes (${FOAM_FILEHANDLER:-uncollated} I/O)"
+        APP_START=$(date +%s%N)
+        # Live solver metrics from the log while the application runs (foam_log.py)
+        LOG_FOLLOWER=
+        if [ -n "${FOAM_LOG_METRICS_PORT}" ] && [ -f /app/foam_log.py ]
+        then
+            python3 /app/foam_log.py follow --from-end --log log.$LOG_SUFFIX --port $FOAM_LOG_METRICS_PORT &
+            LOG_FOLLOWER=$!
+        fi
+        # Optional early stop of the solver once it has converged (converge.py)
+        CONVERGE_WATCH=
+        if [ "${FOAM_CONVERGE:-false}" = "true" ] && [ "$APP_NAME" = "foamRun" ] && [ -f /app/converge.py ]
+        then
+            python3 /app/converge.py watch --log log.$LOG_SUFFIX --case "$PWD" &
+            CONVERGE_WATCH=$!
+        fi
         if [ "$LOG_APPEND" = "true" ]; then
             (
                 mpiexec --allow-run-as-root \
@@ -60,7 +117,8 @@ runParallel()
                     --mca btl tcp,self \
                     --mca oob tcp \
                     --mca orte_keep_fqdn_hostnames t \
-                    $APP_RUN -parallel "$@" < /dev/null >> log.$LOG_SUFFIX 2>&1
+                    $MPI_EXPORTS \
+                    $APP_RUN -parallel $FILE_HANDLER_ARGS "$@" < /dev/null >> log.$LOG_SUFFIX 2>&1
             )
         else
             (
@@ -75,8 +133,115 @@ runParallel()
                     --mca btl tcp,self \
                     --mca oob tcp \
                     --mca orte_keep_fqdn_hostnames t \
-                    $APP_RUN -parallel "$@" < /dev/null >> log.$LOG_SUFFIX 2>&1
+                    $MPI_EXPORTS \
+                    $APP_RUN -parallel $FILE_HANDLER_ARGS "$@" < /dev/null >> log.$LOG_SUFFIX 2>&1
             )
         fi
+        APP_STATUS=$?
+        for watcher in $LOG_FOLLOWER $CONVERGE_WATCH
+        do
+            kill $watcher
+            wait $watcher
+        done
+        # Solver-reported timing of the run, read from the end of the log (scaling.py collects it)
+        echo "$APP_NAME finished on $nProcs processes (status $APP_STATUS):" \
+             "$(tac log.$LOG_SUFFIX 2>/dev/null | grep -m1 '^ExecutionTime' || echo 'no ExecutionTime reported')"
+        [ "${FOAM_IO_STATS:-false}" = "true" ] && foamIoStats $APP_START log.$LOG_SUFFIX
+        [ -n "${FOAM_IO_POLICY}" ] && [ "$APP_NAME" = "foamRun" ] &&
+            python3 /app/io_policy.py report --case "$PWD" --log log.$LOG_SUFFIX
+        return $APP_STATUS
+    fi
+}
+
+foamIoStats()
+{
+    # Usage: foamIoStats <start ns> <log>
+    # Wall time, mesh write time reported in the log, and the files and directories
+    # under the decomposed case (the metadata load the file handler produces)
+    ioFiles=$(find processor[0-9]* processors[0-9]* -type f 2>/dev/null | wc -l)
+    ioDirs=$(find processor[0-9]* processors[0-9]* -type d 2>/dev/null | wc -l)
+    ioWrite=$(grep -o "Wrote mesh in = [0-9.e+-]* s" "$2" 2>/dev/null | awk '{t += $5} END {printf "%.2f", t}')
+    echo "I/O stats ($APP_NAME, ${FOAM_FILEHANDLER:-uncollated}): took $(( ($(date +%s%N) - $1) / 1000000 )) ms," \
+         "mesh write ${ioWrite} s, ${ioFiles} files in ${ioDirs} directories"
+}
+
+foamDecomposedRanks()
+{
+    # Usage: foamDecomposedRanks
+    # Number of ranks the case in $PWD is decomposed for: processorN dirs
+    # (uncollated) or the N of processors<N>[_<first>-<last>] (collated), 0 if none
+    nCollated=$(ls -d processors[0-9]* 2>/dev/null | head -1 | sed -e 's/^processors//' -e 's/_.*//')
+    if [ -n "$nCollated" ]
+    then
+        echo "$nCollated"
+    else
+        ls -d processor[0-9]* 2>/dev/null | wc -l
+    fi
+}
+
+foamIoRanks()
+{
+    # Usage: foamIoRanks <nProcs>
+    # FOAM_IORANKS list for IO_RANKS evenly spaced I/O ranks, e.g. "(0 4 8 12)" for
+    # 4 of 16; empty when IO_RANKS is unset (rank 0 does all collated I/O)
+    if [ -z "${IO_RANKS}" ] || [ "${IO_RANKS}" -le 1 ]
+    then
+        return 0
     fi
+    ioStride=$(( ($1 + IO_RANKS - 1) / IO_RANKS ))
+    echo "($(seq -s ' ' 0 $ioStride $(( $1 - 1 ))))"
+}
+
+runCached()
+{
+    # Usage: runCached <stage> <command...>
+    # Restores the stage from the shared-mount cache when its inputs are unchanged,
+    # otherwise runs the command and stores its outputs (STAGE_CACHE=false disables)
+    # Not used on scratch staging, where each pod only holds its own processor dirs
+    CACHE_STAGE="$1"
+    shift
+
+    if [ "${STAGE_CACHE:-true}" != "true" ] || [ -f .scratch_stage.json ]
+    then
+        rm -f .stage_keys/$CACHE_STAGE
+        "$@"
+        return $?
+    fi
+
+    if python3 /app/stage_cache.py lookup --stage "$CACHE_STAGE"
+    then
+        return 0
+    fi
+
+    CACHE_START=$(date +%s)
+    "$@" || return $?
+    python3 /app/stage_cache.py store --stage "$CACHE_STAGE" --seconds $(( $(date +%s) - CACHE_START )) ||
+        echo "Warning: could not cache stage $CACHE_STAGE"
+    return 0
+}
+
+profileStart()
+{
+    # Usage: profileStart
+    # Samples this pod's peak memory, CPU time and scratch usage in the background
+    # (RESOURCE_PROFILE=false disables); profileStop prints the profile to the pod log
+    if [ "${RESOURCE_PROFILE:-true}" != "true" ] || [ ! -f /app/resource_profile.py ]
+    then
+        return 0
+    fi
+    PROFILE_STATUS_FILE=/tmp/resource_profile_status
+    rm -f $PROFILE_STATUS_FILE
+    python3 /app/resource_profile.py sample --status-file $PROFILE_STATUS_FILE &
+    PROFILE_PID=$!
+}
+
+profileStop()
+{
+    # Usage: profileStop <exit status>
+    # Safe to call more than once; only the first call reports
+    [ -n "$PROFILE_PID" ] || return 0
+    echo "$1" > $PROFILE_STATUS_FILE
+    kill -TERM $PROFILE_PID 2>/dev/null
+    wait $PROFILE_PID 2>/dev/null
+    PROFILE_PID=
 }
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+#### node-local scratch staging for parallel solver stages
+# each rank before the task: ./scratch_stage.py in  --case /app/shared/motorBike --scratch /scratch
+# each rank after the task:  ./scratch_stage.py out --case /app/shared/motorBike --scratch /scratch
+#
+# mpiexec fills hosts in hostfile order, slot by slot, so the pod on hostfile
+# line i runs processors [sum of slots before i, + its slots). Each pod copies
+# only those processorN trees, plus the small case-level files every rank reads,
+# to its scratch volume, and the stage runs there. At the end each pod copies its
+# processor trees back to the shared mount in parallel; rank 0 also copies back
+# case-level outputs (logs, postProcessing). setup_mpi.sh lists rank 0 first in
+# the hostfile, so processor0, which writes postProcessing, runs on that pod.
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("scratch_stage")
+
+# Case-level inputs that every rank reads
+CASE_INPUTS = ["system", "constant", "0"]
+
+# Written into the scratch case so stage out knows what it owns
+STAGE_MANIFEST = ".scratch_stage.json"
+
+# Level fields removed by the snappyHexMesh post-step on rank 0 (clean_levels.py)
+LEVEL_MANIFEST = "level_fields.json"
+
+
+def local_host(mountpoint, job_set_id, rank):
+    """
+    Return the hostfile address of this pod from its host record.
+
+    Args:
+        mountpoint: The shared mount path
+        job_set_id: The job set ID
+        rank: This pod's MPI rank
+
+    Returns:
+        The address this pod is listed under in /app/hostfile
+    """
+    with open(os.path.join(mountpoint, "hostfiles", job_set_id, f"rank_{rank}")) as f:
+        # <node name> <rank> <host> <slots> <ip> <fqdn>
+        return f.read().split()[2]
+
+
+def local_processors(hostfile, host, processor_count):
+    """
+    Work out which processor directories the ranks on this pod will open.
+
+    Args:
+        hostfile: Path of the MPI hostfile
+        host: This pod's address in the hostfile
+        processor_count: Number of processor directories in the case
+
+    Returns:
+        Processor indices run on this pod
+    """
+    first = 0
+    with open(hostfile) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            slots = int(fields[1].split("=", 1)[1]) if len(fields) > 1 and fields[1].startswith("slots=") else 1
+            if fields[0] == host:
+                return list(range(first, min(first + slots, processor_count)))
+            first += slots
+    raise ValueError(f"{host} is not in {hostfile}")
+
+
+def copy_tree(src, dst):
+    """
+    Copy a file or directory, replacing dst.
+
+    Returns:
+        (files copied, bytes copied)
+    """
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        shutil.rmtree(dst)
+    elif os.path.lexists(dst):
+        os.remove(dst)
+    if not os.path.isdir(src):
+        shutil.copy2(src, dst)
+        return 1, os.path.getsize(dst)
+    shutil.copytree(src, dst, symlinks=True)
+    files = 0
+    size = 0
+    for root, _, names in os.walk(dst):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def replace_tree(src, dst):
+    """
+    Copy a tree next to dst and swap it in, so dst is never left half-written.
+
+    Returns:
+        (files copied, bytes copied)
+    """
+    staging = f"{dst}.staging-{os.getpid()}"
+    previous = f"{dst}.previous-{os.getpid()}"
+    counts = copy_tree(src, staging)
+    if os.path.lexists(dst):
+        os.rename(dst, previous)
+    os.rename(staging, dst)
+    if os.path.isdir(previous):
+        shutil.rmtree(previous)
+    elif os.path.lexists(previous):
+        os.remove(previous)
+    return counts
+
+
+def run_copies(pairs, workers, copy):
+    """
+    Run copies in parallel and total what was moved.
+
+    Args:
+        pairs: (source, destination) paths
+        workers: Number of parallel copies
+        copy: The copy function
+
+    Returns:
+        (files, bytes, seconds)
+    """
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda pair: copy(*pair), pairs))
+    return sum(r[0] for r in results), sum(r[1] for r in results), time.time() - start
+
+
+def stage_in(case_dir, scratch_case, processors, processor_count, workers):
+    """
+    Copy case-level inputs and this pod's processor directories to scratch.
+
+    The other processor directories are created empty, since the master rank
+    checks the processor directory count against the number of ranks.
+
+    Args:
+        case_dir: The case on the shared mount
+        scratch_case: The case on node-local scratch
+        processors: Processor indices run on this pod
+        processor_count: Number of processor directories in the case
+        workers: Number of parallel copies
+    """
+    os.makedirs(scratch_case, exist_ok=True)
+    for i in range(processor_count):
+        if i not in processors:
+            os.makedirs(os.path.join(scratch_case, f"processor{i}"), exist_ok=True)
+    pairs = [(os.path.join(case_dir, name), os.path.join(scratch_case, name))
+             for name in CASE_INPUTS if os.path.exists(os.path.join(case_dir, name))]
+    pairs += [(os.path.join(case_dir, f"processor{i}"), os.path.join(scratch_case, f"processor{i}"))
+              for i in processors]
+    files, size, seconds = run_copies(pairs, workers, copy_tree)
+    with open(os.path.join(scratch_case, STAGE_MANIFEST), "w") as f:
+        json.dump({"processors": processors, "staged_at": time.time()}, f)
+    logger.info(f"Staged in processors {processors[0] if processors else '-'}..{processors[-1] if processors else '-'} "
+                f"({files} files, {size / 2**20:.1f} MiB) in {int(seconds * 1000)} ms")
+
+
+def drop_level_fields(case_dir, scratch_case, manifest):
+    """
+    Remove the level fields rank 0 cleaned up during this stage from this pod's
+    processor directories, so they are not copied back.
+
+    Args:
+        case_dir: The case on the shared mount
+        scratch_case: The case on node-local scratch
+        manifest: This pod's stage manifest
+    """
+    level_manifest = os.path.join(case_dir, LEVEL_MANIFEST)
+    # Only a manifest written after stage in belongs to this stage
+    if not os.path.exists(level_manifest) or os.path.getmtime(level_manifest) < manifest["staged_at"]:
+        return
+    with open(level_manifest) as f:
+        level_files = json.load(f)["processor_files"]
+    for i in manifest["processors"]:
+        for rel in level_files:
+            path = os.path.join(scratch_case, f"processor{i}", rel)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def stage_out(case_dir, scratch_case, include_case_outputs, workers):
+    """
+    Copy this pod's processor directories (and optionally case-level outputs) back.
+
+    Args:
+        case_dir: The case on the shared mount
+        scratch_case: The case on node-local scratch
+        include_case_outputs: Also copy back case-level outputs (rank 0)
+        workers: Number of parallel copies
+    """
+    with open(os.path.join(scratch_case, STAGE_MANIFEST)) as f:
+        manifest = json.load(f)
+    drop_level_fields(case_dir, scratch_case, manifest)
+    pairs = [(os.path.join(scratch_case, f"processor{i}"), os.path.join(case_dir, f"processor{i}"))
+             for i in manifest["processors"]]
+    if include_case_outputs:
+        # Logs, postProcessing and anything else the stage wrote at case level
+        for name in os.listdir(scratch_case):
+            if name.startswith("processor") or name in CASE_INPUTS or name == STAGE_MANIFEST:
+                continue
+            pairs.append((os.path.join(scratch_case, name), os.path.join(case_dir, name)))
+    files, size, seconds = run_copies(pairs, workers, replace_tree)
+    logger.info(f"Staged out {len(manifest['processors'])} processor directories ({files} files, "
+                f"{size / 2**20:.1f} MiB) in {int(seconds * 1000)} ms")
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Stage processor directories through node-local scratch')
+    parser.add_argument('direction', choices=['in', 'out'],
+                        help='in: shared mount to scratch, out: scratch to shared mount')
+    parser.add_argument('--case', dest='case_dir',
+                        default=os.path.join(os.environ.get("WORK_DIR", "/app/shared"), os.environ.get("TUTORIAL", "motorBike")),
+                        help='Case directory on the shared mount (default: $WORK_DIR/$TUTORIAL)')
+    parser.add_argument('--scratch', dest='scratch_dir', default=os.environ.get("SCRATCH_DIR", "/scratch"),
+                        help='Node-local scratch directory (default: /scratch)')
+    parser.add_argument('--mountpoint', default=os.environ.get("MOUNTPOINT", "/app/shared"),
+                        help='Shared mount path (default: /app/shared)')
+    parser.add_argument('--hostfile', default="/app/hostfile",
+                        help='MPI hostfile (default: /app/hostfile)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("SCRATCH_WORKERS", "8")),
+                        help='Number of parallel copies (default: 8)')
+    return parser.parse_args()
+
+
+def main():
+    """Stage this pod's part of the case in or out."""
+    args = parse_arguments()
+    rank = os.environ.get("MPI_RANK", "0")
+    scratch_case = os.path.join(args.scratch_dir, os.path.basename(os.path.normpath(args.case_dir)))
+    try:
+        if args.direction == 'in':
+            processor_count = len([d for d in os.listdir(args.case_dir)
+                                   if d.startswith("processor") and d[len("processor"):].isdigit()])
+            if any(d.startswith("processors") for d in os.listdir(args.case_dir)):
+                # Collated processors<N> files hold every rank's data, so they cannot be split per pod
+                logger.error(f"{args.case_dir} uses the collated file handler; scratch staging needs "
+                             f"uncollated processorN directories")
+                return 1
+            if processor_count == 0:
+                logger.error(f"No processor directories in {args.case_dir}, nothing to stage")
+                return 1
+            host = local_host(args.mountpoint, os.environ["JOB_SET_ID"], rank)
+            processors = local_processors(args.hostfile, host, processor_count)
+            stage_in(args.case_dir, scratch_case, processors, processor_count, args.workers)
+        else:
+            stage_out(args.case_dir, scratch_case, rank == "0", args.workers)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Scratch stage {args.direction} failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
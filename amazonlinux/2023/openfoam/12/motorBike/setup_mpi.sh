@@ -8,12 +8,69 @@ source /app/runParallel.sh
 # Ensure TASK argument is provided
 if [ "$#" -lt 1 ]; then
     echo "Error: Missing required TASK argument"
-    echo "Usage: $0 <TASK>"
+    echo "Usage: $0 <TASK> [TASK...]"
+    echo "       $0 \"<TASK>; <TASK>; ...\""
     exit 1
 fi
 
-# Store the TASK argument
-TASK="$1"
+# Store the TASK list
+# Several arguments are run in order; a single argument is split on ';'
+# Pass tasks as separate arguments when a task itself contains ';'
+if [ "$#" -gt 1 ]; then
+    TASKS=("$@")
+else
+    IFS=';' read -r -a TASKS <<< "$1"
+fi
+
+# Host addressing mode for the hostfile: fqdn (CoreDNS pod records) or ip
+MPI_HOST_MODE="${MPI_HOST_MODE:-fqdn}"
+
+# Record bootstrap start time for startup timing
+BOOTSTRAP_START_NS=$(date +%s%N)
+elapsed_ms() {
+  echo $(( ($(date +%s%N) - $1) / 1000000 ))
+}
+
+# Gang arrival deadline - every rank must register within this many seconds
+# If the gang is incomplete, all ranks exit with EXIT_GANG_INCOMPLETE so the
+# submitter can cancel the job set and release the capacity
+GANG_ARRIVAL_TIMEOUT="${GANG_ARRIVAL_TIMEOUT:-180}"
+EXIT_GANG_INCOMPLETE=75
+# Workers exit with EXIT_MASTER_LOST when the master went away without a status
+# (node loss or preemption), so the submitter can restart the stage
+EXIT_MASTER_LOST=76
+GANG_DEADLINE=$(( $(date +%s) + GANG_ARRIVAL_TIMEOUT ))
+gang_time_left() {
+  echo $(( GANG_DEADLINE - $(date +%s) ))
+}
+gang_incomplete() {
+  echo "ERROR: Gang incomplete: $1 within ${GANG_ARRIVAL_TIMEOUT}s, aborting"
+  exit $EXIT_GANG_INCOMPLETE
+}
+
+# Run every task in TASKS in order with per-task timing; returns the first failing status
+run_tasks() {
+  local count=0 index=0 task status start
+  for task in "${TASKS[@]}"; do
+    [ -n "${task// /}" ] && count=$((count + 1))
+  done
+  for task in "${TASKS[@]}"; do
+    # Skip empty entries left by a trailing ';'
+    [ -n "${task// /}" ] || continue
+    read -r task <<< "$task"
+    index=$((index + 1))
+    echo "Task ${index}/${count}: ${task}"
+    start=$(date +%s%N)
+    eval "${task}"
+    status=$?
+    echo "Task ${index}/${count} took $(elapsed_ms $start) ms (status ${status})"
+    if [ $status -ne 0 ]; then
+      echo "Task ${index}/${count} failed, skipping the remaining $((count - index)) tasks"
+      return $status
+    fi
+  done
+  return 0
+}
 
 # Print diagnostic info
 echo "Container starting up"
@@ -22,6 +79,9 @@ echo "JOB_SET_ID: ${JOB_SET_ID}"
 echo "POD_NAME: ${POD_NAME}"
 echo "MPI_RANK: ${MPI_RANK}"
 echo "MPI_WORLD_SIZE: ${MPI_WORLD_SIZE}"
+echo "MPI_HOST_MODE: ${MPI_HOST_MODE}"
+echo "GANG_ARRIVAL_TIMEOUT: ${GANG_ARRIVAL_TIMEOUT}"
+echo "TASKS: ${#TASKS[@]}"
 
 # Create shared directories
 export MOUNTPOINT="/app/shared"
@@ -29,16 +89,18 @@ mkdir -p "${MOUNTPOINT}/hostfiles/${JOB_SET_ID}"
 mkdir -p "${MOUNTPOINT}/ssh/${JOB_SET_ID}"
 mkdir -p "${MOUNTPOINT}/status/${JOB_SET_ID}"
 
+# Profile this pod's resource usage for request right-sizing (resource_profile.py)
+profileStart
+
 # Set up early error signaling
-# This ensures that if the script exits at any point, the error is communicated to worker nodes
+# This ensures that if the script exits at any point, the failure is recorded once
+# Liveness itself goes over the rendezvous TCP channel, not the shared mount
 if [ "${MPI_RANK}" = "0" ]; then
     # For master node, set up trap to signal errors
     trap 'echo "$(date): Master failed with status $?" > "${MOUNTPOINT}/status/${JOB_SET_ID}/master_failed"' ERR EXIT
-    # Create initial heartbeat
-    echo "$(date): Master initializing" > "${MOUNTPOINT}/status/${JOB_SET_ID}/master_heartbeat"
 else
-    # For worker nodes, create readiness indicator
-    echo "$(date): Worker ${HOSTNAME} initializing" > "${MOUNTPOINT}/status/${JOB_SET_ID}/worker_${HOSTNAME}_ready"
+    # Workers report their resource profile however they exit
+    trap 'profileStop $?' EXIT
 fi
 
 # Generate SSH host keys if they don't exist
@@ -60,8 +122,6 @@ if [ "${MPI_RANK}" = "0" ]; then
     chmod 600 /root/.ssh/authorized_keys
     # Create a flag file to signal SSH setup is complete
     touch "$MOUNTPOINT/ssh/$JOB_SET_ID/ssh_setup_complete"
-    # Update heartbeat
-    echo "$(date): Master SSH setup complete" > "${MOUNTPOINT}/status/${JOB_SET_ID}/master_heartbeat"
 fi
 
 # WORKER NODES - WAIT FOR SSH SETUP TO COMPLETE
@@ -69,6 +129,9 @@ if [ "${MPI_RANK}" != "0" ]; then
     echo "Worker node waiting for SSH setup to complete"
     # Wait for SSH setup to complete on master
     while [ ! -f "$MOUNTPOINT/ssh/$JOB_SET_ID/ssh_setup_complete" ]; do
+        if [ "$(gang_time_left)" -le 0 ]; then
+            gang_incomplete "master never published its SSH keys"
+        fi
         echo "Waiting for SSH setup to complete..."
         sleep 2
     done
@@ -81,15 +144,27 @@ if [ "${MPI_RANK}" != "0" ]; then
     chmod 644 /root/.ssh/id_rsa.pub
     chmod 600 /root/.ssh/authorized_keys
     echo "Worker SSH setup complete"
-    # Update worker status
-    echo "$(date): Worker ${HOSTNAME} SSH setup complete" > "${MOUNTPOINT}/status/${JOB_SET_ID}/worker_${HOSTNAME}_ready"
 fi
 
-# Create a flag file for MPI hosts
+# Create a host record for this pod
+# Each record holds: <node name> <rank> <host> <slots> <ip> <fqdn>
+# NODE_NAME comes from the downward API, MPI_SLOTS from the pod core count
+# In ip mode the host is the raw pod IP and the FQDN is only kept as a label
 mkdir -p "$MOUNTPOINT/hostfiles/$JOB_SET_ID"
-IPADDR="$(ip addr show eth0 | grep -w inet | awk '{print $2}' | cut -d/ -f1 | tr '.' '-')"
+POD_IP="$(ip addr show eth0 | grep -w inet | awk '{print $2}' | cut -d/ -f1)"
+IPADDR="$(echo "$POD_IP" | tr '.' '-')"
 NAMESPACE="$(cat /var/run/secrets/kubernetes.io/serviceaccount/namespace)"
-echo "${IPADDR}.${NAMESPACE}.pod.cluster.local" > "${MOUNTPOINT}/hostfiles/${JOB_SET_ID}/${HOSTNAME}"
+POD_FQDN="${IPADDR}.${NAMESPACE}.pod.cluster.local"
+NODE_NAME="${NODE_NAME:-unknown}"
+MPI_SLOTS="${MPI_SLOTS:-1}"
+if [ "${MPI_HOST_MODE}" = "ip" ]; then
+    MPI_HOST="${POD_IP}"
+else
+    MPI_HOST="${POD_FQDN}"
+fi
+echo "${NODE_NAME} ${MPI_RANK} ${MPI_HOST} ${MPI_SLOTS} ${POD_IP} ${POD_FQDN}" > "${MOUNTPOINT}/hostfiles/${JOB_SET_ID}/rank_${MPI_RANK}"
+
+echo "Bootstrap: SSH and host registration done after $(elapsed_ms $BOOTSTRAP_START_NS) ms"
 
 # Wait until we have the required number of worker hosts
 # We need to count only the host files, not the SSH keys or other files
@@ -98,76 +173,91 @@ while true; do
   if [ "$HOST_COUNT" -ge "$MPI_WORLD_SIZE" ]; then
     echo "Found $HOST_COUNT host files, proceeding..."
     break
+  elif [ "$(gang_time_left)" -le 0 ]; then
+    gang_incomplete "only $HOST_COUNT of $MPI_WORLD_SIZE ranks registered"
   else
-    echo "Found $HOST_COUNT host files, waiting for $MPI_WORLD_SIZE..."
+    echo "Found $HOST_COUNT host files, waiting for $MPI_WORLD_SIZE ($(gang_time_left)s left)..."
     sleep 5
   fi
 done
 
-# Process each host file and update /etc/hosts and hostfile
+# Process the host records and build the hostfile
+# Records are ordered by node and then by rank, so ranks sharing a node are
+# contiguous and neighbouring decomposePar subdomains stay on the same node
+# Rank 0's node goes first, so MPI rank 0 (processor0, the OpenFOAM master) runs
+# on this pod, where the case-level files are read, edited and staged out
+MASTER_NODE=$(awk '{print $1}' "$MOUNTPOINT/hostfiles/$JOB_SET_ID/rank_0")
 rm -rf /app/hostfile
 touch /app/hostfile  # Create empty hostfile
 
-# First, gather information about all pods and their IPs
-for FILE in "$MOUNTPOINT/hostfiles/$JOB_SET_ID"/*; do
-  ARECORD=$(cat "$FILE")
-  echo "$ARECORD slots=1 max_slots=1" >> "/app/hostfile"
-  # Add an echo for debugging
-  echo "Added host to hostfile: $ARECORD"
-done
-
-# Function to create heartbeat file (for master node)
-update_heartbeat() {
-  echo "Starting master heartbeat mechanism"
-  while true; do
-    echo "$(date): Master alive" > "$MOUNTPOINT/status/$JOB_SET_ID/master_heartbeat"
-    sleep 10
-  done
-}
-
-# Function to check if master is still running
-check_master_health() {
-  # If completion file exists, master finished successfully
-  if [ -f "$MOUNTPOINT/status/$JOB_SET_ID/job_complete" ]; then
-    echo "$(date): Job completion file found"
-    return 0
-  fi
-  # If master failure file exists, master failed
-  if [ -f "$MOUNTPOINT/status/$JOB_SET_ID/master_failed" ]; then
-    echo "$(date): Master failure file found"
-    cat "$MOUNTPOINT/status/$JOB_SET_ID/master_failed"
-    return 1
-  fi
-  # Check if master's pod is still running by checking its heartbeat
-  MASTER_HEARTBEAT_FILE="$MOUNTPOINT/status/$JOB_SET_ID/master_heartbeat"
-  # If heartbeat file doesn't exist or is too old (60 seconds), consider master failed
-  if [ ! -f "$MASTER_HEARTBEAT_FILE" ]; then
-    echo "$(date): Master heartbeat file not found"
-    return 1
-  fi
-  HEARTBEAT_AGE=$(($(date +%s) - $(stat -c %Y "$MASTER_HEARTBEAT_FILE")))
-  if [ $HEARTBEAT_AGE -gt 60 ]; then
-    echo "$(date): Master node appears to have failed (heartbeat too old: ${HEARTBEAT_AGE}s)"
-    return 1
+# First, gather information about all pods and their placement
+# In ip mode the FQDNs are pinned in /etc/hosts so nothing resolves via CoreDNS
+while read -r NODE RANK ARECORD SLOTS RECORD_IP RECORD_FQDN; do
+  if [ "${MPI_HOST_MODE}" = "ip" ]; then
+    echo "$ARECORD slots=$SLOTS max_slots=$SLOTS # $RECORD_FQDN" >> "/app/hostfile"
+    grep -q " ${RECORD_FQDN}\$" /etc/hosts || echo "${RECORD_IP} ${RECORD_FQDN}" >> /etc/hosts
+  else
+    echo "$ARECORD slots=$SLOTS max_slots=$SLOTS" >> "/app/hostfile"
   fi
-  return 0
-}
+  # Add an echo for debugging
+  echo "Added host to hostfile: $ARECORD (node $NODE, rank $RANK, slots $SLOTS)"
+done < <(cat "$MOUNTPOINT/hostfiles/$JOB_SET_ID"/rank_* | awk -v master="$MASTER_NODE" '{print ($1 != master), $0}' |
+          sort -k1,1n -k2,2 -k3,3n | cut -d' ' -f2-)
+export MPI_TOTAL_SLOTS=$(awk -F'slots=' '{split($2, a, " "); total += a[1]} END {print total}' /app/hostfile)
+echo "Hostfile covers $(cat "$MOUNTPOINT/hostfiles/$JOB_SET_ID"/rank_* | awk '{print $1}' | sort -u | wc -l) nodes with ${MPI_TOTAL_SLOTS} slots"
 
-# Verify SSH connections from master to all nodes
 if [ "${MPI_RANK}" = "0" ]; then
-    echo "Testing SSH connections to all nodes"
-    # Start the heartbeat process in the background before SSH tests
-    update_heartbeat &
-    HEARTBEAT_PID=$!
-    # Update trap to kill heartbeat and signal either success or failure
-    trap 'TRAP_STATUS=$?; if [ $TRAP_STATUS -eq 0 ]; then
+    # Start the liveness coordinator in the background before scratch stage-in and SSH tests
+    # Workers hold a TCP connection to it; a dropped connection means failure
+    # Workers only wait out the gang deadline to connect, so a slow stage-in here must not delay it
+    python3 /app/rendezvous.py serve --port "${MPI_MASTER_PORT:-29500}" --world-size "${MPI_WORLD_SIZE}" &
+    COORDINATOR_PID=$!
+    # Update trap to push the final status to the workers first, then record it once
+    # The workers are released over TCP, so they do not wait on the shared mount
+    # hostfiles/ and ssh/ are only removed once every worker has acknowledged, since a
+    # late worker may still be counting host records or reading rank_0; otherwise the
+    # sweeper (gc_sweep.sh) removes them
+    trap 'TRAP_STATUS=$?;
+          python3 /app/rendezvous.py notify --port "${MPI_MASTER_PORT:-29500}" --status $TRAP_STATUS;
+          NOTIFY_STATUS=$?;
+          if [ $TRAP_STATUS -eq 0 ]; then
             echo "$(date): Master completed successfully" > "${MOUNTPOINT}/status/${JOB_SET_ID}/job_complete";
           else
             echo "$(date): Master failed with status $TRAP_STATUS" > "${MOUNTPOINT}/status/${JOB_SET_ID}/master_failed";
           fi;
-          kill $HEARTBEAT_PID 2>/dev/null;
+          kill $COORDINATOR_PID 2>/dev/null;
+          wait $COORDINATOR_PID 2>/dev/null;
+          if [ "${GC_ON_COMPLETE:-true}" = "true" ] && [ $NOTIFY_STATUS -eq 0 ]; then
+            python3 /app/gc_shared.py job --job-set-id "${JOB_SET_ID}" --keep-status;
+          elif [ "${GC_ON_COMPLETE:-true}" = "true" ]; then
+            echo "Not every worker acknowledged completion, leaving coordination files to the sweeper";
+          fi;
+          profileStop $TRAP_STATUS;
           echo "Master cleanup done with status $TRAP_STATUS";
           exit $TRAP_STATUS' EXIT
+fi
+
+# Optional node-local scratch staging: every rank copies the processor directories
+# it will run to scratch, the task runs there, and each rank copies them back at the end
+SCRATCH_STAGING="${SCRATCH_STAGING:-false}"
+if [ "${SCRATCH_STAGING}" = "true" ]; then
+    CASE_DIR="$PWD"
+    SCRATCH_CASE="${SCRATCH_DIR:-/scratch}/$(basename "$CASE_DIR")"
+    STAGE_START_NS=$(date +%s%N)
+    python3 /app/scratch_stage.py in --case "$CASE_DIR" || exit 1
+    touch "${MOUNTPOINT}/status/${JOB_SET_ID}/staged_${MPI_RANK}"
+    echo "Scratch stage in took $(elapsed_ms $STAGE_START_NS) ms"
+fi
+stage_out() {
+  [ "${SCRATCH_STAGING}" = "true" ] || return 0
+  local start=$(date +%s%N)
+  python3 /app/scratch_stage.py out --case "$CASE_DIR" || return 1
+  echo "Scratch stage out took $(elapsed_ms $start) ms"
+}
+
+# Verify SSH connections from master to all nodes
+if [ "${MPI_RANK}" = "0" ]; then
+    echo "Testing SSH connections to all nodes"
     # Now test SSH connections with error handling that won't exit immediately
     SSH_TEST_FAILED=0
     while read -r host _; do
@@ -182,41 +272,82 @@ if [ "${MPI_RANK}" = "0" ]; then
         echo "One or more SSH tests failed, cannot proceed with MPI application"
         exit 1
     fi
+    echo "Bootstrap completed in $(elapsed_ms $BOOTSTRAP_START_NS) ms (host mode: ${MPI_HOST_MODE}, ranks: ${MPI_WORLD_SIZE})"
+    if [ "${SCRATCH_STAGING}" = "true" ]; then
+        # Every rank must have its processor directories on scratch before mpiexec
+        STAGE_DEADLINE=$(( $(date +%s) + ${SCRATCH_STAGE_TIMEOUT:-600} ))
+        until [ "$(ls -1 "${MOUNTPOINT}/status/${JOB_SET_ID}"/staged_* 2>/dev/null | wc -l)" -ge "$MPI_WORLD_SIZE" ]; do
+            if [ "$(date +%s)" -ge "$STAGE_DEADLINE" ]; then
+                echo "ERROR: not all ranks staged to scratch within ${SCRATCH_STAGE_TIMEOUT:-600}s"
+                exit 1
+            fi
+            sleep 2
+        done
+        echo "All ranks staged to scratch, running in ${SCRATCH_CASE}"
+        cd "${SCRATCH_CASE}" || exit 1
+    fi
     echo "Master node starting MPI application"
-    # Run the MPI application and capture its exit status
-    eval "${TASK}"
+    # Run the tasks back to back under the same hostfile, stopping on the first failure
+    TASK_START_NS=$(date +%s%N)
+    run_tasks
     # Capture exit status
     MPI_EXIT_STATUS=$?
     echo "MPI application completed with exit status: $MPI_EXIT_STATUS"
-    # Signal completion to worker nodes
-    echo "$(date): Job completed with status $MPI_EXIT_STATUS" > "$MOUNTPOINT/status/$JOB_SET_ID/job_complete"
+    echo "MPI application took $(elapsed_ms $TASK_START_NS) ms"
+    if [ $MPI_EXIT_STATUS -eq 0 ]; then
+        stage_out || MPI_EXIT_STATUS=1
+    fi
     # Exit with the same status as the MPI application
+    # The EXIT trap records the status and releases the workers
     exit $MPI_EXIT_STATUS
 else
     echo "Worker node ready for MPI tasks"
-    # Wait for the job completion signal from the master node
-    echo "Worker node waiting for MPI job to complete..."
-    # Check status every 5 seconds
-    while true; do
-        # First check job completion
-        if [ -f "$MOUNTPOINT/status/$JOB_SET_ID/job_complete" ]; then
-            echo "Worker node detected job completion:"
-            cat "$MOUNTPOINT/status/$JOB_SET_ID/job_complete"
+    # Hold a connection to the master until it releases us or goes away
+    MASTER_IP=$(awk '{print $5}' "$MOUNTPOINT/hostfiles/$JOB_SET_ID/rank_0")
+    echo "Worker node waiting for MPI job to complete (master at ${MASTER_IP})..."
+    CONNECT_TIMEOUT=$(gang_time_left)
+    [ "$CONNECT_TIMEOUT" -gt 30 ] || CONNECT_TIMEOUT=30
+    python3 /app/rendezvous.py watch --host "${MASTER_IP}" --port "${MPI_MASTER_PORT:-29500}" --rank "${MPI_RANK}" \
+        --connect-timeout "$CONNECT_TIMEOUT"
+    WATCH_STATUS=$?
+    # 0: master succeeded, 1: master failed, 2: coordinator never came up,
+    # 3: master lost, 4: released without a status (fall back to the shared mount)
+    case $WATCH_STATUS in
+        0)
+            echo "Worker node detected job completion"
+            stage_out || exit 1
             echo "Worker exiting normally"
             exit 0
-        fi
-        # Then check for master failure
-        if [ -f "$MOUNTPOINT/status/$JOB_SET_ID/master_failed" ]; then
-            echo "Worker detected master failure:"
-            cat "$MOUNTPOINT/status/$JOB_SET_ID/master_failed"
+            ;;
+        1)
+            echo "Worker detected master failure"
             echo "Worker exiting with error"
             exit 1
-        fi
-        # Then check master health via heartbeat
-        if ! check_master_health; then
+            ;;
+        2)
+            gang_incomplete "master coordinator never came up"
+            ;;
+        3)
+            echo "Master node lost, exiting for a restart"
+            exit $EXIT_MASTER_LOST
+            ;;
+        4)
+            ;;
+        *)
             echo "Master node failure detected, exiting with error"
             exit 1
-        fi
-        sleep 5
-    done
+            ;;
+    esac
+    # Master released us without a status; read its final status once
+    if [ -f "$MOUNTPOINT/status/$JOB_SET_ID/job_complete" ]; then
+        echo "Worker node detected job completion:"
+        cat "$MOUNTPOINT/status/$JOB_SET_ID/job_complete"
+        stage_out || exit 1
+        echo "Worker exiting normally"
+        exit 0
+    fi
+    echo "Worker detected master failure:"
+    cat "$MOUNTPOINT/status/$JOB_SET_ID/master_failed" 2>/dev/null
+    echo "Worker exiting with error"
+    exit 1
 fi
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+#### content-addressed cache for motorBike stage results on the shared mount
+# before a stage: ./stage_cache.py lookup --stage snappyHexMesh   (exit 0: restored, 1: run it)
+# after a stage:  ./stage_cache.py store --stage snappyHexMesh
+# per run stats:  ./stage_cache.py report --run-id 20250101120000
+#
+# A stage key hashes the stage's input files, the image, the world size (parallel
+# stages only) and the key of the upstream stage, so a change anywhere upstream
+# invalidates everything below it. The image must be an immutable image@sha256
+# reference (IMAGE_DIGEST, set by submit2.py); with only a re-pushable tag the
+# cache is bypassed, since a rebuilt image would hit entries of the old one.
+# Outputs are stored under <cache dir>/<stage>/<key> and restored as copies
+# (not hardlinks), since later stages such as renumberMesh -overwrite rewrite
+# mesh files in place. With --format zstd (STAGE_CACHE_FORMAT=zstd) an entry
+# is stored as parallel zstd chunks (archive_case.py) instead, which is far
+# fewer files on the mount.
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import archive_case
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("stage_cache")
+
+# Cached stages: inputs and outputs are relative to the case directory
+STAGES = {
+    "blockMesh": {
+        "inputs": ["system/blockMeshDict", "system/controlDict"],
+        "outputs": ["constant/polyMesh"],
+        "upstream": None,
+        "parallel": False,
+    },
+    "decomposePar": {
+        "inputs": ["system/decomposeParDict", "0"],
+        "outputs": ["processor*"],
+        "upstream": "blockMesh",
+        "parallel": False,
+    },
+    "snappyHexMesh": {
+        "inputs": ["system/snappyHexMeshDict", "system/meshQualityDict", "system/surfaceFeaturesDict",
+                   "system/controlDict", "constant/geometry"],
+        "outputs": ["processor*"],
+        "upstream": "decomposePar",
+        "parallel": True,
+    },
+}
+
+# Per-case directory holding the key each stage last ran or restored with
+KEYS_DIR = ".stage_keys"
+
+
+def hash_inputs(case_dir, inputs, digest):
+    """
+    Feed the stage input files into a hash in a stable order.
+
+    Args:
+        case_dir: The case directory
+        inputs: Input paths relative to the case directory (files or directories)
+        digest: The hashlib object to update
+    """
+    for rel in inputs:
+        path = os.path.join(case_dir, rel)
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name)
+                           for root, _, names in os.walk(path) for name in names)
+        elif os.path.isfile(path):
+            files = [path]
+        else:
+            digest.update(f"missing:{rel}\n".encode())
+            continue
+        for file_path in files:
+            digest.update(f"file:{os.path.relpath(file_path, case_dir)}\n".encode())
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+
+
+def read_stage_key(case_dir, stage):
+    """Return the key a stage last ran or restored with in this case, or None."""
+    try:
+        with open(os.path.join(case_dir, KEYS_DIR, stage)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_stage_key(case_dir, stage, key):
+    """Record the key of the stage outputs now present in the case."""
+    os.makedirs(os.path.join(case_dir, KEYS_DIR), exist_ok=True)
+    with open(os.path.join(case_dir, KEYS_DIR, stage), "w") as f:
+        f.write(f"{key}\n")
+
+
+def clear_stage_key(case_dir, stage):
+    """Forget a stage key so downstream stages do not chain on stale outputs."""
+    try:
+        os.remove(os.path.join(case_dir, KEYS_DIR, stage))
+    except OSError:
+        pass
+
+
+def stage_key(case_dir, stage, image, world_size):
+    """
+    Compute the cache key of a stage.
+
+    Args:
+        case_dir: The case directory
+        stage: The stage name
+        image: The image the stage runs in
+        world_size: The number of MPI ranks
+
+    Returns:
+        The key, or None if the upstream stage has no known key
+    """
+    spec = STAGES[stage]
+    digest = hashlib.sha256()
+    digest.update(f"stage:{stage}\nimage:{image}\n".encode())
+    if spec["parallel"]:
+        digest.update(f"world_size:{world_size}\n".encode())
+    # The file handler and I/O ranks decide the processor directory layout
+    digest.update(f"file_handler:{os.environ.get('FOAM_FILEHANDLER', 'uncollated')}\n"
+                  f"io_ranks:{os.environ.get('IO_RANKS', '')}\n".encode())
+    if spec["upstream"]:
+        upstream_key = read_stage_key(case_dir, spec["upstream"])
+        if upstream_key is None:
+            return None
+        digest.update(f"upstream:{upstream_key}\n".encode())
+    hash_inputs(case_dir, spec["inputs"], digest)
+    return digest.hexdigest()[:32]
+
+
+def expand_outputs(base_dir, outputs):
+    """Expand output patterns to the existing paths under base_dir (relative)."""
+    paths = []
+    for pattern in outputs:
+        paths.extend(os.path.relpath(p, base_dir) for p in glob.glob(os.path.join(base_dir, pattern)))
+    return sorted(paths)
+
+
+def copy_path(src, dst):
+    """Copy a file or directory tree, replacing whatever is at dst."""
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        shutil.rmtree(dst)
+    elif os.path.lexists(dst):
+        os.remove(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, symlinks=True)
+    else:
+        shutil.copy2(src, dst)
+
+
+def copy_paths(src_dir, dst_dir, paths, workers):
+    """
+    Copy paths from one directory to another in parallel (one task per path).
+
+    Args:
+        src_dir: The source base directory
+        dst_dir: The destination base directory
+        paths: Paths relative to both base directories
+        workers: Number of parallel copies
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda rel: copy_path(os.path.join(src_dir, rel), os.path.join(dst_dir, rel)), paths))
+
+
+def record(cache_dir, run_id, entry):
+    """Append one stage result to the run's stats file."""
+    runs_dir = os.path.join(cache_dir, "runs")
+    try:
+        os.makedirs(runs_dir, exist_ok=True)
+        with open(os.path.join(runs_dir, f"{run_id}.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not record cache stats for run {run_id}: {e}")
+
+
+def lookup(case_dir, cache_dir, stage, image, world_size, run_id, workers):
+    """
+    Restore a stage's outputs from the cache if its key matches.
+
+    Args:
+        case_dir: The case directory
+        cache_dir: The cache root on the shared mount
+        stage: The stage name
+        image: The image the stage runs in
+        world_size: The number of MPI ranks
+        run_id: The pipeline run the stats are recorded under
+        workers: Number of parallel copies
+
+    Returns:
+        True on a cache hit (outputs restored), False otherwise
+    """
+    start = time.time()
+    key = stage_key(case_dir, stage, image, world_size)
+    entry_dir = os.path.join(cache_dir, stage, key) if key else None
+    if entry_dir is None or not os.path.isfile(os.path.join(entry_dir, "meta.json")):
+        reason = "upstream stage not keyed" if key is None else f"key {key}"
+        logger.info(f"Stage cache miss for {stage} ({reason})")
+        clear_stage_key(case_dir, stage)
+        record(cache_dir, run_id, {"stage": stage, "key": key, "result": "miss",
+                                   "seconds": round(time.time() - start, 3)})
+        return False
+    with open(os.path.join(entry_dir, "meta.json")) as f:
+        meta = json.load(f)
+    # Stale outputs from a previous run must not survive next to the restored ones
+    for rel in expand_outputs(case_dir, STAGES[stage]["outputs"]):
+        copy_target = os.path.join(case_dir, rel)
+        if os.path.isdir(copy_target):
+            shutil.rmtree(copy_target)
+        else:
+            os.remove(copy_target)
+    if meta.get("format", "copy") == "zstd":
+        archive_case.restore(os.path.join(entry_dir, "archive"), case_dir, workers=workers)
+    else:
+        copy_paths(os.path.join(entry_dir, "data"), case_dir, meta["paths"], workers)
+    write_stage_key(case_dir, stage, key)
+    elapsed = time.time() - start
+    logger.info(f"Stage cache hit for {stage} (key {key}): restored {len(meta['paths'])} paths in "
+                f"{int(elapsed * 1000)} ms, originally computed in {meta.get('seconds', 'n/a')} s")
+    record(cache_dir, run_id, {"stage": stage, "key": key, "result": "hit", "seconds": round(elapsed, 3),
+                               "saved_seconds": meta.get("seconds")})
+    return True
+
+
+def store(case_dir, cache_dir, stage, image, world_size, run_id, workers, seconds, entry_format="copy"):
+    """
+    Store a stage's outputs in the cache under its key.
+
+    Args:
+        case_dir: The case directory
+        cache_dir: The cache root on the shared mount
+        stage: The stage name
+        image: The image the stage ran in
+        world_size: The number of MPI ranks
+        run_id: The pipeline run the stats are recorded under
+        workers: Number of parallel copies
+        seconds: How long the stage took to compute, if known
+        entry_format: copy (a tree of copies) or zstd (archive_case.py chunks)
+
+    Returns:
+        True if the outputs were stored, False otherwise
+    """
+    start = time.time()
+    key = stage_key(case_dir, stage, image, world_size)
+    if key is None:
+        logger.warning(f"Not caching {stage}: upstream stage {STAGES[stage]['upstream']} has no key")
+        return False
+    write_stage_key(case_dir, stage, key)
+    entry_dir = os.path.join(cache_dir, stage, key)
+    if os.path.isdir(entry_dir):
+        logger.info(f"Stage {stage} already cached under key {key}")
+        return True
+    paths = expand_outputs(case_dir, STAGES[stage]["outputs"])
+    if not paths:
+        logger.warning(f"Not caching {stage}: no outputs found")
+        return False
+    # Build the entry next to its final place and rename it in, so readers never see a partial entry
+    staging_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    try:
+        if entry_format == "zstd":
+            os.makedirs(staging_dir)
+            archive_case.create(case_dir, os.path.join(staging_dir, "archive"), paths, workers)
+        else:
+            copy_paths(case_dir, os.path.join(staging_dir, "data"), paths, workers)
+        with open(os.path.join(staging_dir, "meta.json"), "w") as f:
+            json.dump({"stage": stage, "key": key, "image": image, "world_size": world_size, "format": entry_format,
+                       "paths": paths, "seconds": seconds, "created": time.strftime('%Y-%m-%dT%H:%M:%S')}, f)
+        os.rename(staging_dir, entry_dir)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not cache {stage} under key {key}: {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
+    elapsed = time.time() - start
+    logger.info(f"Stored {stage} outputs ({len(paths)} paths) under key {key} in {int(elapsed * 1000)} ms")
+    record(cache_dir, run_id, {"stage": stage, "key": key, "result": "stored", "seconds": round(elapsed, 3)})
+    return True
+
+
+def report(cache_dir, run_id):
+    """
+    Print the hit/miss summary of one pipeline run.
+
+    Args:
+        cache_dir: The cache root on the shared mount
+        run_id: The pipeline run
+
+    Returns:
+        0 if stats were found, 1 otherwise
+    """
+    path = os.path.join(cache_dir, "runs", f"{run_id}.jsonl")
+    try:
+        with open(path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        logger.error(f"No cache stats for run {run_id}")
+        return 1
+    hits = [e for e in entries if e["result"] == "hit"]
+    misses = [e for e in entries if e["result"] == "miss"]
+    for entry in entries:
+        print(f"{entry['stage']:<16} {entry['result']:<8} {entry['seconds']:>8.3f}s  {entry['key']}")
+    saved = sum(e.get("saved_seconds") or 0 for e in hits)
+    print(f"Run {run_id}: {len(hits)} hits, {len(misses)} misses, ~{saved:.0f}s of compute skipped")
+    return 0
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Content-addressed cache for motorBike stage results')
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        default=os.environ.get("STAGE_CACHE_DIR",
+                                               os.path.join(os.environ.get("MOUNTPOINT", "/app/shared"), "cache")),
+                        help='Cache root on the shared mount (default: /app/shared/cache)')
+    parser.add_argument('--run-id', dest='run_id',
+                        default=os.environ.get("RUN_ID", os.environ.get("JOB_SET_ID", "adhoc")),
+                        help='Pipeline run the stats are recorded under (default: $RUN_ID or $JOB_SET_ID)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in [('lookup', 'Restore a stage from the cache (exit 0 on hit, 1 on miss)'),
+                            ('store', 'Store a stage in the cache')]:
+        stage_parser = subparsers.add_parser(name, help=help_text)
+        stage_parser.add_argument('--stage', required=True, choices=sorted(STAGES),
+                                  help='Stage name')
+        stage_parser.add_argument('--case-dir', dest='case_dir', default=os.getcwd(),
+                                  help='Case directory (default: current directory)')
+        stage_parser.add_argument('--image', default=os.environ.get("IMAGE_DIGEST") or os.environ.get("MPI_IMAGE", ""),
+                                  help='Image digest, image@sha256:... (default: $IMAGE_DIGEST or $MPI_IMAGE)')
+        stage_parser.add_argument('--world-size', dest='world_size', type=int,
+                                  default=int(os.environ.get("MPI_TOTAL_SLOTS", os.environ.get("MPI_WORLD_SIZE", "1"))),
+                                  help='MPI ranks, i.e. hostfile slots (default: $MPI_TOTAL_SLOTS, else $MPI_WORLD_SIZE)')
+        stage_parser.add_argument('--workers', type=int, default=int(os.environ.get("STAGE_CACHE_WORKERS", "16")),
+                                  help='Number of parallel copies (default: 16)')
+        if name == 'store':
+            stage_parser.add_argument('--seconds', type=float,
+                                      help='How long the stage took to compute')
+            stage_parser.add_argument('--format', dest='entry_format', choices=['copy', 'zstd'],
+                                      default=os.environ.get("STAGE_CACHE_FORMAT", "copy"),
+                                      help='Entry format: copy or zstd chunks (default: copy)')
+    subparsers.add_parser('report', help='Print hit/miss stats for a run')
+    return parser.parse_args()
+
+
+def main():
+    """Run a cache lookup, store or report."""
+    args = parse_arguments()
+    if args.command == 'report':
+        return report(args.cache_dir, args.run_id)
+    if "@sha256:" not in args.image:
+        # A tag is re-pushed on every build.sh run, so it cannot tell two images apart
+        logger.warning(f"Not using the stage cache for {args.stage}: no image digest "
+                       f"(IMAGE_DIGEST), only '{args.image}'")
+        clear_stage_key(args.case_dir, args.stage)
+        return 1 if args.command == 'lookup' else 0
+    if args.command == 'lookup':
+        try:
+            hit = lookup(args.case_dir, args.cache_dir, args.stage, args.image, args.world_size,
+                         args.run_id, args.workers)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Stage cache lookup for {args.stage} failed, running the stage: {e}")
+            clear_stage_key(args.case_dir, args.stage)
+            hit = False
+        return 0 if hit else 1
+    store(args.case_dir, args.cache_dir, args.stage, args.image, args.world_size,
+          args.run_id, args.workers, args.seconds, args.entry_format)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
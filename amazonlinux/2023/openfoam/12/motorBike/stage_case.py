@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+#### fast staging of the motorBike case from the image into the shared mount
+# at image build time (Dockerfile.motorBike_prep):
+#   ./stage_case.py pack
+# in the prep job (prep.sh step "stage", replacing allclean and data_setup):
+#   ./stage_case.py stage --case /app/shared/motorBike
+#
+# pack copies the tutorial, runs its Allclean, adds the surface geometry and
+# stores the result as an archive_case.py archive in the image, with a manifest
+# of every file's size, mtime and sha256 and one content hash over them all.
+# stage turns the case on the mount into a fresh copy of the pack:
+# - paths the pack does not have (meshes, processor directories, time
+#   directories and logs of the previous run) are removed in parallel;
+# - if the case was staged from a pack with the same hash, files whose size
+#   and mtime still match are left alone (--verify compares their sha256);
+# - the remaining files are extracted from the pack in parallel.
+# So the case is written once per image, and a rerun on the same mount only
+# rewrites what earlier stages changed (decomposeParDict, controlDict, ...).
+# The time taken is logged as "Case setup took ..." and kept with the hash in
+# <case>/.case_stage.json.
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import archive_case
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("stage_case")
+
+# Written into the pack next to the archive index
+MANIFEST = "manifest.json"
+
+# Written into the case after staging
+MARKER = ".case_stage.json"
+
+# Case entries that survive staging: the marker, the prep step timings and the stage cache keys
+KEEP = {MARKER, "prep_timings", ".stage_keys"}
+
+
+def file_sha256(path):
+    """Return the sha256 of a file (of the link target name for a symlink)."""
+    digest = hashlib.sha256()
+    if os.path.islink(path):
+        digest.update(os.readlink(path).encode())
+        return digest.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pack(tutorial_dir, geometry, pack_dir, workers):
+    """
+    Build the packed, cleaned case with its geometry.
+
+    Args:
+        tutorial_dir: The tutorial case to copy
+        geometry: Surface geometry files copied to constant/geometry
+        pack_dir: The pack directory to create
+        workers: Number of chunks written at the same time
+
+    Returns:
+        The manifest
+    """
+    with tempfile.TemporaryDirectory(prefix="stage_case-") as tmp:
+        case_dir = os.path.join(tmp, "case")
+        shutil.copytree(tutorial_dir, case_dir, symlinks=True)
+        if os.path.exists(os.path.join(case_dir, "Allclean")):
+            subprocess.run(["./Allclean"], cwd=case_dir, check=True, stdout=subprocess.DEVNULL)
+        os.makedirs(os.path.join(case_dir, "constant", "geometry"), exist_ok=True)
+        for path in geometry:
+            shutil.copy2(path, os.path.join(case_dir, "constant", "geometry"))
+        index = archive_case.create(case_dir, pack_dir, workers=workers)
+        files = {}
+        for chunk in index["chunks"]:
+            for rel, size in chunk["members"]:
+                path = os.path.join(case_dir, rel)
+                files[rel] = [size, int(os.lstat(path).st_mtime), file_sha256(path)]
+    digest = hashlib.sha256()
+    for rel in sorted(files):
+        digest.update(f"{rel}:{files[rel][2]}\n".encode())
+    manifest = {"hash": digest.hexdigest()[:32], "tutorial": tutorial_dir, "files": files,
+                "dirs": index["empty_dirs"], "created": time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(os.path.join(pack_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def stale_paths(case_dir, manifest):
+    """
+    List the case paths the pack does not have, without walking into them.
+
+    Returns:
+        Relative paths to remove
+    """
+    needed = set(manifest["files"])
+    parents = set(manifest["dirs"])
+    for rel in list(needed) + manifest["dirs"]:
+        parent = os.path.dirname(rel)
+        while parent:
+            parents.add(parent)
+            parent = os.path.dirname(parent)
+    stale = []
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        for name in os.listdir(os.path.join(case_dir, rel_dir)):
+            rel = os.path.join(rel_dir, name)
+            path = os.path.join(case_dir, rel)
+            if not rel_dir and name in KEEP:
+                continue
+            if rel in needed and (os.path.islink(path) or not os.path.isdir(path)):
+                continue
+            if rel in parents and os.path.isdir(path) and not os.path.islink(path):
+                pending.append(rel)
+                continue
+            stale.append(rel)
+    return sorted(stale)
+
+
+def remove_path(path):
+    """Remove a file, symlink or directory tree."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def unchanged(path, entry, verify):
+    """Return True if a case file still matches its manifest entry [size, mtime, sha256]."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if st.st_size != entry[0] or int(st.st_mtime) != entry[1]:
+        return False
+    return not verify or file_sha256(path) == entry[2]
+
+
+def read_marker(case_dir):
+    """Return the previous staging record of a case, or {}."""
+    try:
+        with open(os.path.join(case_dir, MARKER)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def stage(pack_dir, case_dir, workers, verify):
+    """
+    Make the case on the mount a fresh copy of the pack.
+
+    Args:
+        pack_dir: The pack built by pack()
+        case_dir: The case directory on the shared mount
+        workers: Number of parallel removals and chunk extractions
+        verify: Compare the sha256 of unchanged-looking files too
+
+    Returns:
+        The staging record
+    """
+    start = time.time()
+    with open(os.path.join(pack_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    os.makedirs(case_dir, exist_ok=True)
+    same_pack = read_marker(case_dir).get("hash") == manifest["hash"]
+    stale = stale_paths(case_dir, manifest)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda rel: remove_path(os.path.join(case_dir, rel)), stale))
+        if same_pack:
+            kept = list(pool.map(lambda rel: unchanged(os.path.join(case_dir, rel), manifest["files"][rel], verify),
+                                 sorted(manifest["files"])))
+            changed = {rel for rel, ok in zip(sorted(manifest["files"]), kept) if not ok}
+        else:
+            changed = set(manifest["files"])
+    if changed == set(manifest["files"]):
+        archive_case.restore(pack_dir, case_dir, workers=workers)
+    else:
+        for rel in manifest["dirs"]:
+            os.makedirs(os.path.join(case_dir, rel), exist_ok=True)
+        if changed:
+            selection = {}
+            for chunk in archive_case.load_index(pack_dir)["chunks"]:
+                members = [rel for rel, _ in chunk["members"] if rel in changed]
+                if members:
+                    selection[chunk["name"]] = members
+            archive_case.restore(pack_dir, case_dir, selection, workers)
+    record = {"hash": manifest["hash"], "staged": time.strftime('%Y-%m-%dT%H:%M:%S'),
+              "job_set": os.environ.get("JOB_SET_ID", ""), "extracted": len(changed),
+              "unchanged": len(manifest["files"]) - len(changed), "removed": len(stale),
+              "seconds": round(time.time() - start, 3)}
+    with open(os.path.join(case_dir, MARKER), "w") as f:
+        json.dump(record, f, indent=2)
+    return record
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Fast staging of the motorBike case into the shared mount')
+    parser.add_argument('--pack', dest='pack_dir', default=os.environ.get("CASE_PACK", "/app/case_pack"),
+                        help='Packed case in the image (default: /app/case_pack)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("STAGE_WORKERS", "8")),
+                        help='Parallel chunk writes, extractions and removals (default: 8)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    tutorial = os.environ.get("TUTORIAL", "motorBike")
+    tutorials = os.environ.get("FOAM_TUTORIALS", os.path.join(os.environ.get("WM_PROJECT_DIR", ""), "tutorials"))
+    pack_parser = subparsers.add_parser('pack', help='Build the packed case (at image build time)')
+    pack_parser.add_argument('--tutorial', dest='tutorial_dir',
+                             default=os.path.join(tutorials, "incompressibleFluid", tutorial, tutorial),
+                             help='Tutorial case (default: $FOAM_TUTORIALS/incompressibleFluid/$TUTORIAL/$TUTORIAL)')
+    pack_parser.add_argument('--geometry', nargs='*',
+                             default=[os.path.join(tutorials, "resources", "geometry", f"{tutorial}.obj.gz")],
+                             help='Geometry files for constant/geometry (default: $TUTORIAL.obj.gz)')
+    stage_parser = subparsers.add_parser('stage', help='Stage the packed case into the case directory')
+    stage_parser.add_argument('--case', dest='case_dir',
+                              default=os.path.join(os.environ.get("WORK_DIR", "/app/shared"), tutorial),
+                              help='Case directory (default: $WORK_DIR/$TUTORIAL)')
+    stage_parser.add_argument('--verify', action='store_true',
+                              default=os.environ.get("STAGE_VERIFY", "false") == "true",
+                              help='Compare file contents, not only size and mtime, before skipping a file')
+    return parser.parse_args()
+
+
+def main():
+    """Build the pack or stage the case."""
+    args = parse_arguments()
+    try:
+        if args.command == 'pack':
+            manifest = pack(args.tutorial_dir, args.geometry, args.pack_dir, args.workers)
+            logger.info(f"Packed {len(manifest['files'])} files of {args.tutorial_dir} into {args.pack_dir} "
+                        f"(hash {manifest['hash']})")
+            return 0
+        record = stage(args.pack_dir, args.case_dir, args.workers, args.verify)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logger.error(f"Could not {args.command} the case: {e}")
+        return 1
+    logger.info(f"Case setup took {int(record['seconds'] * 1000)} ms: {record['extracted']} files extracted, "
+                f"{record['unchanged']} unchanged, {record['removed']} stale paths removed (hash {record['hash']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,11 +11,14 @@
 #  --memory-request 2Gi
 
 import os
+import sys
+import json
 import uuid
 import grpc
 import time
 import logging
 import argparse
+import subprocess
 from armada_client.client import ArmadaClient
 from armada_client.k8s.io.api.core.v1 import generated_pb2 as core_v1
 from armada_client.k8s.io.apimachinery.pkg.api.resource import generated_pb2 as api_resource
@@ -27,6 +30,41 @@ from armada_client.typings import EventType
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Job set results reported by monitor_job_set
+RESULT_SUCCEEDED = "succeeded"
+RESULT_FAILED = "failed"
+RESULT_TIMEOUT = "timeout"
+RESULT_GANG_INCOMPLETE = "gang_incomplete"
+RESULT_RUNNING = "running"
+RESULT_RESTARTABLE = "restartable"
+
+# Process exit code for each job set result
+RESULT_EXIT_CODES = {
+    RESULT_SUCCEEDED: 0,
+    RESULT_FAILED: 1,
+    RESULT_TIMEOUT: 2,
+    RESULT_GANG_INCOMPLETE: 3,
+    RESULT_RUNNING: 0,
+    RESULT_RESTARTABLE: 4,
+}
+
+# Container exit code used by setup_mpi.sh when not all ranks arrived in time
+EXIT_GANG_INCOMPLETE = 75
+
+# Failures worth restarting from the latest complete time: a worker that lost its
+# master (setup_mpi.sh), a SIGKILLed container (OOM killer, node shutdown), and
+# Armada's Evicted/OOM failure causes
+EXIT_MASTER_LOST = 76
+RESTARTABLE_EXIT_CODES = {EXIT_MASTER_LOST, 137}
+RESTARTABLE_CAUSES = {1, 2}
+
+# Written by build.sh: "<image:tag> <image@sha256:digest>" per push, newest last
+IMAGE_DIGESTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_digests.txt")
+
+# Node-local scratch volume for --scratch-staging
+SCRATCH_VOLUME_NAME = "scratch"
+SCRATCH_MOUNT_PATH = "/scratch"
+
 
 def parse_arguments():
     """Parse command line arguments and combine with environment variables."""
@@ -78,6 +116,8 @@ def parse_arguments():
                         help='CPU request for containers (default: 1)')
     parser.add_argument('--memory-request', dest='memory_request',
                         help='Memory request for containers (default: 2Gi)')
+    parser.add_argument('--ephemeral-request', dest='ephemeral_request',
+                        help='Ephemeral storage request for containers (default: 8Gi)')
     # Node scheduling settings
     parser.add_argument('--target-node', dest='target_node',
                         help='Target specific node for all pods (default: none)')
@@ -87,6 +127,37 @@ def parse_arguments():
                         help='Disable gang scheduling for MPI jobs')
     parser.add_argument('--node-concentration', dest='node_concentration', action='store_true',
                         help='Enable node concentration to place pods on same node')
+    # MPI bootstrap settings
+    parser.add_argument('--host-mode', dest='host_mode', choices=['fqdn', 'ip'],
+                        help='Hostfile addressing: fqdn (CoreDNS) or ip (no DNS lookups) (default: fqdn)')
+    parser.add_argument('--gang-arrival-timeout', dest='gang_arrival_timeout', type=int,
+                        help='Seconds for all ranks to register before the job set aborts (default: 180)')
+    parser.add_argument('--env', dest='extra_env', action='append', metavar='NAME=VALUE',
+                        help='Extra environment variable for all pods (repeatable)')
+    parser.add_argument('--warm-pool', dest='warm_pool', action='store_true', default=None,
+                        help='Return once all pods are running instead of waiting for completion')
+    parser.add_argument('--scratch-staging', dest='scratch_staging', action='store_true', default=None,
+                        help='Run parallel stages on node-local scratch instead of the shared mount')
+    parser.add_argument('--scratch-size', dest='scratch_size',
+                        help='Size limit of the scratch volume (default: 6Gi)')
+    parser.add_argument('--file-handler', dest='file_handler', choices=['uncollated', 'collated'],
+                        help='OpenFOAM parallel I/O: uncollated (processorN per rank) or collated (processors<N>) (default: uncollated)')
+    parser.add_argument('--log-metrics-port', dest='log_metrics_port', type=int,
+                        help='Serve live solver metrics from the stage logs on this port of the master pod (default: off)')
+    parser.add_argument('--converge', dest='converge', action='store_true', default=None,
+                        help='Stop foamRun early once residuals or force coefficients have converged')
+    parser.add_argument('--io-policy', dest='io_policy',
+                        help='Write interval/purge/format policy applied before foamRun, see io_policy.py list (default: tutorial)')
+    parser.add_argument('--restart-retries', dest='restart_retries', type=int,
+                        help='Resubmissions after a preemption, node loss or OOM, restarting foamRun from its latest time (default: 0)')
+    parser.add_argument('--io-ranks', dest='io_ranks', type=int,
+                        help='Number of ranks doing collated I/O (default: 1, the master)')
+    # Bookkeeping
+    parser.add_argument('--ledger', dest='ledger',
+                        help='File recording job set terminal states (default: jobsets.log)')
+    parser.add_argument('--image-digest', dest='image_digest',
+                        help='Immutable image@sha256 reference for the stage cache key (default: resolved from '
+                             'image_digests.txt or the local docker daemon)')
     # Parse the arguments
     args = parser.parse_args()
     # Create a config dictionary by combining environment variables and command-line arguments
@@ -115,13 +186,31 @@ def parse_arguments():
         'QUEUE_GROUP': os.environ.get("QUEUE_GROUP", "admins") if args.queue_group is None else args.queue_group,
         # Container settings
         'MPI_IMAGE': os.environ.get("MPI_IMAGE", "blik6126287/amazonlinux2023_openfoam12:test") if args.mpi_image is None else args.mpi_image,
+        'IMAGE_DIGEST': os.environ.get("IMAGE_DIGEST", "") if args.image_digest is None else args.image_digest,
         'CPU_REQUEST': os.environ.get("CPU_REQUEST", "1") if args.cpu_request is None else args.cpu_request,
         'MEMORY_REQUEST': os.environ.get("MEMORY_REQUEST", "2Gi") if args.memory_request is None else args.memory_request,
+        'EPHEMERAL_REQUEST': os.environ.get("EPHEMERAL_REQUEST", "8Gi") if args.ephemeral_request is None else args.ephemeral_request,
         # Node scheduling settings
         'TARGET_NODE': os.environ.get("TARGET_NODE", "") if args.target_node is None else args.target_node,
         'MAX_PODS_PER_NODE': int(os.environ.get("MAX_PODS_PER_NODE", "0")) if args.max_pods_per_node is None else args.max_pods_per_node,
         'DISABLE_GANG_SCHEDULING': os.environ.get("DISABLE_GANG_SCHEDULING", "false").lower() == "true" if args.disable_gang_scheduling is None else args.disable_gang_scheduling,
         'NODE_CONCENTRATION': os.environ.get("NODE_CONCENTRATION", "false").lower() == "true" if args.node_concentration is None else args.node_concentration,
+        # MPI bootstrap settings
+        'HOST_MODE': os.environ.get("MPI_HOST_MODE", "fqdn") if args.host_mode is None else args.host_mode,
+        'GANG_ARRIVAL_TIMEOUT': int(os.environ.get("GANG_ARRIVAL_TIMEOUT", "180")) if args.gang_arrival_timeout is None else args.gang_arrival_timeout,
+        'EXTRA_ENV': dict(item.split("=", 1) for item in (args.extra_env or [])),
+        'WARM_POOL': os.environ.get("WARM_POOL", "false").lower() == "true" if args.warm_pool is None else args.warm_pool,
+        'SCRATCH_STAGING': os.environ.get("SCRATCH_STAGING", "false").lower() == "true" if args.scratch_staging is None else args.scratch_staging,
+        'SCRATCH_SIZE': os.environ.get("SCRATCH_SIZE", "6Gi") if args.scratch_size is None else args.scratch_size,
+        'FILE_HANDLER': os.environ.get("FOAM_FILEHANDLER", "uncollated") if args.file_handler is None else args.file_handler,
+        'LOG_METRICS_PORT': int(os.environ.get("FOAM_LOG_METRICS_PORT", "0") or 0) if args.log_metrics_port is None else args.log_metrics_port,
+        'CONVERGE': os.environ.get("FOAM_CONVERGE", "false").lower() == "true" if args.converge is None else args.converge,
+        'IO_RANKS': int(os.environ.get("IO_RANKS", "1")) if args.io_ranks is None else args.io_ranks,
+        'IO_POLICY': os.environ.get("FOAM_IO_POLICY", "") if args.io_policy is None else args.io_policy,
+        'RESTART_RETRIES': int(os.environ.get("RESTART_RETRIES", "0")) if args.restart_retries is None else args.restart_retries,
+        'RESTART': os.environ.get("FOAM_RESTART", "false").lower() == "true",
+        # Bookkeeping
+        'JOBSET_LEDGER': os.environ.get("JOBSET_LEDGER", "jobsets.log") if args.ledger is None else args.ledger,
     }
     return config
 
@@ -278,6 +367,64 @@ def create_volume_with_pvc(pvc_name, volume_name):
         raise
 
 
+def resolve_image_digest(image, digests_file):
+    """
+    Resolve an image reference to its immutable image@sha256 digest.
+
+    build.sh records the digest of every tag it pushes; failing that, a local
+    docker daemon that pulled or pushed the tag is asked.
+
+    Args:
+        image: The image reference, e.g. repo:tag
+        digests_file: The digests recorded by build.sh
+
+    Returns:
+        The digest reference, or "" if it cannot be resolved
+    """
+    if "@sha256:" in image:
+        return image
+    digest = ""
+    try:
+        with open(digests_file) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and fields[0] == image:
+                    digest = fields[1]
+    except OSError:
+        pass
+    if digest:
+        return digest
+    repository = image.rsplit(":", 1)[0] if ":" in image.rsplit("/", 1)[-1] else image
+    try:
+        result = subprocess.run(["docker", "image", "inspect", "--format", "{{json .RepoDigests}}", image],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                                timeout=10)
+        for candidate in json.loads(result.stdout or "null") or []:
+            if candidate.startswith(f"{repository}@"):
+                return candidate
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        pass
+    logger.warning(f"Could not resolve the digest of {image}; the stage cache will not be used")
+    return ""
+
+
+def cpu_request_to_slots(cpu_request):
+    """
+    Convert a Kubernetes CPU quantity into a whole number of MPI slots.
+
+    Args:
+        cpu_request: CPU quantity string, e.g. "2", "1.5" or "500m"
+
+    Returns:
+        The number of whole cores in the request, at least 1
+    """
+    if cpu_request.endswith("m"):
+        cores = float(cpu_request[:-1]) / 1000
+    else:
+        cores = float(cpu_request)
+    return max(1, int(cores))
+
+
 def create_mpi_pod_spec(client, rank, world_size, job_set_id, config):
     """
     Create a pod spec for an MPI process (master or worker).
@@ -304,9 +451,13 @@ def create_mpi_pod_spec(client, rank, world_size, job_set_id, config):
         core_v1.EnvVar(name="MPI_WORLD_SIZE", value=str(world_size)),
         core_v1.EnvVar(name="MPI_RANK", value=str(rank)),
         core_v1.EnvVar(name="MPI_MASTER_PORT", value="29500"),
+        core_v1.EnvVar(name="MPI_CONTROL_PORT", value="29501"),
         core_v1.EnvVar(name="JOB_SET_ID", value=job_set_id),
         core_v1.EnvVar(name="POD_NAME", value=pod_name),
         core_v1.EnvVar(name="MPI_JOB_ID", value=job_set_id),
+        # Image reference; the digest (when known) is the stage cache key, since tags are re-pushed
+        core_v1.EnvVar(name="MPI_IMAGE", value=config['MPI_IMAGE']),
+        core_v1.EnvVar(name="IMAGE_DIGEST", value=config['IMAGE_DIGEST']),
         # Template for direct DNS-based discovery
         core_v1.EnvVar(name="MPI_MASTER_ADDR", value=f"mpi-0-{job_set_id}"),
         # OpenMPI configurations
@@ -316,7 +467,46 @@ def create_mpi_pod_spec(client, rank, world_size, job_set_id, config):
         core_v1.EnvVar(name="OMPI_MCA_orte_keep_fqdn_hostnames", value="t"),
         # Shared mount path environment variable
         core_v1.EnvVar(name="MOUNTPOINT", value=config['PVC_MOUNT_PATH']),
+        # Placement details used to order the hostfile by node and rank
+        core_v1.EnvVar(
+            name="NODE_NAME",
+            valueFrom=core_v1.EnvVarSource(
+                fieldRef=core_v1.ObjectFieldSelector(fieldPath="spec.nodeName")
+            )
+        ),
+        core_v1.EnvVar(name="MPI_SLOTS", value=str(cpu_request_to_slots(config['CPU_REQUEST']))),
+        # Requests, recorded with each resource profile
+        core_v1.EnvVar(name="CPU_REQUEST", value=config['CPU_REQUEST']),
+        core_v1.EnvVar(name="MEMORY_REQUEST", value=config['MEMORY_REQUEST']),
+        core_v1.EnvVar(name="EPHEMERAL_REQUEST", value=config['EPHEMERAL_REQUEST']),
+        # Hostfile addressing mode (fqdn or ip)
+        core_v1.EnvVar(name="MPI_HOST_MODE", value=config['HOST_MODE']),
+        # Deadline for the whole gang to register
+        core_v1.EnvVar(name="GANG_ARRIVAL_TIMEOUT", value=str(config['GANG_ARRIVAL_TIMEOUT'])),
     ]
+    # Node-local scratch staging of processor directories
+    if config['SCRATCH_STAGING']:
+        mpi_env.append(core_v1.EnvVar(name="SCRATCH_STAGING", value="true"))
+        mpi_env.append(core_v1.EnvVar(name="SCRATCH_DIR", value=SCRATCH_MOUNT_PATH))
+    # Parallel I/O mode; prep writes it into controlDict and runParallel passes it on
+    if config['FILE_HANDLER'] != "uncollated":
+        mpi_env.append(core_v1.EnvVar(name="FOAM_FILEHANDLER", value=config['FILE_HANDLER']))
+        mpi_env.append(core_v1.EnvVar(name="IO_RANKS", value=str(config['IO_RANKS'])))
+    # Live solver metrics (foam_log.py, started by runParallel)
+    if config['LOG_METRICS_PORT']:
+        mpi_env.append(core_v1.EnvVar(name="FOAM_LOG_METRICS_PORT", value=str(config['LOG_METRICS_PORT'])))
+    # Convergence-based early stop of foamRun (converge.py, started by runParallel)
+    if config['CONVERGE']:
+        mpi_env.append(core_v1.EnvVar(name="FOAM_CONVERGE", value="true"))
+    # Solver write policy (io_policy.py, applied by runParallel)
+    if config['IO_POLICY']:
+        mpi_env.append(core_v1.EnvVar(name="FOAM_IO_POLICY", value=config['IO_POLICY']))
+    # Resubmission after a restartable failure (restart.py, started by runParallel)
+    if config['RESTART']:
+        mpi_env.append(core_v1.EnvVar(name="FOAM_RESTART", value="true"))
+    # Extra environment variables passed with --env
+    for name, value in config['EXTRA_ENV'].items():
+        mpi_env.append(core_v1.EnvVar(name=name, value=value))
     
     # Add an additional environment variable to help with non-gang scheduling if enabled
     if config['DISABLE_GANG_SCHEDULING']:
@@ -359,25 +549,31 @@ def create_mpi_pod_spec(client, rank, world_size, job_set_id, config):
             requests={
                 "cpu": api_resource.Quantity(string=config['CPU_REQUEST']),
                 "memory": api_resource.Quantity(string=config['MEMORY_REQUEST']),
-                "ephemeral-storage": api_resource.Quantity(string="8Gi"),
+                "ephemeral-storage": api_resource.Quantity(string=config['EPHEMERAL_REQUEST']),
             },
             limits={
                 "cpu": api_resource.Quantity(string=config['CPU_REQUEST']),
                 "memory": api_resource.Quantity(string=config['MEMORY_REQUEST']),
-                "ephemeral-storage": api_resource.Quantity(string="8Gi"),
+                "ephemeral-storage": api_resource.Quantity(string=config['EPHEMERAL_REQUEST']),
             },
         ),
         ports=[
             # SSH port for MPI communication
             core_v1.ContainerPort(containerPort=22, protocol="TCP"),
-        ],
+            # Rendezvous port for master/worker liveness
+            core_v1.ContainerPort(containerPort=29500, protocol="TCP"),
+        ] + ([
+            # Live solver metrics
+            core_v1.ContainerPort(containerPort=config['LOG_METRICS_PORT'], protocol="TCP"),
+        ] if config['LOG_METRICS_PORT'] else []),
         # Use volumeMount with new volume name
         volumeMounts=[
             core_v1.VolumeMount(
                 name=config['PVC_VOLUME_NAME'],
                 mountPath=config['PVC_MOUNT_PATH']
             )
-        ],
+        ] + ([core_v1.VolumeMount(name=SCRATCH_VOLUME_NAME, mountPath=SCRATCH_MOUNT_PATH)]
+             if config['SCRATCH_STAGING'] else []),
         # We still need privileged access for the MPI tasks
         securityContext=core_v1.SecurityContext(
             privileged=True,
@@ -391,6 +587,18 @@ def create_mpi_pod_spec(client, rank, world_size, job_set_id, config):
         shared_volume = create_volume_with_pvc(config['PVC_NAME'], config['PVC_VOLUME_NAME'])
         logger.info(f"Created volume '{config['PVC_VOLUME_NAME']}' referencing PVC '{config['PVC_NAME']}'")
         
+        volumes = [shared_volume]
+        if config['SCRATCH_STAGING']:
+            # emptyDir counts against the container's ephemeral-storage request
+            volumes.append(core_v1.Volume(
+                name=SCRATCH_VOLUME_NAME,
+                volumeSource=core_v1.VolumeSource(
+                    emptyDir=core_v1.EmptyDirVolumeSource(
+                        sizeLimit=api_resource.Quantity(string=config['SCRATCH_SIZE'])
+                    )
+                )
+            ))
+        
         # Prepare tolerations for pod placement
         tolerations = []
         if config['NODE_CONCENTRATION']:
@@ -412,7 +620,7 @@ def create_mpi_pod_spec(client, rank, world_size, job_set_id, config):
         # Create pod spec with container and volume
         pod_spec = core_v1.PodSpec(
             containers=[main_container],
-            volumes=[shared_volume],
+            volumes=volumes,
             nodeSelector=node_selector,
             tolerations=tolerations,
             # Updated fsGroup for file access
@@ -503,9 +711,28 @@ def submit_mpi_job(client, queue_name, config):
     return job_set_id, job_ids
 
 
+def cancel_job_set(client, queue_name, job_set_id):
+    """
+    Cancel every job in a job set so its capacity is released.
+
+    Args:
+        client: The Armada client
+        queue_name: The queue name
+        job_set_id: The job set ID to cancel
+    """
+    try:
+        client.cancel_jobs(queue=queue_name, job_set_id=job_set_id)
+        logger.info(f"Cancelled job set {job_set_id}")
+    except grpc.RpcError as e:
+        logger.error(f"Failed to cancel job set {job_set_id}: {e}")
+
+
 def monitor_job_set(client, queue_name, job_set_id, config):
     """
     Monitor the status of a job set until all jobs complete or timeout.
+    A rank exiting with EXIT_GANG_INCOMPLETE cancels the job set straight away.
+    A failed job set with a preempted, evicted, OOM-killed or master-lost rank is restartable.
+    For a warm pool, monitoring ends as soon as every pod is running.
 
     Args:
         client: The Armada client
@@ -514,7 +741,8 @@ def monitor_job_set(client, queue_name, job_set_id, config):
         config: Configuration dictionary
 
     Returns:
-        True if all jobs succeeded, False otherwise
+        One of RESULT_SUCCEEDED, RESULT_FAILED, RESULT_RESTARTABLE, RESULT_TIMEOUT,
+        RESULT_GANG_INCOMPLETE or RESULT_RUNNING (warm pool only)
     """
     timeout_seconds = config['MONITORING_TIMEOUT']
     logger.info(f"Monitoring job set {job_set_id} with {timeout_seconds}s timeout")
@@ -525,16 +753,17 @@ def monitor_job_set(client, queue_name, job_set_id, config):
         event_stream = client.get_job_events_stream(queue=queue_name, job_set_id=job_set_id)
     except grpc.RpcError as e:
         logger.error(f"Failed to get event stream: {e}")
-        return False
+        return RESULT_FAILED
     # Track job states
     job_states = {}
+    restart_causes = []
     start_time = time.time()
     try:
         for event_grpc in event_stream:
             # Check timeout
             if time.time() - start_time > timeout_seconds:
                 logger.error(f"Monitoring timed out after {timeout_seconds} seconds")
-                return False
+                return RESULT_TIMEOUT
             # Process event
             event = client.unmarshal_event_response(event_grpc)
             job_id = event.message.job_id
@@ -542,31 +771,77 @@ def monitor_job_set(client, queue_name, job_set_id, config):
             logger.info(f"Job {job_id} - {event_type}")
             # Update job state
             job_states[job_id] = event_type
+            # The master pod hosts the warm pool control port
+            if event_type == EventType.running and job_id == config.get('MASTER_JOB_ID'):
+                logger.info(f"Master pod {event.message.pod_name} running on {event.message.node_name}")
+            # A warm pool is ready for dispatch once every rank is running
+            if config['WARM_POOL'] and len(job_states) == config['MPI_PROCESSES'] \
+                    and all(state == EventType.running for state in job_states.values()):
+                logger.info(f"Warm pool {job_set_id} is running with {config['MPI_PROCESSES']} ranks")
+                return RESULT_RUNNING
+            # A rank that gave up waiting for the gang fails the whole job set
+            if event_type == EventType.failed:
+                exit_codes = [status.exitCode for status in event.message.container_statuses]
+                if EXIT_GANG_INCOMPLETE in exit_codes:
+                    logger.error(f"Job set {job_set_id} gang incomplete: not all {config['MPI_PROCESSES']} ranks "
+                                 f"registered within {config['GANG_ARRIVAL_TIMEOUT']}s")
+                    cancel_job_set(client, queue_name, job_set_id)
+                    return RESULT_GANG_INCOMPLETE
+                statuses = event.message.container_statuses
+                if event.message.cause in RESTARTABLE_CAUSES \
+                        or any(s.exitCode in RESTARTABLE_EXIT_CODES or s.reason == "OOMKilled" for s in statuses):
+                    restart_causes.append(f"{job_id} ({', '.join(s.reason or f'exit {s.exitCode}' for s in statuses)})")
+            if event_type == EventType.preempted:
+                restart_causes.append(f"{job_id} (preempted)")
             # Check for terminal events
-            terminal_events = [EventType.failed, EventType.succeeded, EventType.cancelled]
+            terminal_events = [EventType.failed, EventType.succeeded, EventType.cancelled, EventType.preempted]
             # Check if all jobs have reached terminal state
             active_jobs = [job_id for job_id, state in job_states.items()
                            if state not in terminal_events]
             if not active_jobs and job_states:
                 # All jobs have reached terminal state
                 failed_jobs = [job_id for job_id, state in job_states.items()
-                               if state == EventType.failed or state == EventType.cancelled]
+                               if state in (EventType.failed, EventType.cancelled, EventType.preempted)]
+                if failed_jobs and restart_causes:
+                    logger.error(f"Job set {job_set_id} has {len(failed_jobs)} failed jobs, restartable: "
+                                 f"{'; '.join(restart_causes)}")
+                    return RESULT_RESTARTABLE
                 if failed_jobs:
                     logger.error(f"Job set {job_set_id} has {len(failed_jobs)} failed jobs")
-                    return False
+                    return RESULT_FAILED
                 else:
                     logger.info(f"All jobs in job set {job_set_id} completed successfully")
-                    return True
+                    return RESULT_SUCCEEDED
     except Exception as e:
         logger.error(f"Error monitoring job set: {e}")
-        return False
+        return RESULT_FAILED
     finally:
         # Close the event stream
         try:
             client.unwatch_events(event_stream)
         except Exception as e:
             logger.warning(f"Error closing event stream: {e}")
-    return False
+    return RESULT_FAILED
+
+
+def record_job_set_result(ledger, job_set_id, queue_name, state):
+    """
+    Append a job set's terminal state to the ledger.
+
+    The ledger feeds the shared-mount sweeper (gc_sweep.sh), which removes the
+    coordination directories of job sets recorded here once they expire.
+
+    Args:
+        ledger: Path of the ledger file
+        job_set_id: The job set ID
+        queue_name: The queue the job set ran in
+        state: Terminal state of the job set
+    """
+    try:
+        with open(ledger, "a") as f:
+            f.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {job_set_id} {queue_name} {state}\n")
+    except OSError as e:
+        logger.warning(f"Could not record job set {job_set_id} in {ledger}: {e}")
 
 
 def main():
@@ -574,6 +849,8 @@ def main():
     try:
         # Parse arguments and build configuration
         config = parse_arguments()
+        if not config['IMAGE_DIGEST']:
+            config['IMAGE_DIGEST'] = resolve_image_digest(config['MPI_IMAGE'], IMAGE_DIGESTS_FILE)
         
         # Print configuration summary
         logger.info("Starting Armada MPI job submission with the following configuration:")
@@ -582,6 +859,29 @@ def main():
         logger.info(f"  Disable Gang Scheduling: {config['DISABLE_GANG_SCHEDULING']}")
         logger.info(f"  Node Concentration: {config['NODE_CONCENTRATION']}")
         logger.info(f"  Max Pods Per Node: {config['MAX_PODS_PER_NODE'] if config['MAX_PODS_PER_NODE'] > 0 else 'Unlimited'}")
+        logger.info(f"  Host Mode: {config['HOST_MODE']}")
+        logger.info(f"  Warm Pool: {config['WARM_POOL']}")
+        logger.info(f"  Scratch Staging: {config['SCRATCH_STAGING']}")
+        logger.info(f"  File Handler: {config['FILE_HANDLER']}"
+                    + (f" ({config['IO_RANKS']} I/O ranks)" if config['FILE_HANDLER'] == "collated" else ""))
+        logger.info(f"  Converge: {config['CONVERGE']}")
+        logger.info(f"  I/O Policy: {config['IO_POLICY'] or 'tutorial'}")
+        logger.info(f"  Restart Retries: {config['RESTART_RETRIES']}" + (" (restarting)" if config['RESTART'] else ""))
+        logger.info(f"  Log Metrics Port: {config['LOG_METRICS_PORT'] or 'Off'}")
+        logger.info(f"  Image Digest: {config['IMAGE_DIGEST'] or 'unresolved (stage cache disabled)'}")
+        if config['SCRATCH_STAGING'] and config['FILE_HANDLER'] == "collated":
+            logger.error("Scratch staging splits processorN directories per pod and cannot be used with collated I/O")
+            return 1
+        if config['SCRATCH_STAGING'] and config['WARM_POOL']:
+            logger.error("Warm pool commands run on the shared mount, so scratch staging would copy stale "
+                         "processorN directories back over their results; drop --scratch-staging")
+            return 1
+        restarting = config['RESTART'] or config['EXTRA_ENV'].get("FOAM_RESTART", "false").lower() == "true"
+        if config['SCRATCH_STAGING'] and (config['RESTART_RETRIES'] > 0 or restarting):
+            logger.error("Scratch staging keeps a run's times off the shared mount until stage-out and leaves "
+                         "other pods' processorN directories empty, so it cannot restart from the latest time; "
+                         "drop --restart-retries/FOAM_RESTART or --scratch-staging")
+            return 1
         
         # Create Armada client
         client = create_armada_client(config)
@@ -616,22 +916,38 @@ def main():
         logger.info(f"The PVC should have accessModes: ReadWriteMany")
         logger.info(f"Using FSX for shared filesystem access")
         
-        # Submit MPI job
-        job_set_id, job_ids = submit_mpi_job(client, queue_name, config)
-        logger.info(f"MPI job set {job_set_id} submitted successfully")
-        logger.info(f"Using FSX PVC {config['PVC_NAME']} mounted at {config['PVC_MOUNT_PATH']}")
-        logger.info(f"All pods will run with resource constraints ({config['CPU_REQUEST']} CPU, {config['MEMORY_REQUEST']} memory)")
-        
-        # Monitor job execution
-        success = monitor_job_set(client, queue_name, job_set_id, config)
-        if success:
-            logger.info("MPI job completed successfully")
-        else:
-            logger.error("MPI job failed")
+        # Submit MPI job, again from the latest complete time after a restartable failure
+        restarts = 0
+        while True:
+            job_set_id, job_ids = submit_mpi_job(client, queue_name, config)
+            logger.info(f"MPI job set {job_set_id} submitted successfully")
+            logger.info(f"Using FSX PVC {config['PVC_NAME']} mounted at {config['PVC_MOUNT_PATH']}")
+            logger.info(f"All pods will run with resource constraints ({config['CPU_REQUEST']} CPU, {config['MEMORY_REQUEST']} memory, "
+                        f"{config['EPHEMERAL_REQUEST']} ephemeral storage)")
+            
+            # Monitor job execution
+            config['MASTER_JOB_ID'] = job_ids[0]
+            result = monitor_job_set(client, queue_name, job_set_id, config)
+            if result == RESULT_RUNNING:
+                logger.info(f"Warm pool ready - dispatch with ./warm_pool.py through kubectl port-forward "
+                            f"pod/armada-{job_ids[0]}-0 29501:29501")
+                return RESULT_EXIT_CODES[result]
+            if result == RESULT_SUCCEEDED:
+                logger.info("MPI job completed successfully")
+            elif result == RESULT_GANG_INCOMPLETE:
+                logger.error("MPI job gang incomplete - job set cancelled and capacity released")
+            else:
+                logger.error(f"MPI job failed ({result})")
+            record_job_set_result(config['JOBSET_LEDGER'], job_set_id, queue_name, result)
+            if result != RESULT_RESTARTABLE or restarts >= config['RESTART_RETRIES']:
+                return RESULT_EXIT_CODES[result]
+            restarts += 1
+            config['RESTART'] = True
+            logger.warning(f"Resubmitting from the latest complete time (restart {restarts}/{config['RESTART_RETRIES']})")
     except Exception as e:
         logger.error(f"Workflow failed: {e}")
         raise
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+#### control channel for a warm MPI pod pool
+# rank 0 (as the setup_mpi.sh task): ./warm_pool.py serve --port 29501
+# submitter: ./warm_pool.py dispatch --host localhost --port 29501 "runParallel -np 8 renumberMesh -overwrite"
+# submitter: ./warm_pool.py shutdown --host localhost --port 29501
+#
+# The pool bootstraps once (sshd, keys, hostfile, rendezvous) and then runs
+# successive stage commands on rank 0 against the same hostfile. Each command's
+# output is streamed back to the submitter, followed by its exit code. SHUTDOWN
+# ends the task, so the normal setup_mpi.sh exit path releases the workers.
+# Dispatched commands run as root in a privileged pod, so the server only
+# listens on loopback: the submitter reaches it with kubectl port-forward.
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import subprocess
+
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("warm_pool")
+
+# Shell preamble for dispatched commands, matching the stage image entrypoints
+COMMAND_PREAMBLE = ("source ${WM_PROJECT_DIR}/etc/bashrc && "
+                    "source ${WM_PROJECT_DIR}/bin/tools/RunFunctions && "
+                    "source /app/runParallel.sh && "
+                    "cd ${WORK_DIR}/${TUTORIAL} && ")
+
+# Exit code reported when a dispatched command could not be started
+EXIT_NOT_STARTED = 127
+
+
+def read_line(conn):
+    """
+    Read one newline-terminated line from a socket.
+
+    Args:
+        conn: The socket to read from
+
+    Returns:
+        The decoded line, or None if the peer closed the connection
+    """
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(1)
+        if not chunk:
+            return None
+        data += chunk
+    return data.decode(errors="replace").rstrip("\n")
+
+
+class ControlServer:
+    """Rank-0 side of the warm pool: runs one dispatched command at a time."""
+
+    def __init__(self, port, idle_timeout):
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.run_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.last_activity = time.time()
+        self.commands = 0
+        self.failures = 0
+
+    def run(self, command, conn):
+        """
+        Run a command through bash and stream its output to the client.
+
+        Args:
+            command: The shell command to run
+            conn: The client socket
+
+        Returns:
+            The command's exit code
+        """
+        logger.info(f"Running: {command}")
+        start = time.time()
+        try:
+            process = subprocess.Popen(["/bin/bash", "-c", COMMAND_PREAMBLE + command],
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            logger.error(f"Could not start command: {e}")
+            return EXIT_NOT_STARTED
+        client_gone = False
+        for line in process.stdout:
+            if client_gone:
+                continue
+            try:
+                conn.sendall(b"OUT " + line)
+            except OSError:
+                # Keep the command running; the pool outlives a dropped dispatcher
+                logger.warning("Dispatcher disconnected, command continues")
+                client_gone = True
+        status = process.wait()
+        logger.info(f"Command exited with status {status} after {int((time.time() - start) * 1000)} ms")
+        return status
+
+    def handle(self, conn, addr):
+        """
+        Serve one control request.
+
+        Args:
+            conn: The accepted socket
+            addr: The peer address
+        """
+        with conn:
+            try:
+                request = read_line(conn)
+            except OSError:
+                return
+            if request is None:
+                return
+            verb, _, command = request.partition(" ")
+            self.last_activity = time.time()
+            try:
+                if verb == "PING":
+                    conn.sendall(b"PONG\n")
+                elif verb == "RUN" and command:
+                    with self.run_lock:
+                        status = self.run(command, conn)
+                        self.commands += 1
+                        if status != 0:
+                            self.failures += 1
+                        self.last_activity = time.time()
+                    conn.sendall(f"EXIT {status}\n".encode())
+                elif verb == "SHUTDOWN":
+                    with self.run_lock:
+                        conn.sendall(b"BYE\n")
+                        self.stopping.set()
+                else:
+                    conn.sendall(b"ERROR unknown request\n")
+            except OSError as e:
+                logger.warning(f"Lost control connection from {addr[0]}: {e}")
+
+    def serve(self):
+        """
+        Accept control requests until SHUTDOWN, SIGTERM or the idle timeout.
+
+        Returns:
+            0 if every dispatched command succeeded, 1 otherwise
+        """
+        listener = socket.create_server(("127.0.0.1", self.port))
+        listener.settimeout(1)
+        logger.info(f"Warm pool ready on 127.0.0.1:{self.port} (idle timeout {self.idle_timeout}s)")
+        while not self.stopping.is_set():
+            if self.idle_timeout > 0 and not self.run_lock.locked() \
+                    and time.time() - self.last_activity > self.idle_timeout:
+                logger.warning(f"No commands for {self.idle_timeout}s, shutting the pool down")
+                break
+            try:
+                conn, addr = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self.handle, args=(conn, addr), daemon=True).start()
+        listener.close()
+        logger.info(f"Warm pool stopping after {self.commands} commands ({self.failures} failed)")
+        # A failed stage fails the job set, so it is not recorded as succeeded and not staged out
+        return 1 if self.failures else 0
+
+
+def connect(host, port, timeout):
+    """
+    Connect to the warm pool, retrying until it is listening.
+
+    Args:
+        host: The control address
+        port: The control port
+        timeout: Seconds to keep retrying
+
+    Returns:
+        The connected socket, or None if the pool never came up
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port), timeout=10)
+        except OSError:
+            if time.time() >= deadline:
+                return None
+            time.sleep(2)
+
+
+def wait_ready(host, port, timeout):
+    """
+    Wait until the pool has finished bootstrapping and answers PING.
+
+    Args:
+        host: The control address
+        port: The control port
+        timeout: Seconds to wait
+
+    Returns:
+        True if the pool is ready, False otherwise
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        sock = connect(host, port, max(0, deadline - time.time()))
+        if sock is None:
+            break
+        try:
+            with sock:
+                sock.sendall(b"PING\n")
+                if read_line(sock) == "PONG":
+                    return True
+        except OSError:
+            pass
+        time.sleep(2)
+    return False
+
+
+def dispatch(host, port, command, timeout):
+    """
+    Run a command on the warm pool and stream its output.
+
+    Args:
+        host: The control address
+        port: The control port
+        command: The shell command to run on rank 0
+        timeout: Seconds to wait for the pool to be ready
+
+    Returns:
+        The command's exit code, or 1 if the pool could not be reached
+    """
+    if not wait_ready(host, port, timeout):
+        logger.error(f"Warm pool at {host}:{port} not ready within {timeout}s")
+        return 1
+    start = time.time()
+    sock = connect(host, port, timeout)
+    if sock is None:
+        logger.error(f"Could not reach warm pool at {host}:{port}")
+        return 1
+    with sock:
+        # Commands can run for hours; only the connect is bounded
+        sock.settimeout(None)
+        sock.sendall(f"RUN {command}\n".encode())
+        while True:
+            line = read_line(sock)
+            if line is None:
+                logger.error("Warm pool closed the connection before the command finished")
+                return 1
+            if line.startswith("OUT "):
+                print(line[4:], flush=True)
+            elif line.startswith("EXIT "):
+                status = int(line[5:])
+                logger.info(f"'{command}' exited with status {status} in {int((time.time() - start) * 1000)} ms")
+                return status
+            else:
+                logger.error(f"Unexpected reply from warm pool: {line}")
+                return 1
+
+
+def shutdown(host, port, timeout):
+    """
+    Ask the warm pool to finish, releasing all of its pods.
+
+    Args:
+        host: The control address
+        port: The control port
+        timeout: Seconds to wait for the pool
+
+    Returns:
+        0 if the pool acknowledged, 1 otherwise
+    """
+    sock = connect(host, port, timeout)
+    if sock is None:
+        logger.error(f"Could not reach warm pool at {host}:{port}")
+        return 1
+    with sock:
+        sock.settimeout(None)
+        sock.sendall(b"SHUTDOWN\n")
+        if read_line(sock) != "BYE":
+            logger.error("Warm pool did not acknowledge shutdown")
+            return 1
+    logger.info("Warm pool shutting down")
+    return 0
+
+
+def parse_arguments():
+    """Parse command line arguments and combine with environment variables."""
+    parser = argparse.ArgumentParser(description='Warm MPI pod pool control channel')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the control server on rank 0')
+    serve_parser.add_argument('--port', type=int, default=int(os.environ.get("MPI_CONTROL_PORT", "29501")),
+                              help='Loopback port to listen on (default: 29501)')
+    serve_parser.add_argument('--idle-timeout', dest='idle_timeout', type=int,
+                              default=int(os.environ.get("WARM_POOL_IDLE_TIMEOUT", "1800")),
+                              help='Seconds without commands before the pool shuts down, 0 to disable (default: 1800)')
+    for name, help_text in [('dispatch', 'Run a command on the warm pool'),
+                            ('shutdown', 'Shut the warm pool down')]:
+        client_parser = subparsers.add_parser(name, help=help_text)
+        client_parser.add_argument('--host', default=os.environ.get("WARM_POOL_HOST", "localhost"),
+                                   help='Control address (default: localhost)')
+        client_parser.add_argument('--port', type=int, default=int(os.environ.get("MPI_CONTROL_PORT", "29501")),
+                                   help='Control port (default: 29501)')
+        client_parser.add_argument('--timeout', type=int, default=600,
+                                   help='Seconds to wait for the pool (default: 600)')
+        if name == 'dispatch':
+            client_parser.add_argument('task', help='Shell command to run on rank 0')
+    return parser.parse_args()
+
+
+def main():
+    """Run the control server or a client request."""
+    args = parse_arguments()
+    if args.command == 'serve':
+        server = ControlServer(args.port, args.idle_timeout)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stopping.set())
+        return server.serve()
+    if args.command == 'dispatch':
+        return dispatch(args.host, args.port, args.task, args.timeout)
+    return shutdown(args.host, args.port, args.timeout)
+
+
+if __name__ == "__main__":
+    sys.exit(main())